@@ -8,11 +8,15 @@ from collections import defaultdict
 
 
 @frappe.whitelist(allow_guest=False)
-def run_laser_optimization(data):
+def run_laser_optimization(data, background=0, preview=0):
     """
     Run laser cutting optimization from portal
     
     Args:
+        background: 1 = queue on the long queue and return a job key at once;
+            progress and the result arrive as realtime events
+        preview: 1 = instant best-fit decreasing estimate (no CP-SAT); the
+            full optimization is a separate call
         data: JSON string with:
             - steel_profile: Steel profile name
             - stock_length: Stock length in mm
@@ -24,6 +28,10 @@ def run_laser_optimization(data):
     Returns:
         Optimization result with HTML display
     """
+    if cint(background):
+        from cat_sat.services.optimization_job_service import enqueue_portal_optimization
+        return enqueue_portal_optimization("cat_sat.api.portal_api.run_laser_optimization", data)
+    
     try:
         payload = json.loads(data)
         
@@ -56,21 +64,35 @@ def run_laser_optimization(data):
         piece_lengths = sorted(item_map.keys(), reverse=True)
         demands = [item_map[l] for l in piece_lengths]
         
+        if cint(preview):
+            return run_preview(piece_lengths, demands, piece_names, stock_length, blade_width, trim_cut, False)
+        
         # Import optimization service
         from cat_sat.services.cutting_optimization_service import (
             solve_laser_cutting_stock,
-            generate_result_html
+            generate_result_html,
+            get_solver_params,
+            get_bar_lower_bound,
+            build_run_report,
+            normalize_stocks
         )
         
+        solver_params = get_solver_params()["laser"]
+        stats = {}
+        
         # Run optimization
+        # Portal segments are keyed by length only
         sol = solve_laser_cutting_stock(
             piece_lengths,
             demands,
+            piece_lengths,
             piece_names,
             stock_length,
             blade_width,
             trim_cut,
-            max_surplus
+            max_surplus,
+            solver_params=solver_params,
+            stats=stats
         )
         
         # Generate HTML result
@@ -82,7 +104,11 @@ def run_laser_optimization(data):
             "success": True,
             "patterns": sol,
             "result_html": result_html,
-            "total_bars": sum(p.get('qty', 0) for p in sol)
+            "total_bars": sum(p.get('qty', 0) for p in sol),
+            "solver_params": solver_params,
+            "report": build_run_report(sol, get_bar_lower_bound(
+                piece_lengths, demands, blade_width, trim_cut, normalize_stocks(stock_length)
+            ), stats)
         }
         
     except Exception as e:
@@ -91,10 +117,19 @@ def run_laser_optimization(data):
 
 
 @frappe.whitelist(allow_guest=False)
-def run_mctd_optimization(data):
+def run_mctd_optimization(data, background=0, preview=0):
     """
     Run MCTĐ (bundle) cutting optimization from portal
+    
+    Args:
+        background: 1 = queue on the long queue (see run_laser_optimization)
+        preview: 1 = instant estimate in single bars, without bundling
+            (see run_laser_optimization)
     """
+    if cint(background):
+        from cat_sat.services.optimization_job_service import enqueue_portal_optimization
+        return enqueue_portal_optimization("cat_sat.api.portal_api.run_mctd_optimization", data)
+    
     try:
         payload = json.loads(data)
         
@@ -143,23 +178,37 @@ def run_mctd_optimization(data):
         piece_lengths = sorted(item_map.keys(), reverse=True)
         demands = [item_map[l] for l in piece_lengths]
         
+        if cint(preview):
+            return run_preview(piece_lengths, demands, piece_names, stock_length, blade_width, trim_cut, True)
+        
         # Import optimization service
         from cat_sat.services.cutting_optimization_service import (
             solve_bundled_cutting_stock,
-            generate_result_html
+            generate_result_html,
+            get_solver_params,
+            get_bar_lower_bound,
+            build_run_report,
+            normalize_stocks
         )
         
+        solver_params = get_solver_params()["bundled"]
+        stats = {}
+        
         # Run optimization
+        # Portal segments are keyed by length only
         sol = solve_bundled_cutting_stock(
             piece_lengths,
             demands,
+            piece_lengths,
             piece_names,
             stock_length,
             blade_width,
             trim_cut,
             factors,
             manual_cut_limit,
-            max_surplus
+            max_surplus,
+            solver_params=solver_params,
+            stats=stats
         )
         
         # Generate HTML result
@@ -171,7 +220,11 @@ def run_mctd_optimization(data):
             "success": True,
             "patterns": sol,
             "result_html": result_html,
-            "total_bars": sum(p.get('qty', 0) for p in sol)
+            "total_bars": sum(p.get('qty', 0) for p in sol),
+            "solver_params": solver_params,
+            "report": build_run_report(sol, get_bar_lower_bound(
+                piece_lengths, demands, blade_width, trim_cut, normalize_stocks(stock_length)
+            ), stats)
         }
         
     except Exception as e:
@@ -179,6 +232,34 @@ def run_mctd_optimization(data):
         return {"success": False, "error": str(e)}
 
 
+def run_preview(piece_lengths, demands, piece_names, stock_length, blade_width, trim_cut, is_bundling):
+    """Best-fit decreasing estimate for the portal pages, same response shape as a full run"""
+    import time
+    from cat_sat.services.cutting_heuristic_service import preview_cutting_plan
+    from cat_sat.services.cutting_optimization_service import generate_result_html
+    
+    start = time.perf_counter()
+    sol = preview_cutting_plan(piece_lengths, demands, piece_lengths, stock_length, blade_width, trim_cut)
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    
+    result_html = (
+        "<p><i>Ước tính nhanh (Best-Fit Decreasing), chưa tối ưu"
+        + (", chưa chia bó" if is_bundling else "")
+        + ". Bấm Tối ưu hóa để có phương án tối ưu.</i></p>"
+        + generate_result_html(sol, piece_lengths, piece_names, demands, stock_length, is_bundling=is_bundling)
+    )
+    
+    return {
+        "success": True,
+        "preview": True,
+        "patterns": sol,
+        "result_html": result_html,
+        "total_bars": sum(p['qty'] for p in sol),
+        "total_waste": sum(p['waste'] * p['qty'] for p in sol),
+        "elapsed_ms": elapsed_ms
+    }
+
+
 @frappe.whitelist(allow_guest=False)
 def get_steel_profiles():
     """Get all steel profiles for dropdown"""
@@ -445,30 +445,92 @@ function register_action_formatter() {
     };
 }
 
+// Stage labels for realtime optimization progress
+const CATSAT_OPTIMIZATION_STAGES = {
+    laser_patterns: __("Laser: tạo pattern"),
+    laser_overshoot: __("Laser: giảm tồn kho vượt giới hạn"),
+    laser_waste: __("Laser: tối ưu hao hụt"),
+    laser_surplus: __("Laser: tối ưu tồn kho"),
+    laser_setups: __("Laser: giảm số pattern"),
+    laser_clusters: __("Laser: giải song song các nhóm"),
+    laser_repair: __("Laser: cắt lại các cây hao hụt cao"),
+    mctd_patterns: __("MCTĐ: tạo pattern"),
+    mctd: __("MCTĐ: tối ưu bó"),
+    mctd_surplus: __("MCTĐ: tối ưu tồn kho"),
+    mctd_setups: __("MCTĐ: giảm số pattern"),
+    saving: __("Đang lưu kết quả")
+};
+
+function format_optimization_progress(data) {
+    let parts = [CATSAT_OPTIMIZATION_STAGES[data.stage] || data.stage];
+    if (data.retry) parts.push(__("lần thử {0}", [data.retry + 1]));
+    if (data.patterns) parts.push(__("{0} pattern", [data.patterns]));
+    if (data.total) parts.push(__("{0}/{1} nhóm", [data.finished || 0, data.total]));
+    if (data.objective !== undefined && data.objective !== null) {
+        parts.push(__("mục tiêu {0}", [format_number(data.objective, null, 1)]));
+    }
+    if (data.bound !== undefined && data.bound !== null) {
+        parts.push(__("cận {0}", [format_number(data.bound, null, 1)]));
+    }
+    if (data.elapsed) parts.push(`${data.elapsed}s`);
+    if (data.message) parts.push(data.message);
+    return parts.join(" · ");
+}
+
+// Listen for progress/done events of this order's background job
+function listen_optimization_events(frm) {
+    const order_name = frm.doc.name;
+
+    frappe.realtime.off("cutting_optimization_progress");
+    frappe.realtime.off("cutting_optimization_done");
+
+    frappe.realtime.on("cutting_optimization_progress", (data) => {
+        if (data.key !== order_name || frm.doc.name !== order_name) return;
+        frm.dashboard.set_headline(
+            `<span class="indicator orange">${__("Đang tối ưu")}: ${format_optimization_progress(data)}</span>`
+        );
+    });
+
+    frappe.realtime.on("cutting_optimization_done", (data) => {
+        if (data.key !== order_name) return;
+        frappe.realtime.off("cutting_optimization_progress");
+        frappe.realtime.off("cutting_optimization_done");
+        frm.dashboard.clear_headline();
+
+        if (!data.success) {
+            frappe.msgprint({ title: __("Lỗi tối ưu"), message: data.error, indicator: "red" });
+            return;
+        }
+        if (data.result && data.result.error) {
+            show_optimization_error_dialog(frm, data.result);
+            return;
+        }
+        frm.reload_doc();
+        const warnings = (data.result && data.result.warnings) || [];
+        frappe.show_alert({
+            message: [(data.result && data.result.message) || __("Tối ưu hoàn tất!"), ...warnings].join("<br>"),
+            indicator: warnings.length ? "orange" : "green"
+        });
+    });
+}
+
 // Run optimization with error handling and retry dialog
 function run_optimization_with_retry(frm, custom_params = {}) {
-    // Helper function to actually run optimization
+    // Queue the optimization on the server; progress and result arrive via realtime
     function execute_optimization() {
+        listen_optimization_events(frm);
         frappe.call({
-            method: "cat_sat.services.cutting_optimization_service.run_optimization",
+            method: "cat_sat.services.optimization_job_service.enqueue_optimization",
             args: { order_name: frm.doc.name },
-            freeze: true,
-            freeze_message: __("Đang chạy thuật toán tối ưu..."),
             callback(r) {
-                if (r.exc) return;
-
-                // Check if returned error info
-                if (r.message && r.message.error) {
-                    show_optimization_error_dialog(frm, r.message);
-                } else {
-                    frm.reload_doc();
-                    // Use message from server if available
-                    let success_msg = (r.message && r.message.message) || __("Tối ưu hoàn tất!");
-                    frappe.show_alert({
-                        message: success_msg,
-                        indicator: "green"
-                    });
+                if (r.exc) {
+                    frappe.realtime.off("cutting_optimization_progress");
+                    frappe.realtime.off("cutting_optimization_done");
+                    return;
                 }
+                frm.dashboard.set_headline(
+                    `<span class="indicator orange">${__("Đã đưa vào hàng đợi tối ưu...")}</span>`
+                );
             }
         });
     }
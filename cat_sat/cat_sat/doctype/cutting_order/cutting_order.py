@@ -60,6 +60,7 @@ class CuttingOrder(Document):
 					"cut_qty": row.cut_qty or 0,
 					"waste": row.waste,
 					"used_length": row.used_length,
+					"stock_length": row.stock_length or self.stock_length,
 					"counts": counts,
 					"stt": row.idx,
 				}
@@ -84,6 +85,7 @@ class CuttingOrder(Document):
 				"stt": idx + 1,
 				"qty": p["qty"],
 				"waste": p["waste"],
+				"stock_length": p["stock_length"],
 				"cells": [],  # List of counts corresponding to sorted_lengths
 			}
 			for l in sorted_lengths:
@@ -97,7 +99,7 @@ class CuttingOrder(Document):
 		total_waste_length = sum(r.waste * r.qty for r in self.optimization_result)
 
 		# Calculate waste percentage
-		total_meter_input = total_stock * self.stock_length / 1000.0
+		total_meter_input = sum(r.qty * (r.stock_length or self.stock_length) for r in self.optimization_result) / 1000.0
 		waste_percent = 0
 		if total_meter_input > 0:
 			waste_percent = (total_waste_length / 1000.0) / total_meter_input * 100
@@ -237,7 +239,7 @@ class CuttingOrder(Document):
 			log.cutting_plan = self.cutting_plan
 			log.pattern_idx = row.idx
 			log.steel_profile = self.steel_profile
-			log.stock_length = self.stock_length
+			log.stock_length = row.stock_length or self.stock_length
 			log.pattern = row.pattern
 			log.start_time = now
 			log.status = "Running"
@@ -314,6 +316,10 @@ class CuttingOrder(Document):
 					log_updates["issue_note"] = issue_note
 					
 				frappe.db.set_value("Cutting Production Log", running_log, log_updates)
+
+			# Book the offcuts of the bars just cut (and take out remnants used as stock)
+			from cat_sat.services.remnant_service import record_pattern_remnants
+			record_pattern_remnants(self, row, qty_to_add)
 			
 			frappe.db.commit()
 
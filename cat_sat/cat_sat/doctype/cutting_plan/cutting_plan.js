@@ -23,9 +23,79 @@ frappe.ui.form.on("Cutting Plan", {
 				});
 			});
 		}
+
+		if (!frm.is_new()) {
+			frm.add_custom_button("Tối ưu tất cả Lệnh cắt", () => {
+				optimize_all_orders(frm);
+			});
+		}
 	}
 });
 
+// Queue one optimization job per Cutting Order and follow the batch via realtime
+function optimize_all_orders(frm) {
+	frappe.call({
+		method: "cat_sat.services.optimization_job_service.enqueue_plan_optimization",
+		args: { plan_name: frm.doc.name },
+		callback(r) {
+			if (r.exc || !r.message) return;
+			const batch_id = r.message.batch_id;
+			const total = r.message.orders.length;
+
+			frm.dashboard.set_headline(
+				`<span class="indicator orange">Đang tối ưu 0/${total} Lệnh cắt...</span>`
+			);
+
+			frappe.realtime.off("cutting_plan_optimization_progress");
+			frappe.realtime.off("cutting_plan_optimization_done");
+
+			frappe.realtime.on("cutting_plan_optimization_progress", (data) => {
+				if (data.batch_id !== batch_id) return;
+				frm.dashboard.set_headline(
+					`<span class="indicator orange">Đang tối ưu ${data.finished}/${data.total} Lệnh cắt (vừa xong ${data.order})...</span>`
+				);
+			});
+
+			frappe.realtime.on("cutting_plan_optimization_done", (data) => {
+				if (data.batch_id !== batch_id) return;
+				frappe.realtime.off("cutting_plan_optimization_progress");
+				frappe.realtime.off("cutting_plan_optimization_done");
+				frm.dashboard.clear_headline();
+				show_plan_optimization_summary(data);
+				frm.reload_doc();
+			});
+		}
+	});
+}
+
+function show_plan_optimization_summary(data) {
+	let rows = "";
+	for (const [order, res] of Object.entries(data.results)) {
+		const status = res.success
+			? `✅ ${res.patterns} pattern, ${res.bars} cây`
+			: `❌ ${frappe.utils.escape_html(res.error || "")}`;
+		rows += `<tr>
+			<td><a href="/app/cutting-order/${order}">${order}</a></td>
+			<td>${status}</td>
+			<td>${res.elapsed}s</td>
+		</tr>`;
+	}
+
+	frappe.msgprint({
+		title: "Kết quả tối ưu kế hoạch",
+		message: `
+			<p>Thời gian thực: <strong>${data.wall_time}s</strong>
+			— tổng thời gian các lệnh: <strong>${data.sum_time}s</strong></p>
+			${data.remnant_kg ? `<p>Sắt tồn được dùng lại: <strong>${data.remnant_kg} kg</strong></p>` : ""}
+			<table class="table table-sm table-bordered">
+				<thead><tr><th>Lệnh cắt</th><th>Kết quả</th><th>Thời gian</th></tr></thead>
+				<tbody>${rows}</tbody>
+			</table>
+		`,
+		wide: true
+	});
+}
+
 // Handle Product Bundle selection in Cutting Plan Item child table
 frappe.ui.form.on("Cutting Plan Item", {
 	product_bundle(frm, cdt, cdn) {
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, IEA and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Steel Remnant", {
+// 	refresh(frm) {
+
+// 	},
+// });
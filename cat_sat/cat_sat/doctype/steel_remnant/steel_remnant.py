@@ -0,0 +1,14 @@
+# Copyright (c) 2026, IEA and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint, flt
+
+
+class SteelRemnant(Document):
+	def validate(self):
+		if cint(self.length_mm) <= 0:
+			frappe.throw("Chiều dài đoạn sắt tồn phải lớn hơn 0")
+		weight_per_meter = flt(frappe.db.get_value("Steel Profile", self.steel_profile, "weight_per_meter"))
+		self.weight_kg = flt(cint(self.qty) * cint(self.length_mm) / 1000.0 * weight_per_meter, 3)
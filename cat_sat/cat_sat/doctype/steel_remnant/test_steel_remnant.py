@@ -0,0 +1,91 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.remnant_service import (
+	REMNANT_PRIORITY,
+	adjust_remnant,
+	get_remnant_stocks,
+	record_pattern_remnants,
+)
+
+TEST_PROFILE = "_Test V30"
+
+
+def _make_order(optimization_result=None):
+	if not frappe.db.exists("Steel Profile", TEST_PROFILE):
+		frappe.get_doc(
+			{"doctype": "Steel Profile", "profile_code": TEST_PROFILE, "shape": "V", "dimension": "30x30"}
+		).insert(ignore_permissions=True)
+
+	return frappe.get_doc(
+		{
+			"doctype": "Cutting Order",
+			"steel_profile": TEST_PROFILE,
+			"stock_length": 6000,
+			"trim_cut": 10,
+			"items": [{"segment_name": "Chân", "length_mm": 1850, "qty": 3}],
+			"optimization_result": optimization_result or [],
+		}
+	).insert(ignore_permissions=True)
+
+
+def _remnant_qty(length_mm):
+	return frappe.db.get_value("Steel Remnant", {"steel_profile": TEST_PROFILE, "length_mm": length_mm}, "qty")
+
+
+class TestSteelRemnant(FrappeTestCase):
+	def setUp(self):
+		frappe.db.delete("Steel Remnant", {"steel_profile": TEST_PROFILE})
+		frappe.db.set_single_value("Cutting Settings", "remnant_min_length", 300)
+
+	def test_record_offcuts(self):
+		order = _make_order()
+		# 456mm waste - 10mm trim, floored to 440mm
+		record_pattern_remnants(order, frappe._dict(waste=456, steel_remnant=None), 2)
+		self.assertEqual(_remnant_qty(440), 2)
+
+		# Offcuts under remnant_min_length are scrap
+		record_pattern_remnants(order, frappe._dict(waste=250, steel_remnant=None), 2)
+		self.assertFalse(frappe.db.exists("Steel Remnant", {"steel_profile": TEST_PROFILE, "length_mm": 240}))
+
+	def test_record_takes_out_remnant(self):
+		order = _make_order()
+		remnant = adjust_remnant(TEST_PROFILE, 2000, 3)
+
+		record_pattern_remnants(order, frappe._dict(waste=100, steel_remnant=remnant), 2)
+		self.assertEqual(_remnant_qty(2000), 1)
+		self.assertEqual(frappe.db.get_value("Steel Remnant", remnant, "last_cutting_order"), order.name)
+
+		# Never below zero, even if more bars were cut than the store holds
+		record_pattern_remnants(order, frappe._dict(waste=100, steel_remnant=remnant), 4)
+		self.assertEqual(_remnant_qty(2000), 0)
+
+	def test_stocks_net_of_reservations(self):
+		long_remnant = adjust_remnant(TEST_PROFILE, 2500, 4)
+		short_remnant = adjust_remnant(TEST_PROFILE, 1200, 2)
+
+		stocks = get_remnant_stocks(TEST_PROFILE)
+		self.assertEqual([s["remnant"] for s in stocks], [long_remnant, short_remnant])
+		self.assertEqual([s["max_qty"] for s in stocks], [4, 2])
+		self.assertTrue(all(s["priority"] == REMNANT_PRIORITY for s in stocks))
+
+		# An open order planned 3 bars of the long remnant and cut 1 of them
+		order = _make_order(
+			[
+				{"pattern": "1x1850", "qty": 3, "cut_qty": 1, "steel_remnant": long_remnant},
+				{"pattern": "1x1200", "qty": 2, "steel_remnant": short_remnant},
+			]
+		)
+		stocks = get_remnant_stocks(TEST_PROFILE)
+		self.assertEqual([(s["remnant"], s["max_qty"]) for s in stocks], [(long_remnant, 2)])
+
+		# The order being optimized does not reserve against itself
+		stocks = get_remnant_stocks(TEST_PROFILE, exclude_order=order.name)
+		self.assertEqual([s["max_qty"] for s in stocks], [4, 2])
+
+		# Completed orders hold nothing
+		frappe.db.set_value("Cutting Order", order.name, "status", "Completed")
+		self.assertEqual([s["max_qty"] for s in get_remnant_stocks(TEST_PROFILE)], [4, 2])
@@ -78,10 +78,10 @@ cat_sat_mctd = {
         }
     },
 
-    run_optimization: function () {
+    get_payload: function () {
         if (!this.hot) {
             frappe.msgprint('Bảng nhập liệu chưa sẵn sàng');
-            return;
+            return null;
         }
 
         const tableData = this.hot.getData();
@@ -100,10 +100,10 @@ cat_sat_mctd = {
 
         if (items.length === 0) {
             frappe.msgprint('Vui lòng nhập ít nhất 1 đoạn sắt!');
-            return;
+            return null;
         }
 
-        const payload = {
+        return {
             steel_profile: document.getElementById('steel_profile').value,
             stock_length: parseFloat(document.getElementById('stock_length').value),
             trim_cut: 0,
@@ -112,30 +112,103 @@ cat_sat_mctd = {
             max_surplus: parseInt(document.getElementById('max_surplus').value),
             items: items
         };
+    },
+
+    run_preview: function () {
+        const payload = this.get_payload();
+        if (!payload) return;
+
+        // Best-fit decreasing estimate, returns at once; the full solve is TỐI ƯU HÓA
+        frappe.call({
+            method: 'cat_sat.api.portal_api.run_mctd_optimization',
+            args: { data: JSON.stringify(payload), preview: 1 },
+            callback: function (r) {
+                const result = r.message || {};
+                if (result.success) {
+                    document.getElementById('result_container').style.display = 'block';
+                    document.getElementById('result_summary').innerHTML =
+                        `<p><b>Ước tính:</b> ${result.total_bars} cây, hao hụt ${(result.total_waste / 1000).toFixed(2)}m`
+                        + ` (${result.elapsed_ms} ms)</p>` + (result.result_html || '');
+                } else {
+                    frappe.msgprint('Lỗi: ' + (result.error || 'Unknown error'));
+                }
+            }
+        });
+    },
+
+    run_optimization: function () {
+        const payload = this.get_payload();
+        if (!payload) return;
 
         document.getElementById('btn_optimize').disabled = true;
         document.getElementById('btn_optimize').innerHTML = '⏳ Đang tính...';
 
+        const reset_button = function () {
+            document.getElementById('btn_optimize').disabled = false;
+            document.getElementById('btn_optimize').innerHTML = '⚡ TỐI ƯU HÓA';
+        };
+
+        // Runs on the long queue; progress and the result arrive via realtime
         frappe.call({
             method: 'cat_sat.api.portal_api.run_mctd_optimization',
-            args: { data: JSON.stringify(payload) },
+            args: { data: JSON.stringify(payload), background: 1 },
             callback: function (r) {
-                document.getElementById('btn_optimize').disabled = false;
-                document.getElementById('btn_optimize').innerHTML = '⚡ TỐI ƯU HÓA';
-
-                if (r.message && r.message.success) {
-                    document.getElementById('result_container').style.display = 'block';
-                    document.getElementById('result_summary').innerHTML = r.message.result_html || '';
-                    document.getElementById('result_container').scrollIntoView({ behavior: 'smooth' });
+                if (r.message && r.message.queued) {
+                    cat_sat_mctd.listen(r.message.key, reset_button);
                 } else {
+                    reset_button();
                     frappe.msgprint('Lỗi: ' + (r.message?.error || 'Unknown error'));
                 }
             },
             error: function (e) {
-                document.getElementById('btn_optimize').disabled = false;
-                document.getElementById('btn_optimize').innerHTML = '⚡ TỐI ƯU HÓA';
+                reset_button();
                 frappe.msgprint('Lỗi kết nối: ' + e.message);
             }
         });
+    },
+
+    format_report: function (report) {
+        if (!report) return '';
+        // Continuous lower bound vs. achieved bars; solver gap tells if more time could help
+        let text = `<p><b>Cận dưới:</b> ${report.lower_bound_bars} cây · <b>Đạt:</b> ${report.bars} cây`
+            + ` · <b>Gap:</b> ${report.gap_pct}%`;
+        if (report.solver_status) text += ` · <b>Bộ giải:</b> ${report.solver_status}`;
+        if (report.solver_bound !== null && report.solver_bound !== undefined) {
+            text += ` (hao hụt ${report.solver_objective}mm, cận ${report.solver_bound}mm, gap ${report.solver_gap_pct}%)`;
+        }
+        return text + '</p>';
+    },
+
+    listen: function (key, reset_button) {
+        frappe.realtime.off('cutting_optimization_progress');
+        frappe.realtime.off('cutting_optimization_done');
+
+        frappe.realtime.on('cutting_optimization_progress', function (data) {
+            if (data.key !== key) return;
+            let text = '⏳ ' + (data.retry ? `Lần thử ${data.retry + 1} · ` : '');
+            if (data.patterns) text += `${data.patterns} pattern`;
+            if (data.objective !== undefined && data.objective !== null) {
+                text += `Mục tiêu ${data.objective.toFixed(1)} (cận ${(data.bound || 0).toFixed(1)})`;
+            }
+            if (data.elapsed) text += ` · ${data.elapsed}s`;
+            document.getElementById('btn_optimize').innerHTML = text;
+        });
+
+        frappe.realtime.on('cutting_optimization_done', function (data) {
+            if (data.key !== key) return;
+            frappe.realtime.off('cutting_optimization_progress');
+            frappe.realtime.off('cutting_optimization_done');
+            reset_button();
+
+            const result = data.result || {};
+            if (data.success && result.success) {
+                document.getElementById('result_container').style.display = 'block';
+                document.getElementById('result_summary').innerHTML =
+                    cat_sat_mctd.format_report(result.report) + (result.result_html || '');
+                document.getElementById('result_container').scrollIntoView({ behavior: 'smooth' });
+            } else {
+                frappe.msgprint('Lỗi: ' + (data.error || result.error || 'Unknown error'));
+            }
+        });
     }
 };
@@ -0,0 +1,61 @@
+"""
+Bench commands for cat_sat
+
+    bench --site <site> cat-sat-pattern-cache           # cache size and hit rate
+    bench --site <site> cat-sat-pattern-cache --prune   # evict to the configured limits
+"""
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("cat-sat-pattern-cache")
+@click.option("--prune", is_flag=True, default=False, help="Evict old entries down to the size limit")
+@click.option("--max-size-mb", type=int, default=None, help="Override the size limit from Cutting Settings")
+@click.option("--max-age-days", type=int, default=None, help="Override the age limit from Cutting Settings")
+@click.option("--limit", type=int, default=10, help="Number of largest entries to list")
+@pass_context
+def pattern_cache(context, prune=False, max_size_mb=None, max_age_days=None, limit=10):
+    """Show pattern cache statistics and optionally prune it"""
+    import frappe
+
+    from cat_sat.services.pattern_cache_service import get_pattern_cache_stats, prune_pattern_cache
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        if prune:
+            result = prune_pattern_cache(max_size_mb=max_size_mb, max_age_days=max_age_days)
+            click.echo(
+                f"Removed {result['removed']} files ({result['freed_mb']} MB), "
+                f"{result['size_mb']} MB remaining"
+            )
+
+        stats = get_pattern_cache_stats(limit=limit)
+        counters = stats["counters"]
+        click.echo(f"Folder:   {stats['folder']}")
+        click.echo(f"Entries:  {stats['entries']} ({stats['size_mb']} MB)")
+        if stats["legacy_files"]:
+            click.echo(f"Legacy:   {stats['legacy_files']} .pkl files (removed by --prune)")
+        click.echo(
+            f"Lookups:  {counters['hit']} hits, {counters['superset']} superset hits, "
+            f"{counters['miss']} misses (hit rate {stats['hit_rate']}%)"
+        )
+        click.echo(
+            f"Warm:     {counters['hit_memory']} from process memory, "
+            f"{counters['hit_redis']} from Redis"
+        )
+        if stats["largest"]:
+            click.echo("Largest entries:")
+            for entry in stats["largest"]:
+                click.echo(
+                    f"  {entry['size_mb']:>8} MB  {entry['patterns']:>7} patterns  "
+                    f"{entry['lengths']:>3} lengths  stock {entry['stock_length']}  "
+                    f"last used {entry['last_access']}  {entry['file']}"
+                )
+    finally:
+        frappe.destroy()
+
+
+commands = [pattern_cache]
@@ -174,6 +174,12 @@ doc_events = {"Item": {"validate": "cat_sat.naming.set_variant_name"}}
 # 	],
 # }
 
+scheduler_events = {
+    "daily": [
+        "cat_sat.services.pattern_cache_service.prune_pattern_cache",
+    ],
+}
+
 # Testing
 # -------
 
@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	# Dominance pruning can force surplus; it is opt-in now, duplicates are always dropped
+	frappe.db.set_single_value("Cutting Settings", "prune_dominated_patterns", 0)
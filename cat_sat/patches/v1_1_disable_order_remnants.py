@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	# Existing orders were optimized without remnants; they opt in per order
+	frappe.db.sql("UPDATE `tabCutting Order` SET use_remnants = 0")
@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	# The pattern-count stage is opt-in: a time limit above 0 turns it on
+	frappe.db.set_single_value("Cutting Settings", "stage_setup_time_limit", 0)
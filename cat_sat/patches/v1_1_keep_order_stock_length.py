@@ -0,0 +1,7 @@
+import frappe
+
+
+def execute():
+	# Existing orders keep the stock length they were created with instead of
+	# switching to all stock items of their steel profile
+	frappe.db.sql("UPDATE `tabCutting Order` SET use_profile_stocks = 0")
@@ -0,0 +1,239 @@
+"""
+Column Generation Service for Laser Cutting Stock
+Gilmore-Gomory delayed column generation
+
+Instead of enumerating every feasible pattern (Phase 1) this builds a small
+pattern pool on demand:
+1. Solve the LP relaxation (min bars) over the current pool with GLOP
+2. Price a new pattern with a bounded knapsack over the LP duals
+3. Repeat until no pattern has negative reduced cost
+
+The pool is returned in the same (obj_value, counts) format as
+find_efficient_cutting_patterns so Phase 2 runs unchanged on top of it.
+"""
+
+import math
+
+import frappe
+
+from cat_sat.services.cutting_optimization_service import SCALING_FACTOR
+
+try:
+    import numpy as np
+    from ortools.linear_solver import pywraplp
+except ImportError:
+    np = None
+    pywraplp = None
+
+# Stop pricing after this many LP iterations even if not converged
+CG_MAX_ITERATIONS = 300
+
+# A priced pattern must beat the LP bar cost by more than this to enter the pool
+CG_REDUCED_COST_EPS = 1e-6
+
+
+def solve_master_lp(columns, demands):
+    """
+    Solve the restricted master LP: min sum(x) s.t. sum(a_ij * x_j) >= d_i
+
+    Args:
+        columns: List of count vectors (one per pattern)
+        demands: List of quantities needed for each segment
+
+    Returns:
+        (objective, x_values, duals) or None if the LP has no optimal solution
+    """
+    solver = pywraplp.Solver.CreateSolver("GLOP")
+    x = [solver.NumVar(0, solver.infinity(), f"x_{j}") for j in range(len(columns))]
+
+    rows = []
+    for i, demand in enumerate(demands):
+        row = solver.Constraint(demand, solver.infinity(), f"demand_{i}")
+        for j, col in enumerate(columns):
+            if col[i]:
+                row.SetCoefficient(x[j], col[i])
+        rows.append(row)
+
+    objective = solver.Objective()
+    for var in x:
+        objective.SetCoefficient(var, 1)
+    objective.SetMinimization()
+
+    if solver.Solve() != pywraplp.Solver.OPTIMAL:
+        return None
+
+    return (
+        objective.Value(),
+        [var.solution_value() for var in x],
+        [row.dual_value() for row in rows],
+    )
+
+
+def is_surplus_bound_lp_feasible(rows, num_patterns, demands, max_surplus):
+    """
+    LP relaxation check: can demand be met with at most max_surplus extra per segment?
+
+    d_i <= sum(a_ij * x_j) <= d_i + max_surplus, x_j >= 0 (continuous).
+    An infeasible LP proves the integer model infeasible too, so the Phase 2
+    surplus bound can be raised before any CP-SAT run.
+
+    Args:
+        rows: rows[i] = (pattern indices, counts), see build_sparse_columns
+        num_patterns: Number of pattern columns
+        demands: List of quantities needed for each segment
+        max_surplus: Surplus bound per segment
+
+    Returns:
+        False if the LP is infeasible, True otherwise (also when GLOP is missing)
+    """
+    if pywraplp is None:
+        return True
+
+    solver = pywraplp.Solver.CreateSolver("GLOP")
+    x = [solver.NumVar(0, solver.infinity(), f"x_{j}") for j in range(num_patterns)]
+    for i, (pattern_idx, counts) in enumerate(rows):
+        row = solver.Constraint(demands[i], demands[i] + max_surplus, f"demand_{i}")
+        for j, count in zip(pattern_idx, counts):
+            row.SetCoefficient(x[j], count)
+
+    return solver.Solve() != pywraplp.Solver.INFEASIBLE
+
+
+def price_pattern(values, weights, bounds, capacity):
+    """
+    Bounded knapsack: maximize sum(values[i] * c_i)
+    s.t. sum(weights[i] * c_i) <= capacity, 0 <= c_i <= bounds[i]
+
+    Solved as a 0/1 knapsack over binary-split copies of each item with a
+    NumPy DP over capacity (weights are integer-scaled lengths).
+
+    Returns:
+        (best_value, counts)
+    """
+    num_items = len(values)
+    counts = [0] * num_items
+    if capacity <= 0:
+        return 0.0, counts
+
+    # Shrink the DP table by the common divisor of all weights
+    divisor = 0
+    for w in weights:
+        divisor = math.gcd(divisor, w)
+    divisor = divisor or 1
+    cap = capacity // divisor
+
+    best = np.zeros(cap + 1, dtype=np.float64)
+    decisions = []  # (item index, multiplicity, weight, take mask)
+
+    for i in range(num_items):
+        if values[i] <= 0 or bounds[i] <= 0:
+            continue
+        w = weights[i] // divisor
+        remaining = min(bounds[i], cap // w) if w > 0 else 0
+        k = 1
+        while remaining > 0:
+            mult = min(k, remaining)
+            remaining -= mult
+            k *= 2
+            kw = mult * w
+            candidate = best[: cap + 1 - kw] + mult * values[i]
+            take = candidate > best[kw:] + 1e-12
+            best[kw:] = np.where(take, candidate, best[kw:])
+            mask = np.zeros(cap + 1, dtype=bool)
+            mask[kw:] = take
+            decisions.append((i, mult, kw, mask))
+
+    # Backtrack from full capacity through the recorded decisions
+    c = cap
+    for i, mult, kw, mask in reversed(decisions):
+        if mask[c]:
+            counts[i] += mult
+            c -= kw
+
+    return float(best[cap]), counts
+
+
+def generate_patterns_by_column_generation(stock_length, piece_lengths, demands, blade_width, trim,
+                                           max_iterations=CG_MAX_ITERATIONS):
+    """
+    Phase 1 alternative: build the pattern pool with column generation
+
+    Args:
+        stock_length: Raw stock length (mm)
+        piece_lengths: List of segment lengths (mm)
+        demands: List of quantities needed for each segment
+        blade_width: Kerf width (mm)
+        trim: Trim cut at start (mm)
+        max_iterations: Upper bound on pricing rounds
+
+    Returns:
+        List of (obj_value, solution) tuples sorted by obj_value descending,
+        same contract as find_efficient_cutting_patterns
+    """
+    if np is None or pywraplp is None:
+        frappe.throw("Thư viện 'ortools'/'numpy' chưa được cài đặt. Vui lòng cài đặt: 'pip install ortools'")
+
+    stock_int = int(stock_length * SCALING_FACTOR)
+    pieces_int = [int(l * SCALING_FACTOR) for l in piece_lengths]
+    blade_int = int(blade_width * SCALING_FACTOR)
+    trim_int = int(trim * SCALING_FACTOR)
+    num_pieces = len(pieces_int)
+
+    # Each piece consumes its length plus one kerf; trim is taken once per bar
+    capacity = stock_int - trim_int
+    weights = [p + blade_int for p in pieces_int]
+    max_fit = [capacity // w if w > 0 else 0 for w in weights]
+
+    # Initial pool: one homogeneous pattern per segment type
+    columns = []
+    seen = set()
+    for i in range(num_pieces):
+        count = min(max_fit[i], demands[i])
+        if count <= 0:
+            continue
+        col = [0] * num_pieces
+        col[i] = count
+        columns.append(col)
+        seen.add(tuple(col))
+
+    if not columns:
+        return []
+
+    iterations = 0
+    converged = False
+    lp_value = 0
+    while iterations < max_iterations:
+        iterations += 1
+        master = solve_master_lp(columns, demands)
+        if master is None:
+            break
+        lp_value, _, duals = master
+
+        bounds = [min(max_fit[i], demands[i]) for i in range(num_pieces)]
+        value, counts = price_pattern(duals, weights, bounds, capacity)
+
+        # Reduced cost of a bar is 1 - sum(dual_i * c_i)
+        if value <= 1 + CG_REDUCED_COST_EPS:
+            converged = True
+            break
+
+        key = tuple(counts)
+        if key in seen:
+            converged = True
+            break
+        seen.add(key)
+        columns.append(counts)
+
+    frappe.logger().info(
+        f"Column generation: {len(columns)} patterns, {iterations} iterations, "
+        f"LP bound {lp_value:.2f} bars, converged={converged}"
+    )
+
+    results = []
+    for col in columns:
+        used_int = sum(col[i] * pieces_int[i] for i in range(num_pieces))
+        used_int += sum(col) * blade_int + trim_int
+        results.append((used_int / SCALING_FACTOR, col))
+
+    results.sort(key=lambda x: x[0], reverse=True)
+    return results
@@ -0,0 +1,355 @@
+"""
+Cutting Heuristic Service
+Fast feasible Phase 2 assignments used as CP-SAT solution hints
+
+greedy_pattern_assignment covers the demand from the Phase 1 pattern pool,
+largest remaining coverage first. load_previous_solution reads the last
+stored result of a Cutting Order so a re-optimization after a small demand
+edit starts from it (topped up greedily where the new demand is higher).
+fit_decreasing (FFD / BFD) gives the instant previews of the portal pages.
+decompose_into_bundles / split_into_bundles turn bars into MCTĐ bundles.
+"""
+
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cint, flt
+
+from cat_sat.services.cutting_optimization_service import SCALING_FACTOR
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def greedy_pattern_assignment(patterns, demands, initial=None, waste=None):
+    """
+    Greedy cover of the demand with patterns from the pool
+
+    Each step takes the pattern that covers the most remaining pieces
+    (ties: less waste, i.e. higher usage) as many times as it stays fully
+    useful for at least one segment.
+
+    Args:
+        patterns: List of (obj_value, solution) tuples
+        demands: List of quantities needed for each segment
+        initial: Optional starting bar counts per pattern (e.g. a previous run)
+        waste: Optional waste per pattern for the tie-break (needed when the
+            pool mixes stock lengths, where usage is not comparable)
+
+    Returns:
+        List of bar counts per pattern, or None if the pool cannot cover the demand
+    """
+    if np is None or not patterns:
+        return None
+
+    counts = np.asarray([sol for _, sol in patterns], dtype=np.int64)
+    if waste is not None:
+        usage = -np.asarray(waste, dtype=np.float64)
+    else:
+        usage = np.asarray([obj for obj, _ in patterns], dtype=np.float64)
+    x = np.zeros(len(patterns), dtype=np.int64)
+    if initial is not None:
+        x += np.asarray(initial, dtype=np.int64)
+
+    remaining = np.maximum(np.asarray(demands, dtype=np.int64) - x @ counts, 0)
+
+    while remaining.any():
+        coverage = np.minimum(counts, remaining).sum(axis=1)
+        best = coverage.max()
+        if best <= 0:
+            return None
+        candidates = np.flatnonzero(coverage == best)
+        j = candidates[np.argmax(usage[candidates])]
+
+        # Repeat while every copy still covers at least one remaining piece
+        used = counts[j] > 0
+        repeat = max(1, int((remaining[used] // counts[j][used]).max()))
+        x[j] += repeat
+        remaining = np.maximum(remaining - repeat * counts[j], 0)
+
+    return x.tolist()
+
+
+def load_previous_solution(order_name):
+    """
+    Last stored optimization result of a Cutting Order
+
+    Returns:
+        {machine: [({(length, segment_name, piece_code): count}, qty, stock_length), ...]}
+    """
+    rows = frappe.get_all(
+        "Cutting Pattern",
+        filters={"parent": order_name, "parenttype": "Cutting Order"},
+        fields=["name", "machine", "qty", "stock_length"],
+    )
+    if not rows:
+        return {}
+
+    segments = frappe.get_all(
+        "Pattern Segment",
+        filters={"parent": ["in", [r.name for r in rows]], "parenttype": "Cutting Pattern"},
+        fields=["parent", "length_mm", "segment_name", "piece_code", "quantity"],
+    )
+    by_pattern = defaultdict(dict)
+    for seg in segments:
+        key = (flt(seg.length_mm), seg.segment_name or "", seg.piece_code or "")
+        by_pattern[seg.parent][key] = by_pattern[seg.parent].get(key, 0) + cint(seg.quantity)
+
+    result = defaultdict(list)
+    for r in rows:
+        if by_pattern.get(r.name) and cint(r.qty) > 0:
+            result[r.machine or "Laser"].append((by_pattern[r.name], cint(r.qty), flt(r.stock_length)))
+    return dict(result)
+
+
+def map_previous_solution(previous, patterns, segment_keys, pattern_stock_lengths=None):
+    """
+    Translate a stored solution to bar counts over the current pattern pool
+
+    Segment keys are matched on (length, segment_name, piece_code), falling
+    back to (length, segment_name) when that is unique (stored piece codes
+    may come from the source item). Patterns are matched on their stock
+    length too, unless the stored row has none. Patterns that are no longer
+    in the pool are skipped.
+
+    Returns:
+        List of bar counts per pattern, or None if nothing matched
+    """
+    if not previous:
+        return None
+
+    index = {}
+    partial = defaultdict(list)
+    for i, sk in enumerate(segment_keys):
+        if isinstance(sk, tuple):
+            index[sk] = i
+            partial[sk[:2]].append(i)
+        else:
+            index[(flt(sk), f"{sk}mm", "")] = i
+
+    pattern_index = {}
+    for j, (_, sol) in enumerate(patterns):
+        stock = pattern_stock_lengths[j] if pattern_stock_lengths else 0
+        pattern_index.setdefault((stock, tuple(sol)), j)
+        pattern_index.setdefault((0, tuple(sol)), j)
+    x = [0] * len(patterns)
+    matched = False
+
+    for seg_counts, qty, stock_length in previous:
+        sol = [0] * len(segment_keys)
+        for key, count in seg_counts.items():
+            i = index.get(key)
+            if i is None and len(partial.get(key[:2], [])) == 1:
+                i = partial[key[:2]][0]
+            if i is None:
+                break
+            sol[i] += count
+        else:
+            j = pattern_index.get((stock_length if pattern_stock_lengths else 0, tuple(sol)))
+            if j is not None:
+                x[j] += qty
+                matched = True
+
+    return x if matched else None
+
+
+def trim_surplus(x, patterns, demands, max_surplus):
+    """
+    Drop bars from a solution until no segment exceeds demand + max_surplus
+
+    Each step removes one bar of the pattern that cuts the most pieces of the
+    worst segment. Used after a demand decrease; the greedy top-up then
+    restores any shortfall.
+    """
+    counts = np.asarray([sol for _, sol in patterns], dtype=np.int64)
+    x = np.asarray(x, dtype=np.int64).copy()
+    demands = np.asarray(demands, dtype=np.int64)
+
+    while True:
+        over = x @ counts - demands - max_surplus
+        i = int(np.argmax(over))
+        if over[i] <= 0:
+            break
+        cuts = np.where(x > 0, counts[:, i], 0)
+        j = int(np.argmax(cuts))
+        if cuts[j] <= 0:
+            break
+        x[j] -= 1
+
+    return x.tolist()
+
+
+def build_pattern_hint(patterns, demands, segment_keys=None, previous=None, max_surplus=None,
+                       pattern_stock_lengths=None, waste=None):
+    """
+    Warm start for Phase 2: previous result (if any) trimmed to the surplus
+    bound and topped up greedily, otherwise a greedy cover
+
+    Args:
+        pattern_stock_lengths: Stock length of each pattern (mixed-stock pools)
+        waste: Waste per pattern, greedy tie-break (mixed-stock pools)
+
+    Returns:
+        (bar counts per pattern, source label) or (None, None)
+    """
+    initial = None
+    if previous and segment_keys is not None and np is not None:
+        initial = map_previous_solution(previous, patterns, segment_keys, pattern_stock_lengths)
+        if initial and max_surplus is not None:
+            initial = trim_surplus(initial, patterns, demands, max_surplus)
+
+    x = greedy_pattern_assignment(patterns, demands, initial, waste)
+    if x is None:
+        return None, None
+    return x, "previous run" if initial else "greedy"
+
+
+def fit_decreasing(piece_lengths, demands, stock_length, blade_width, trim, best_fit=True):
+    """
+    First-fit / best-fit decreasing packing with the optimizer's kerf and trim rules
+
+    Every piece takes its length plus one kerf and a bar holds
+    stock_length - trim (same as Phase 1). Pieces go longest first into the
+    first bar (FFD) or the fullest bar (BFD) they still fit in.
+
+    Args:
+        piece_lengths: List of segment lengths (mm)
+        demands: List of quantities needed for each segment
+        best_fit: True = best-fit decreasing, False = first-fit decreasing
+
+    Returns:
+        List of (obj_value, solution, qty): distinct bar layouts in the
+        Phase 1 pattern format with the number of bars cut that way
+    """
+    capacity = int((stock_length - trim) * SCALING_FACTOR)
+    blade_int = int(blade_width * SCALING_FACTOR)
+    sizes = [int(length * SCALING_FACTOR) + blade_int for length in piece_lengths]
+    for i, size in enumerate(sizes):
+        if size > capacity and demands[i] > 0:
+            frappe.throw(f"Đoạn {piece_lengths[i]}mm dài hơn chiều dài khả dụng ({stock_length - trim}mm)")
+
+    bars = []  # counts per segment of each opened bar
+    free = []  # free space of each opened bar
+    # BFD: free space of the open bars, sorted, with their bar index
+    free_sorted = []
+
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        size = sizes[i]
+        for _ in range(demands[i]):
+            if best_fit:
+                pos = bisect_left(free_sorted, (size, -1))
+                if pos < len(free_sorted):
+                    space, b = free_sorted.pop(pos)
+                else:
+                    space, b = capacity, len(bars)
+                    bars.append([0] * len(sizes))
+                    free.append(capacity)
+                free[b] = space - size
+                insort(free_sorted, (free[b], b))
+            else:
+                b = next((k for k, space in enumerate(free) if space >= size), None)
+                if b is None:
+                    b = len(bars)
+                    bars.append([0] * len(sizes))
+                    free.append(capacity)
+                free[b] -= size
+            bars[b][i] += 1
+
+    layouts = defaultdict(int)
+    for counts in bars:
+        layouts[tuple(counts)] += 1
+
+    result = []
+    for counts, qty in layouts.items():
+        used_int = sum(c * s for c, s in zip(counts, sizes)) + int(trim * SCALING_FACTOR)
+        result.append((used_int / SCALING_FACTOR, list(counts), qty))
+    result.sort(key=lambda r: r[0], reverse=True)
+    return result
+
+
+def preview_cutting_plan(piece_lengths, demands, segment_keys, stock_length, blade_width, trim, best_fit=True):
+    """
+    Instant estimate of a cutting plan (no pattern enumeration, no CP-SAT)
+
+    Returns:
+        List of pattern dicts like solve_laser_cutting_stock ('pattern', 'qty',
+        'used_length', 'waste', 'stock_length')
+    """
+    result_patterns = []
+    for obj_value, sol, qty in fit_decreasing(piece_lengths, demands, stock_length, blade_width, trim, best_fit):
+        used_length = obj_value - trim
+        result_patterns.append({
+            "pattern": {segment_keys[i]: c for i, c in enumerate(sol) if c > 0},
+            "qty": qty,
+            "used_length": used_length,
+            "waste": stock_length - used_length,
+            "stock_length": stock_length,
+        })
+    return result_patterns
+
+
+def decompose_into_bundles(qty, factors, manual_cut_limit=None):
+    """
+    Split a number of bars into bundles of the given factors (largest first)
+
+    Args:
+        qty: Number of bars
+        factors: Bundle factors, 1 = manual cut
+        manual_cut_limit: Leftover bars that go to manual cuts before
+            rounding up to the smallest bundle (None = no limit)
+
+    Returns:
+        {factor: bundles}
+    """
+    result = {}
+    remaining = qty
+    bundle_factors = sorted((f for f in factors if f > 1), reverse=True)
+    for f in bundle_factors:
+        if remaining >= f:
+            result[f] = remaining // f
+            remaining -= result[f] * f
+
+    if remaining:
+        if 1 in factors and (manual_cut_limit is None or remaining <= manual_cut_limit):
+            result[1] = remaining
+        elif bundle_factors:
+            smallest = bundle_factors[-1]
+            result[smallest] = result.get(smallest, 0) + 1
+        else:
+            result[1] = remaining
+    return result
+
+
+def split_into_bundles(bars, factors):
+    """
+    Exact split of machine bars into the fewest bundles of the given factors
+
+    Args:
+        bars: Number of bars, a sum of factors (see get_machine_bar_domain)
+        factors: Bundle factors > 1
+
+    Returns:
+        {factor: bundles}
+    """
+    if bars <= 0:
+        return {}
+    # fewest[n] = fewest bundles summing to n, choice[n] = factor of the last one
+    fewest = [0] + [None] * bars
+    choice = [0] * (bars + 1)
+    for n in range(1, bars + 1):
+        for f in sorted(factors, reverse=True):
+            if f <= n and fewest[n - f] is not None and (fewest[n] is None or fewest[n - f] + 1 < fewest[n]):
+                fewest[n] = fewest[n - f] + 1
+                choice[n] = f
+    if fewest[bars] is None:
+        frappe.throw(f"{bars} cây không chia được thành các bó {factors}")
+
+    result = defaultdict(int)
+    n = bars
+    while n:
+        result[choice[n]] += 1
+        n -= choice[n]
+    return dict(result)
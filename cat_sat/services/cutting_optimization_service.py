@@ -6,12 +6,15 @@ Phase 1: Find all valid cutting patterns using CP-SAT enumerate_all_solutions
 Phase 2: Optimize pattern distribution with multi-objective (waste → surplus → priority)
 """
 
-import frappe
-from frappe.utils import flt, cint
-from collections import defaultdict
 import hashlib
+import json
+import math
 import os
-import pickle
+import time
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cint, flt
 
 try:
     from ortools.sat.python import cp_model
@@ -25,9 +28,11 @@ try:
             self._limit = limit
             self._solutions = []
             self._seen = set()
+            self._limit_reached = False
         
         def on_solution_callback(self):
             if len(self._solutions) >= self._limit:
+                self._limit_reached = True
                 self.StopSearch()
                 return
             
@@ -44,6 +49,10 @@ try:
         @property
         def solutions(self):
             return self._solutions
+
+        @property
+        def limit_reached(self):
+            return self._limit_reached
 except ImportError:
     cp_model = None
     SolutionCollector = None
@@ -55,24 +64,77 @@ SCALING_FACTOR = 10
 SOLUTION_LIMIT = 100000
 
 
-def get_cache_path(stock_length, piece_lengths, blade_width, max_waste_pct, trim):
+def canonicalize_piece_lengths(piece_lengths):
+    """
+    Order-insensitive form of piece_lengths for cache keys
+
+    Returns:
+        (canonical, order) where canonical is the sorted list of integer-scaled
+        lengths and canonical[k] corresponds to piece_lengths[order[k]]
+    """
+    scaled = [int(l * SCALING_FACTOR) for l in piece_lengths]
+    order = sorted(range(len(scaled)), key=lambda i: (scaled[i], i))
+    return [scaled[i] for i in order], order
+
+
+def get_cache_family(stock_length, blade_width, trim, max_distinct=0):
+    """
+    Hash of the parameters shared by all cache entries that can reuse each other
+
+    Pools limited to max_distinct segment types per pattern (MCTĐ) form their own family.
+    """
+    family_string = (
+        f"{int(stock_length * SCALING_FACTOR)}-{int(blade_width * SCALING_FACTOR)}-{int(trim * SCALING_FACTOR)}"
+    )
+    if max_distinct > 0:
+        family_string += f"-d{max_distinct}"
+    return hashlib.sha256(family_string.encode('utf-8')).hexdigest()[:8]
+
+
+def get_cache_path(stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct=0):
     """Generate cache file path based on input parameters
     
-    CRITICAL: piece_lengths order must be preserved (NOT sorted) because
-    pattern solutions are arrays indexed by position. If we sort here but
-    use unsorted order when looking up, values will be misaligned.
+    The key uses the sorted (canonical) lengths so the same set of segments
+    entered in a different row order hits the same entry. Cached count
+    vectors are stored in canonical column order and must be remapped with
+    the permutation from canonicalize_piece_lengths.
     """
-    cache_folder = os.path.join(frappe.get_site_path(), "private", "cutting_patterns_cache")
-    os.makedirs(cache_folder, exist_ok=True)
+    from cat_sat.services.pattern_cache_service import PATTERN_STORE_EXTENSION, get_cache_folder
     
-    # MUST use tuple(piece_lengths) NOT sorted - order matters for pattern indexing
-    params_string = f"{stock_length}-{tuple(piece_lengths)}-{blade_width}-{max_waste_pct}-{trim}"
+    canonical, _ = canonicalize_piece_lengths(piece_lengths)
+    params_string = f"{tuple(canonical)}-{max_waste_pct}"
     input_hash = hashlib.sha256(params_string.encode('utf-8')).hexdigest()[:16]
+    family = get_cache_family(stock_length, blade_width, trim, max_distinct)
     
-    return os.path.join(cache_folder, f"patterns_{input_hash}.pkl")
+    return os.path.join(get_cache_folder(), f"patterns_{family}_{input_hash}{PATTERN_STORE_EXTENSION}")
+
+
+def get_max_pieces_per_pattern(stock_int, pieces_int):
+    """Upper bound on the count of one segment type in a pattern (scaled inputs)"""
+    # For short segments (like 40mm), we need many more pieces per bar
+    min_piece_len = min(pieces_int) if pieces_int else 1000
+    return max(150, stock_int // min_piece_len + 1)
+
 
+def get_min_used(stock_int, pieces_int, max_waste_pct):
+    """
+    Minimum material a Phase 1 pattern must use (scaled, including trim)
 
-def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, max_waste_pct, trim):
+    For short segments (< 500mm), allow more waste since bundling many is harder.
+    For longer segments, require higher utilization.
+    """
+    avg_piece_len = sum(pieces_int) / len(pieces_int) if pieces_int else 1000
+    if avg_piece_len < 500 * SCALING_FACTOR:  # Short segments
+        adaptive_waste_pct = 0.10  # Allow up to 10% waste for short segments
+    elif avg_piece_len < 1000 * SCALING_FACTOR:  # Medium segments
+        adaptive_waste_pct = 0.05  # Allow 5% waste
+    else:
+        adaptive_waste_pct = max_waste_pct  # Use default 1.5%
+
+    return int(stock_int * (1 - adaptive_waste_pct))
+
+
+def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct=0):
     """
     Phase 1: Find all valid cutting patterns using CP-SAT
     
@@ -82,6 +144,8 @@ def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, ma
         blade_width: Kerf width (mm)
         max_waste_pct: Maximum waste percentage (0.01 = 1%)
         trim: Trim cut at start (mm)
+        max_distinct: Maximum number of different segment types in a pattern
+            (MCTĐ machine limit), 0 = no limit
     
     Returns:
         List of (obj_value, solution) tuples where:
@@ -97,10 +161,7 @@ def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, ma
     model = cp_model.CpModel()
     num_pieces = len(pieces_int)
     
-    # Calculate max pieces that could fit for each length
-    # For short segments (like 40mm), we need many more pieces per bar
-    min_piece_len = min(pieces_int) if pieces_int else 1000
-    max_possible_pieces = max(150, stock_int // min_piece_len + 1)
+    max_possible_pieces = get_max_pieces_per_pattern(stock_int, pieces_int)
     
     # Variables: count of each segment type in a single pattern
     counts = [model.NewIntVar(0, max_possible_pieces, f'segment_{i}') for i in range(num_pieces)]
@@ -114,19 +175,16 @@ def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, ma
     model.Add(total_used <= stock_int)
     
     # Constraint: Adaptive minimum utilization based on segment lengths
-    # For short segments (< 500mm), allow more waste since bundling many is harder
-    # For longer segments, require higher utilization
-    avg_piece_len = sum(pieces_int) / len(pieces_int) if pieces_int else 1000
-    if avg_piece_len < 500 * SCALING_FACTOR:  # Short segments
-        adaptive_waste_pct = 0.10  # Allow up to 10% waste for short segments
-    elif avg_piece_len < 1000 * SCALING_FACTOR:  # Medium segments
-        adaptive_waste_pct = 0.05  # Allow 5% waste
-    else:
-        adaptive_waste_pct = max_waste_pct  # Use default 1.5%
-    
-    min_used = int(stock_int * (1 - adaptive_waste_pct))
+    min_used = get_min_used(stock_int, pieces_int, max_waste_pct)
     model.Add(total_used >= min_used)
     
+    # Constraint: At most max_distinct different segment types
+    if 0 < max_distinct < num_pieces:
+        present = [model.NewBoolVar(f'present_{i}') for i in range(num_pieces)]
+        for i in range(num_pieces):
+            model.Add(counts[i] == 0).OnlyEnforceIf(present[i].Not())
+        model.Add(cp_model.LinearExpr.Sum(present) <= max_distinct)
+
     # Constraint: Waste >= 0 (implicit from above, but explicit for clarity)
     waste_var = model.NewIntVar(0, stock_int, 'waste')
     model.Add(waste_var == stock_int - total_used)
@@ -141,6 +199,12 @@ def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, ma
     collector = SolutionCollector(counts, SOLUTION_LIMIT)
     solver.Solve(model, collector)
     
+    if collector.limit_reached:
+        frappe.logger().warning(
+            f"Pattern enumeration stopped at SOLUTION_LIMIT={SOLUTION_LIMIT} for {num_pieces} segment types; "
+            "remaining patterns were dropped. Consider Column Generation in Cutting Settings."
+        )
+
     if not collector.solutions:
         return []
     
@@ -159,48 +223,520 @@ def find_efficient_cutting_patterns(stock_length, piece_lengths, blade_width, ma
     return results
 
 
-def get_or_calculate_patterns(stock_length, piece_lengths, blade_width, max_waste_pct=0.015, trim=0):
+def get_or_calculate_patterns(stock_length, piece_lengths, blade_width, max_waste_pct=0.015, trim=0, method=None,
+                              max_distinct=0):
     """
     Get patterns from cache or calculate new ones
     
+    Lookup order: exact entry, then projection of a complete cached
+    enumeration over a superset of the lengths, then Phase 1.
+
+    Args:
+        method: 'Dynamic Programming' or 'CP-SAT Enumeration', None = from Cutting Settings.
+            Both produce the same pattern set, so they share one cache entry.
+        max_distinct: Maximum number of different segment types in a pattern,
+            enforced during generation (MCTĐ), 0 = no limit. Limited pools are
+            cached in their own family.
+
     Returns:
         List of (obj_value, solution) tuples
     """
-    cache_path = get_cache_path(stock_length, piece_lengths, blade_width, max_waste_pct, trim)
+    from cat_sat.services.pattern_cache_service import (
+        enforce_cache_size_limit,
+        find_superset_patterns,
+        load_pattern_store,
+        patterns_from_arrays,
+        record_cache_event,
+        save_pattern_store,
+    )
     
-    # Try to load from cache
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, 'rb') as f:
-                patterns = pickle.load(f)
-            
-            # Filter patterns that still fit after trim
-            valid_patterns = [
-                (obj, sol) for obj, sol in patterns
-                if obj <= stock_length + 0.001
-            ]
-            
-            if valid_patterns:
-                return valid_patterns
-        except Exception:
-            pass  # Cache corrupted, recalculate
-    
-    # Calculate new patterns
-    patterns = find_efficient_cutting_patterns(
-        stock_length, piece_lengths, blade_width, max_waste_pct, trim
+    if max_distinct >= len(piece_lengths):
+        max_distinct = 0  # No restriction, share the unlimited entries
+    cache_path = get_cache_path(stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct)
+    canonical, order = canonicalize_piece_lengths(piece_lengths)
+    # inverse[i] = canonical column holding the caller's column i
+    inverse = sorted(range(len(order)), key=lambda k: order[k])
+
+    # Try process memory, Redis, then disk (stale or corrupt files are discarded by the store)
+    stored = load_pattern_store(cache_path)
+    if stored:
+        used, counts, _, tier = stored
+
+        # Filter patterns that still fit after trim
+        valid = used <= stock_length + 0.001
+        if valid.any():
+            record_cache_event("hit")
+            if tier != "disk":
+                record_cache_event(f"hit_{tier}")
+            # Remap canonical columns back to the caller's order
+            return patterns_from_arrays(used[valid], counts[valid][:, inverse])
+
+    min_used = get_min_used(int(stock_length * SCALING_FACTOR), canonical, max_waste_pct)
+
+    # Reuse a cached enumeration over a superset of these lengths
+    superset = find_superset_patterns(
+        get_cache_family(stock_length, blade_width, trim, max_distinct), canonical, min_used, SCALING_FACTOR
     )
+    if superset:
+        record_cache_event("superset")
+        used, counts, source = superset
+        frappe.logger().info(
+            f"Pattern cache: {len(used)} patterns for {len(canonical)} lengths projected from {source}"
+        )
+        canonical_patterns = patterns_from_arrays(used, counts)
+        patterns = [(obj, [sol[k] for k in inverse]) for obj, sol in canonical_patterns]
+        complete = True
+    else:
+        record_cache_event("miss")
+
+        # Calculate new patterns
+        if not method:
+            method = get_enumeration_method()
+
+        if method == "Dynamic Programming":
+            from cat_sat.services.pattern_generation_service import generate_patterns_dp
+            patterns = generate_patterns_dp(
+                stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct=max_distinct
+            )
+        else:
+            patterns = find_efficient_cutting_patterns(
+                stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct
+            )
+        canonical_patterns = [(obj, [sol[i] for i in order]) for obj, sol in patterns]
+        # A set cut off at SOLUTION_LIMIT must not serve as a superset
+        complete = len(patterns) < SOLUTION_LIMIT
     
-    # Save to cache
+    # Save to cache (columns in canonical order)
     if patterns:
         try:
-            with open(cache_path, 'wb') as f:
-                pickle.dump(patterns, f, protocol=pickle.HIGHEST_PROTOCOL)
-        except Exception:
-            pass  # Cache write failed, continue anyway
+            save_pattern_store(cache_path, canonical_patterns, {
+                "stock_length": stock_length,
+                "piece_lengths": canonical,
+                "blade_width": blade_width,
+                "max_waste_pct": max_waste_pct,
+                "trim": trim,
+                "max_distinct": max_distinct,
+                "min_used": min_used,
+                "complete": complete,
+            })
+            enforce_cache_size_limit()
+        except Exception as e:
+            # Cache write failed, continue anyway
+            frappe.logger().warning(f"Pattern cache write failed for {os.path.basename(cache_path)}: {e}")
     
     return patterns
 
 
+def get_pattern_generation_method(num_pieces):
+    """
+    Resolve the Phase 1 method from Cutting Settings
+
+    'Auto' uses full enumeration (DP generator) for small orders and column
+    generation once the number of segment types reaches column_generation_min_types.
+    """
+    settings = frappe.get_single("Cutting Settings")
+    method = settings.get("pattern_generation_method") or "Auto"
+
+    if method == "Auto":
+        threshold = cint(settings.get("column_generation_min_types") or 15)
+        method = "Column Generation" if num_pieces >= threshold else "Dynamic Programming"
+
+    return method
+
+
+def prune_patterns(patterns, label="", max_surplus=0):
+    """
+    Drop duplicate patterns and log the reduction
+
+    Dominated patterns also go when prune_dominated_patterns is enabled in
+    Cutting Settings and max_surplus leaves room for the extra segments.
+    """
+    settings = frappe.get_single("Cutting Settings")
+    if not cint(settings.get("prune_dominated_patterns")):
+        max_surplus = 0
+
+    from cat_sat.services.pattern_generation_service import prune_dominated_patterns
+    pruned, duplicates, dominated = prune_dominated_patterns(patterns, max_surplus)
+
+    if duplicates or dominated:
+        frappe.logger().info(
+            f"Pattern pruning{f' ({label})' if label else ''}: {len(patterns)} -> {len(pruned)} "
+            f"({dominated} dominated, {duplicates} duplicate)"
+        )
+    return pruned
+
+
+def build_sparse_columns(patterns, num_pieces):
+    """
+    Sparse view of the pattern matrix for Phase 2 constraints
+
+    Returns:
+        rows: rows[i] = (pattern indices, counts) of the patterns that cut segment i
+    """
+    rows = [([], []) for _ in range(num_pieces)]
+    for j, (_, sol) in enumerate(patterns):
+        for i, count in enumerate(sol):
+            if count:
+                rows[i][0].append(j)
+                rows[i][1].append(count)
+    return rows
+
+
+# Default per-bar penalty (mm) for each priority step of a less preferred stock length
+STOCK_PRIORITY_PENALTY = 50
+
+
+def get_profile_stocks(steel_profile):
+    """Stock bars of a Steel Profile with a length, best priority first"""
+    from cat_sat.services.steel_profile_service import get_items_for_profile
+    return [s for s in get_items_for_profile(steel_profile) if flt(s.get("length_mm")) > 0]
+
+
+def normalize_stocks(stock_length, stocks=None):
+    """
+    Stock lengths for one solve, one entry per length (best priority kept)
+
+    Remnants (entries with "remnant" and "max_qty", see get_remnant_stocks)
+    stay separate from new bars of the same length.
+
+    Args:
+        stock_length: Single stock length used when stocks has no new bars
+        stocks: List of {"item", "length_mm", "priority"} (see get_items_for_profile)
+
+    Returns:
+        List of {"item", "length_mm", "priority"[, "max_qty", "remnant"]}
+        sorted by priority, longer first
+    """
+    by_length = {}
+    for stock in stocks or []:
+        length = flt(stock.get("length_mm"))
+        priority = 99 if stock.get("priority") in (None, "") else cint(stock.get("priority"))
+        key = (length, stock.get("remnant"))
+        if length > 0 and (key not in by_length or priority < by_length[key]["priority"]):
+            by_length[key] = dict(stock, length_mm=length, priority=priority)
+
+    if not any(not s.get("remnant") for s in by_length.values()):
+        by_length[(flt(stock_length), None)] = {"item": None, "length_mm": flt(stock_length), "priority": 1}
+    return sorted(by_length.values(), key=lambda s: (s["priority"], -s["length_mm"]))
+
+
+def get_stock_costs(stocks):
+    """
+    Extra cost (mm per bar) of each stock length: stock_priority_penalty from
+    Cutting Settings for every priority step above the best stock
+    """
+    penalty = frappe.get_single("Cutting Settings").get("stock_priority_penalty")
+    penalty = STOCK_PRIORITY_PENALTY if penalty in (None, "") else flt(penalty)
+    best = min(s["priority"] for s in stocks)
+    return [penalty * (s["priority"] - best) for s in stocks]
+
+
+def add_stock_limits(model, stocks, pattern_stock, bar_terms):
+    """
+    Bound the bars cut from stocks with a max_qty (remnants on hand)
+
+    Args:
+        bar_terms: bar_terms(j) -> [(variable, bars per unit)] of pattern j
+    """
+    for k, stock in enumerate(stocks):
+        if stock.get("max_qty") is None:
+            continue
+        terms = [term for j, sk in enumerate(pattern_stock) if sk == k for term in bar_terms(j)]
+        if terms:
+            variables, coeffs = zip(*terms, strict=True)
+            model.Add(cp_model.LinearExpr.WeightedSum(list(variables), list(coeffs)) <= stock["max_qty"])
+
+
+def generate_stock_patterns(stocks, piece_lengths, trim, generate, label="", max_surplus=0):
+    """
+    Phase 1 over several stock lengths
+
+    Each stock length gets its own pool over the segments that fit it,
+    pruned on its own (dominance only holds within one stock length).
+
+    Args:
+        stocks: List from normalize_stocks
+        generate: generate(stock_length, indices) -> patterns over the
+            segments piece_lengths[i] for i in indices
+        max_surplus: Surplus allowed per segment, passed on to prune_patterns
+
+    Returns:
+        (patterns, pattern_stock): patterns over all segments and the index
+        into stocks of each pattern
+    """
+    num_pieces = len(piece_lengths)
+    patterns = []
+    pattern_stock = []
+    for k, stock in enumerate(stocks):
+        indices = [i for i, length in enumerate(piece_lengths) if length <= stock["length_mm"] - trim]
+        if not indices:
+            continue
+
+        pool = generate(stock["length_mm"], indices)
+        name = f"{label} {stock['length_mm']:g}mm" if len(stocks) > 1 else label
+        pool = prune_patterns(pool, name, max_surplus)
+
+        if len(indices) < num_pieces:
+            widened = []
+            for obj_value, sol in pool:
+                full = [0] * num_pieces
+                for i, count in zip(indices, sol, strict=True):
+                    full[i] = count
+                widened.append((obj_value, full))
+            pool = widened
+
+        patterns.extend(pool)
+        pattern_stock.extend([k] * len(pool))
+
+    if len(stocks) > 1:
+        frappe.logger().info(
+            f"{label} Phase 1: {len(patterns)} patterns over stock lengths "
+            + ", ".join(f"{s['length_mm']:g}mm ({pattern_stock.count(k)})" for k, s in enumerate(stocks))
+        )
+    return patterns, pattern_stock
+
+
+def log_solve(label, solver, status, callback=None, hint_source=None):
+    """Log status, time to first solution, objective and relative gap of a CP-SAT solve"""
+    message = f"{label}: {solver.StatusName(status)} in {solver.WallTime():.2f}s"
+    if callback is not None and callback.first_solution_time is not None:
+        message += f", first solution at {callback.first_solution_time:.2f}s"
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        objective = solver.ObjectiveValue()
+        bound = solver.BestObjectiveBound()
+        gap = abs(objective - bound) / max(abs(objective), 1)
+        message += f", objective {objective:g} (bound {bound:g}, gap {gap:.2%})"
+    if hint_source:
+        message += f", hint from {hint_source}"
+    frappe.logger().info(message)
+
+
+def get_solve_stats(solver, status, scale=1):
+    """
+    Status, objective, best bound and relative gap of a CP-SAT solve
+
+    Args:
+        scale: Divide objective/bound by this (objective units -> mm of waste)
+    """
+    stats = {"status": solver.StatusName(status), "wall_time": round(solver.WallTime(), 2)}
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        objective = solver.ObjectiveValue()
+        bound = solver.BestObjectiveBound()
+        stats["objective"] = round(objective / scale, 2)
+        stats["bound"] = round(bound / scale, 2)
+        stats["gap_pct"] = round(abs(objective - bound) / max(abs(objective), 1) * 100, 2)
+    return stats
+
+
+def get_bar_lower_bound(piece_lengths, demands, blade_width, trim, stocks):
+    """
+    Continuous lower bound on the number of bars
+
+    Total demanded length (each piece with its kerf) over the usable length
+    (stock - trim) of the longest stock, rounded up.
+    """
+    usable = max(s["length_mm"] for s in stocks) - trim
+    if usable <= 0:
+        return 0
+    demanded = sum((length + blade_width) * qty for length, qty in zip(piece_lengths, demands, strict=True))
+    return math.ceil(demanded / usable - 1e-9)
+
+
+def build_run_report(patterns, lower_bound, solve_stats=None):
+    """
+    Quality report of one optimization run against the lower bound
+
+    Returns:
+        dict with lower_bound_bars, bars, patterns (rows), gap_pct (bars
+        above the lower bound, % of bars), solver_status, solver_bound and
+        solver_objective (mm of waste beyond the trim, incl. stock priority
+        cost), solver_gap_pct, model_variables (Phase 2 model size) and
+        stages (stats of each lexicographic stage)
+    """
+    solve_stats = solve_stats or {}
+    bars = sum(p["qty"] for p in patterns)
+    return {
+        "lower_bound_bars": lower_bound,
+        "bars": bars,
+        "patterns": len(patterns),
+        "gap_pct": round((bars - lower_bound) / bars * 100, 2) if bars else 0,
+        "solver_status": solve_stats.get("status"),
+        "solver_bound": solve_stats.get("bound"),
+        "solver_objective": solve_stats.get("objective"),
+        "solver_gap_pct": solve_stats.get("gap_pct"),
+        "model_variables": solve_stats.get("variables"),
+        "stages": solve_stats.get("stages"),
+    }
+
+
+def combine_run_reports(reports):
+    """
+    Order-level report of the Laser and MCTĐ runs
+
+    Bars and lower bounds add up; the status is the weakest of the runs and
+    the solver bound is only summed when every run has one.
+    """
+    reports = [r for r in reports if r]
+    if not reports:
+        return {}
+    combined = build_run_report([], sum(r["lower_bound_bars"] for r in reports))
+    bars = sum(r["bars"] for r in reports)
+    combined["bars"] = bars
+    combined["patterns"] = sum(r.get("patterns", 0) for r in reports)
+    combined["gap_pct"] = round((bars - combined["lower_bound_bars"]) / bars * 100, 2) if bars else 0
+    statuses = [r["solver_status"] for r in reports]
+    combined["solver_status"] = statuses[0] if len(set(statuses)) == 1 else "FEASIBLE"
+    if all(r["solver_bound"] is not None for r in reports):
+        combined["solver_bound"] = round(sum(r["solver_bound"] for r in reports), 2)
+        combined["solver_objective"] = round(sum(r["solver_objective"] for r in reports), 2)
+        combined["solver_gap_pct"] = round(
+            abs(combined["solver_objective"] - combined["solver_bound"])
+            / max(abs(combined["solver_objective"]), 1) * 100, 2
+        )
+    return combined
+
+
+def get_enumeration_method():
+    """Full-enumeration generator to use where column generation does not apply"""
+    method = frappe.get_single("Cutting Settings").get("pattern_generation_method")
+    if method == "CP-SAT Enumeration":
+        return method
+    return "Dynamic Programming"
+
+
+# Phase 2 solver defaults for fields not yet set in Cutting Settings
+SOLVER_DEFAULTS = {
+    "laser": {"workers": 0, "time_limit": 60},
+    "bundled": {"workers": 8, "time_limit": 60},
+}
+
+
+def get_solver_params(order=None):
+    """
+    Phase 2 CP-SAT parameters from Cutting Settings, overridden by the
+    non-zero values set on the Cutting Order
+
+    Args:
+        order: Cutting Order doc (None = settings only, e.g. portal runs)
+
+    Returns:
+        {"laser": params, "bundled": params} where params has workers
+        (0 = all cores), time_limit (seconds per solve, 0 = none),
+        relative_gap, random_seed and the stage settings: waste_tolerance
+        (fraction of the stock used) and surplus_tolerance (fraction of the
+        demand) the later stages may give up,
+        surplus_time_limit (0 = time_limit) and setup_time_limit
+        (0 = no pattern-count stage)
+    """
+    settings = frappe.get_single("Cutting Settings")
+
+    def value(fieldname, default, cast):
+        if order is not None and order.get(fieldname):
+            return cast(order.get(fieldname))
+        setting = settings.get(fieldname)
+        return default if setting in (None, "") else cast(setting)
+
+    relative_gap = value("solver_relative_gap", 0.0, flt)
+    random_seed = value("solver_random_seed", 0, cint)
+    # Lexicographic stages after the waste solve (tolerances as fractions)
+    stages = {
+        "waste_tolerance": value("stage_waste_tolerance", 0.0, flt) / 100,
+        "surplus_tolerance": value("stage_surplus_tolerance", 0.0, flt) / 100,
+        "surplus_time_limit": value("stage_surplus_time_limit", 0, cint),
+        "setup_time_limit": value("stage_setup_time_limit", 0, cint),
+    }
+    return {
+        phase: {
+            "workers": value(f"solver_{phase}_workers", defaults["workers"], cint),
+            "time_limit": value(f"solver_{phase}_time_limit", defaults["time_limit"], cint),
+            "relative_gap": relative_gap,
+            "random_seed": random_seed,
+            **stages,
+        }
+        for phase, defaults in SOLVER_DEFAULTS.items()
+    }
+
+
+def apply_solver_params(solver, params):
+    """Set workers, time limit, relative gap and seed on a CpSolver (0 keeps the CP-SAT default)"""
+    if params.get("workers", 0) > 0:
+        solver.parameters.num_search_workers = params["workers"]
+    if params.get("time_limit", 0) > 0:
+        solver.parameters.max_time_in_seconds = params["time_limit"]
+    if params.get("relative_gap", 0) > 0:
+        solver.parameters.relative_gap_limit = params["relative_gap"]
+    solver.parameters.random_seed = params.get("random_seed", 0)
+
+
+def with_tolerance(value, tolerance, base):
+    """
+    Bound that locks a stage objective: its optimum plus tolerance * base
+
+    Args:
+        tolerance: Fraction, e.g. 0.002 = 0.2 %
+        base: What the tolerance is a share of, in the objective's units
+            (stock length of the bars for waste, total demand for surplus),
+            so a zero-waste optimum still gets its slack
+    """
+    return value + int(base * tolerance)
+
+
+def add_pattern_used(model, num_patterns, bar_terms):
+    """
+    One bool per pattern, false only if the pattern cuts no bars
+
+    Args:
+        bar_terms: j -> [(var, coeff)] bars of pattern j (see add_stock_limits)
+    """
+    pattern_used = []
+    for j in range(num_patterns):
+        used = model.NewBoolVar(f'used_{j}')
+        bar_vars, coeffs = zip(*bar_terms(j), strict=True)
+        model.Add(cp_model.LinearExpr.WeightedSum(bar_vars, coeffs) == 0).OnlyEnforceIf(used.Not())
+        pattern_used.append(used)
+    return pattern_used
+
+
+def solve_stage(model, solver, params, stage, label, hints, step, stages=None, retry=0, scale=1):
+    """
+    One lexicographic stage after the first solve
+
+    Hinted with the previous stage's values, under the stage's own time
+    limit (params[f"{step}_time_limit"], 0 = the phase time limit).
+
+    Args:
+        hints: [(var, value)] from the previous stage
+        step: "waste", "surplus" or "setup"
+        stages: Optional list, gets the stage's status, time and objective
+        scale: Objective units per published unit (see get_solve_stats)
+
+    Returns:
+        CP-SAT status; without a solution the previous stage's values stand
+    """
+    from cat_sat.services.optimization_job_service import get_progress_callback, publish_solver_result
+
+    model.ClearHints()
+    for var, value in hints:
+        model.AddHint(var, value)
+    # The previous stage's solution satisfies the new locks: nothing to repair
+    # (and CP-SAT 9.15 can abort when the hint repair hits the time limit).
+    # Probing takes most of the presolve on large pools; skip it so the
+    # stage starts from the hint and spends its budget in search
+    solver.parameters.repair_hint = False
+    solver.parameters.cp_model_probing_level = 0
+    time_limit = params.get(f"{step}_time_limit") or params.get("time_limit", 0)
+    if time_limit > 0:
+        solver.parameters.max_time_in_seconds = time_limit
+
+    callback = get_progress_callback(stage, retry, scale)
+    status = solver.Solve(model, callback)
+    publish_solver_result(stage, solver, status, retry, scale)
+    log_solve(label, solver, status, callback, "previous stage")
+    if stages is not None:
+        stages.append(dict(get_solve_stats(solver, status, scale), stage=stage))
+    return status
+
+
 @frappe.whitelist()
 def run_optimization(order_name: str):
     """Main entry point for cutting optimization"""
@@ -214,6 +750,8 @@ def run_optimization(order_name: str):
 
 def _run_optimization_impl(order_name: str):
     """Internal implementation of optimization"""
+    from cat_sat.services.optimization_job_service import publish_progress
+
     if not cp_model:
         frappe.throw("Thư viện 'ortools' chưa được cài đặt. Vui lòng cài đặt: 'pip install ortools'")
     
@@ -230,7 +768,6 @@ def _run_optimization_impl(order_name: str):
     
     # Prepare input
     stock_length = flt(order.stock_length)
-    blade_width = flt(order.blade_width or 1)
     
     # Determine trim based on mode (MCTĐ vs Laser) from settings
     if order.enable_bundling:
@@ -248,13 +785,26 @@ def _run_optimization_impl(order_name: str):
     if stock_length <= 0:
         frappe.throw("Chiều dài cây sắt phải lớn hơn 0")
     
-    effective_length = stock_length - trim
+    # Mix all stock lengths of the profile, or the order's single stock length,
+    # plus the remnants on hand (bounded, used before new bars)
+    order_stocks = []
+    if order.use_profile_stocks and order.steel_profile:
+        order_stocks = get_profile_stocks(order.steel_profile)
+    if not order_stocks:
+        order_stocks = [{"item": order.stock_item, "length_mm": stock_length, "priority": 1}]
+    if order.use_remnants and order.steel_profile:
+        from cat_sat.services.remnant_service import get_remnant_stocks
+        order_stocks += get_remnant_stocks(order.steel_profile, order.name)
+    stocks = normalize_stocks(stock_length, order_stocks)
+
+    effective_length = max(s["length_mm"] for s in stocks) - trim
     if effective_length <= 0:
         frappe.throw("Chiều dài khả dụng không đủ (Chiều dài - Tề đầu <= 0)")
     
     # Build demand map and segment info (preserving ALL metadata for traceability)
-    # CRITICAL: Use (length, segment_name) as key to avoid incorrect aggregation
-    # Segments with same length but different machining MUST be separate
+    # Demand is kept per (length, segment_name, piece_code) key so each piece keeps
+    # its machining; the solvers run over distinct lengths (group_segments_by_length)
+    # and assign_segment_keys hands the cut pieces back to these keys
     item_map = defaultdict(int)  # segment_key -> qty
     segment_info = {}  # segment_key -> full metadata dict
     piece_lengths = []  # ordered list of lengths (can have duplicates)
@@ -266,7 +816,6 @@ def _run_optimization_impl(order_name: str):
     
     if source_spec_name:
         try:
-            spec = frappe.get_doc("Cutting Specification", source_spec_name)
             source_item = frappe.db.get_value("Item", {"cutting_specification": source_spec_name}, "name") or ""
         except Exception as e:
             frappe.log_error(f"Error loading spec {source_spec_name}: {e}", "Cutting Optimization")
@@ -280,10 +829,9 @@ def _run_optimization_impl(order_name: str):
         piece_code = getattr(item, 'piece_code', '') or ''
         
         # Create unique segment key: (length, segment_name, piece_code)
-        # This ensures:
-        # 1. Segments with same length but different machining stay separate
-        # 2. Segments belonging to different pieces (PHOI) are tracked separately
-        # Each segment belongs to exactly one piece for accurate traceability
+        # Segments with the same length but different machining or piece (PHOI)
+        # get their own demand and Pattern Segments, though they share a length
+        # column in the solvers
         segment_key = (length, segment_name, piece_code)
         
         # Sum quantities for same segment_key (identical length + machining + piece)
@@ -343,6 +891,19 @@ def _run_optimization_impl(order_name: str):
     mctd_demands = [demands[i] for i in mctd_indices]
     mctd_keys = [segment_keys[i] for i in mctd_indices]
     mctd_piece_names = {segment_keys[i]: piece_names[segment_keys[i]] for i in mctd_indices}    
+    # Previous result of this order warm-starts both solvers
+    from cat_sat.services.cutting_heuristic_service import load_previous_solution
+    previous = load_previous_solution(order.name)
+
+    solver_params = get_solver_params(order)
+    solver_params_used = {}
+    run_reports = {}
+    warnings = []
+
+    # Both phases run over distinct lengths (equal-length keys would only
+    # multiply the patterns); the pieces go back to their keys afterwards
+    from cat_sat.services.segment_assignment_service import assign_segment_keys, group_segments_by_length
+
     # Run separate optimizations
     sol = []
     
@@ -355,22 +916,65 @@ def _run_optimization_impl(order_name: str):
         if laser_max_patterns <= 0:
             laser_max_patterns = 0  # No limit
         
+        # Large orders: parallel cluster solves plus a repair solve
+        from cat_sat.services.decomposition_service import get_decomposition_clusters, solve_laser_decomposed
+        laser_grouped = group_segments_by_length(
+            laser_lengths, laser_demands, laser_keys, laser_piece_names, previous.get("Laser")
+        )
+        num_clusters = get_decomposition_clusters(len(laser_grouped["piece_lengths"]))
+        laser_stats = {}
+
         try:
-            laser_sol = solve_laser_cutting_stock(
-                laser_lengths,
-                laser_demands,
-                laser_keys,  # Pass segment_keys for pattern mapping
-                laser_piece_names,
-                stock_length,
-                laser_blade,
-                trim,
-                cint(order.max_over_production or 50),
-                laser_max_patterns
-            )
+            if num_clusters > 1:
+                laser_sol = solve_laser_decomposed(
+                    laser_grouped["piece_lengths"],
+                    laser_grouped["demands"],
+                    laser_grouped["segment_keys"],
+                    laser_grouped["piece_names"],
+                    stock_length,
+                    laser_blade,
+                    trim,
+                    cint(order.max_over_production or 50),
+                    laser_max_patterns,
+                    num_clusters,
+                    previous_solution=laser_grouped["previous_solution"],
+                    solver_params=solver_params["laser"],
+                    stocks=stocks,
+                    stats=laser_stats
+                )
+            else:
+                laser_sol = solve_laser_cutting_stock(
+                    laser_grouped["piece_lengths"],
+                    laser_grouped["demands"],
+                    laser_grouped["segment_keys"],  # Pass segment_keys for pattern mapping
+                    laser_grouped["piece_names"],
+                    stock_length,
+                    laser_blade,
+                    trim,
+                    cint(order.max_over_production or 50),
+                    laser_max_patterns,
+                    previous_solution=laser_grouped["previous_solution"],
+                    solver_params=solver_params["laser"],
+                    stocks=stocks,
+                    stats=laser_stats
+                )
+            solver_params_used["laser"] = dict(solver_params["laser"], clusters=max(num_clusters, 1))
+            laser_sol = assign_segment_keys(laser_sol, laser_grouped, laser_keys, laser_demands)
             # Mark patterns as Laser-cut
             for pat in laser_sol:
                 pat['machine'] = 'Laser'
             sol.extend(laser_sol)
+            run_reports["laser"] = build_run_report(
+                laser_sol, get_bar_lower_bound(laser_lengths, laser_demands, laser_blade, trim, stocks), laser_stats
+            )
+            # The limit applies to patterns over distinct lengths; handing the
+            # pieces back to their segment keys can split some of them
+            if laser_max_patterns and len(laser_sol) > laser_max_patterns:
+                run_reports["laser"]["max_patterns"] = laser_max_patterns
+                warnings.append(
+                    f"Laser: {len(laser_sol)} pattern sau khi chia theo chi tiết, "
+                    f"vượt giới hạn {laser_max_patterns} pattern (Cutting Settings)"
+                )
         except ValueError as e:
             error_msg = str(e)
             if error_msg.startswith("no_solution:"):
@@ -410,24 +1014,47 @@ def _run_optimization_impl(order_name: str):
                 pass
         factors = sorted(set(factors), reverse=True)
         
+        mctd_stats = {}
+        mctd_grouped = group_segments_by_length(
+            mctd_lengths, mctd_demands, mctd_keys, mctd_piece_names, previous.get("MCTĐ")
+        )
         mctd_sol = solve_bundled_cutting_stock(
-            mctd_lengths,
-            mctd_demands,
-            mctd_keys,  # Pass segment_keys for pattern mapping
-            mctd_piece_names,
+            mctd_grouped["piece_lengths"],
+            mctd_grouped["demands"],
+            mctd_grouped["segment_keys"],  # Pass segment_keys for pattern mapping
+            mctd_grouped["piece_names"],
             stock_length,
             mctd_blade,
             trim,
             factors,
             cint(order.manual_cut_limit or 10),
             cint(order.max_over_production or 20),
-            max_segments
+            max_segments,
+            previous_solution=mctd_grouped["previous_solution"],
+            solver_params=solver_params["bundled"],
+            stocks=stocks,
+            stats=mctd_stats
+        )
+        solver_params_used["bundled"] = dict(solver_params["bundled"], formulation=get_bundled_formulation())
+        mctd_sol = assign_segment_keys(mctd_sol, mctd_grouped, mctd_keys, mctd_demands)
+        run_reports["bundled"] = build_run_report(
+            mctd_sol, get_bar_lower_bound(mctd_lengths, mctd_demands, mctd_blade, trim, stocks), mctd_stats
         )
         # Mark patterns as MCTĐ-cut
         for pat in mctd_sol:
             pat['machine'] = 'MCTĐ'
         sol.extend(mctd_sol)
     
+    publish_progress("saving")
+
+    # Cutting order on each machine: fewest setups, whole pieces first,
+    # or the welding sets of the Cutting Specification first
+    from cat_sat.services.cutting_sequence_service import get_piece_sets, sequence_patterns
+    piece_sets = None
+    if settings.get("cutting_sequence_priority") == "Piece Completion":
+        piece_sets = get_piece_sets(order)
+    sol = sequence_patterns(sol, piece_sets=piece_sets)
+
     # Save results with segment details
     # First, delete old Pattern Segments from database (child tables)
     old_patterns = frappe.get_all(
@@ -508,7 +1135,7 @@ def _run_optimization_impl(order_name: str):
         # waste = stock_length - used_length (this already represents unused portion)
         # The waste should be at minimum the trim cut value
         used_len = flt(pat.get('used_length', 0))
-        raw_waste = stock_length - used_len
+        raw_waste = flt(pat.get('stock_length') or stock_length) - used_len
         # Waste must be at least the trim cut amount
         actual_waste = max(raw_waste, trim)
         
@@ -534,9 +1161,16 @@ def _run_optimization_impl(order_name: str):
                     
                 segments_summary_parts.append(summary_part)
         segments_summary = ", ".join(segments_summary_parts)
+        if pat.get('shared_bundle'):
+            # Rows of one bundle whose pieces go to different segments
+            segments_summary = f"[Bó chung {pat['shared_bundle']}] {segments_summary}"
         
         pattern_row = order.append("optimization_result", {
             "machine": pat.get('machine', 'Laser'),
+            "sequence": pat.get('sequence'),
+            "stock_length": pat.get('stock_length') or stock_length,
+            "stock_item": pat.get('stock_item') or (None if pat.get('steel_remnant') else order.stock_item),
+            "steel_remnant": pat.get('steel_remnant'),
             "pattern": pattern_str,
             "segments_summary": segments_summary,
             "used_length": used_len,
@@ -575,11 +1209,29 @@ def _run_optimization_impl(order_name: str):
                 seg_doc.source_item = seg.get("source_item", "")
                 seg_doc.db_insert()
     
+    from cat_sat.services.remnant_service import get_remnant_savings
+    remnant_savings = get_remnant_savings(sol, order.steel_profile)
+
     # Generate HTML result display
     result_html = generate_result_html(
-        sol, segment_keys, piece_names, demands, stock_length, order.enable_bundling
+        sol, segment_keys, piece_names, demands, stock_length, order.enable_bundling, remnant_savings
     )
+    if warnings:
+        result_html = "".join(f'<p class="text-warning"><b>Lưu ý:</b> {w}</p>' for w in warnings) + result_html
     order.result_html = result_html
+    order.solver_params_used = json.dumps(solver_params_used, indent=2)
+
+    # Lower bound, solver bound and gap of this run
+    report = combine_run_reports(run_reports.values())
+    order.lower_bound_bars = report.get("lower_bound_bars") or 0
+    order.total_bars = report.get("bars") or 0
+    order.optimality_gap = report.get("gap_pct") or 0
+    order.solver_status = report.get("solver_status")
+    order.solver_bound = report.get("solver_bound") or 0
+    order.solver_gap = report.get("solver_gap_pct") or 0
+    if warnings:
+        report["warnings"] = warnings
+    order.optimization_report = json.dumps(dict(run_reports, order=report), indent=2)
     order.save(ignore_permissions=True)
     
     # Return JSON-serializable result (sol contains tuple keys which can't be serialized)
@@ -587,11 +1239,17 @@ def _run_optimization_impl(order_name: str):
         "success": True,
         "patterns_count": len(sol),
         "total_bars": sum(p.get("qty", 0) for p in sol),
+        "solver_params": solver_params_used,
+        "report": report,
+        "remnant_bars": remnant_savings["bars"],
+        "remnant_kg": remnant_savings["weight_kg"],
+        "warnings": warnings,
         "message": f"Tối ưu thành công: {len(sol)} patterns, {sum(p.get('qty', 0) for p in sol)} cây sắt"
     }
 
 
-def generate_result_html(patterns, segment_keys, piece_names, demands, stock_length, is_bundling=False):
+def generate_result_html(patterns, segment_keys, piece_names, demands, stock_length, is_bundling=False,
+                         remnant_savings=None):
     """
     Generate HTML display for optimization results
     
@@ -600,6 +1258,7 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
         segment_keys: List of (length, segment_name) tuples
         piece_names: Dict mapping segment_key -> display name
         demands: List of quantities needed (same order as segment_keys)
+        remnant_savings: Remnant bars used (see get_remnant_savings), shown when > 0
     
     For MCTD (bundling mode): Django app style with waste rows and bundle factor columns
     For Laser: Simple pattern table
@@ -614,7 +1273,16 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
     # Header with timestamp
     now = datetime.now()
     html_parts.append(f"<p><b>Thời gian:</b> {now.strftime('%d/%m/%Y %H:%M:%S')}</p>")
-    html_parts.append(f"<p><b>Chiều dài cây sắt:</b> {stock_length}mm</p>")
+    # Bars per stock length (patterns of a mixed-stock solve carry their own)
+    bars_by_stock = defaultdict(int)
+    for pat in patterns:
+        bars_by_stock[pat.get('stock_length') or stock_length] += pat['qty']
+    mixed_stock = len(bars_by_stock) > 1
+    if mixed_stock:
+        stock_str = ", ".join(f"{length:g}mm ({bars} cây)" for length, bars in sorted(bars_by_stock.items(), reverse=True))
+    else:
+        stock_str = f"{next(iter(bars_by_stock))}mm"
+    html_parts.append(f"<p><b>Chiều dài cây sắt:</b> {stock_str}</p>")
     
     # Calculate production totals - use segment_keys as dict keys
     production = {sk: 0 for sk in segment_keys}
@@ -644,7 +1312,8 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
     # Total stats
     total_bars = sum(pat['qty'] for pat in patterns)
     total_waste = sum(pat.get('waste', 0) * pat['qty'] for pat in patterns)
-    waste_pct = (total_waste / (stock_length * total_bars) * 100) if total_bars > 0 else 0
+    total_stock = sum(length * bars for length, bars in bars_by_stock.items())
+    waste_pct = (total_waste / total_stock * 100) if total_stock > 0 else 0
     
     # Count by type
     if is_bundling:
@@ -661,6 +1330,12 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
         html_parts.append(f"<p><b>Tổng hao hụt dài:</b> {total_waste/1000:.2f}m</p>")
         html_parts.append(f"<p><b>Hao hụt:</b> {waste_pct:.2f}%</p>")
     
+    if remnant_savings and remnant_savings["bars"]:
+        saved = f"{remnant_savings['length_m']}m"
+        if remnant_savings["weight_kg"]:
+            saved += f", {remnant_savings['weight_kg']}kg"
+        html_parts.append(f"<p><b>Dùng sắt tồn:</b> {remnant_savings['bars']} đoạn ({saved})</p>")
+
     # Detailed cutting plan table
     html_parts.append(f"<h4>KẾ HOẠCH CẮT CHI TIẾT ({len(patterns)} loại)</h4>")
     
@@ -669,7 +1344,10 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
         factors = sorted(set(pat.get('factor', 1) for pat in patterns), reverse=True)
         
         html_parts.append('<table class="table table-bordered table-sm" style="text-align:center; font-size:0.9em">')
-        html_parts.append('<thead><tr><th>STT</th><th>Hao hụt (mm)</th>')
+        html_parts.append('<thead><tr><th>STT</th>')
+        if mixed_stock:
+            html_parts.append('<th>Cây (mm)</th>')
+        html_parts.append('<th>Hao hụt (mm)</th>')
         
         for sk in segment_keys:
             length = sk[0] if isinstance(sk, tuple) else sk
@@ -688,7 +1366,10 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
             factor = pat.get('factor', 1)
             qty = pat['qty']
             
-            html_parts.append(f'<tr><td>{idx}</td><td>{waste_str}</td>')
+            html_parts.append(f'<tr><td>{idx}</td>')
+            if mixed_stock:
+                html_parts.append(f"<td>{pat.get('stock_length') or stock_length:g}</td>")
+            html_parts.append(f'<td>{waste_str}</td>')
             
             for sk in segment_keys:
                 count = pat['pattern'].get(sk, 0)
@@ -698,7 +1379,9 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
                     html_parts.append('<td></td>')
             
             for f in factors:
-                if factor == f and qty > 0:
+                if factor == f and qty > 0 and pat.get('shared_bundle'):
+                    html_parts.append(f'<td style="font-weight:bold">{qty} (bó chung {pat["shared_bundle"]})</td>')
+                elif factor == f and qty > 0:
                     html_parts.append(f'<td style="font-weight:bold">{qty}</td>')
                 else:
                     html_parts.append('<td></td>')
@@ -711,6 +1394,8 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
         # Laser format: simple pattern table
         html_parts.append('<table class="table table-bordered table-sm" style="text-align:center; font-size:0.9em">')
         html_parts.append('<thead><tr><th>STT</th>')
+        if mixed_stock:
+            html_parts.append('<th>Cây (mm)</th>')
         
         for sk in segment_keys:
             length = sk[0] if isinstance(sk, tuple) else sk
@@ -723,6 +1408,8 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
         
         for idx, pat in enumerate(patterns, 1):
             html_parts.append(f'<tr><td>{idx}</td>')
+            if mixed_stock:
+                html_parts.append(f"<td>{pat.get('stock_length') or stock_length:g}</td>")
             
             for sk in segment_keys:
                 count = pat['pattern'].get(sk, 0)
@@ -742,119 +1429,239 @@ def generate_result_html(patterns, segment_keys, piece_names, demands, stock_len
     return '\n'.join(html_parts)
 
 
-def solve_laser_cutting_stock(piece_lengths, demands, segment_keys, piece_names, stock_length, blade_width, trim, max_surplus, max_patterns=0):
+def solve_laser_cutting_stock(piece_lengths, demands, segment_keys, piece_names, stock_length, blade_width, trim, max_surplus, max_patterns=0,
+                              pattern_method=None, previous_solution=None, solver_params=None, stocks=None,
+                              stats=None):
     """
-    Laser cutting optimization with multi-objective:
-    1. Minimize total waste
-    2. Minimize total surplus
-    3. Minimize number of unique patterns (constrained by max_patterns)
+    Laser cutting optimization with lexicographic stages:
+    0. Minimize the surplus above max_surplus (0 whenever the bound can be met)
+    1. Minimize total waste (that overshoot fixed)
+    2. Minimize total surplus (waste within waste_tolerance)
+    3. Minimize number of unique patterns (surplus within surplus_tolerance),
+       each later stage with its own time limit (see get_solver_params)
     
     Args:
         piece_lengths: List of segment lengths (can have duplicates for same-length different-machining)
         demands: List of quantities needed for each segment
         segment_keys: List of (length, segment_name) tuples for pattern mapping
         piece_names: Dict mapping segment_key -> display name
-        max_patterns: Maximum number of unique patterns allowed (0 = no limit)
+        max_patterns: Maximum number of unique patterns allowed (0 = no limit),
+            a hard cap on every stage
+        pattern_method: Phase 1 method ('CP-SAT Enumeration' / 'Dynamic Programming' /
+            'Column Generation'), None = resolve from Cutting Settings
+        previous_solution: Stored Laser result of the same order, used as a
+            solution hint (see load_previous_solution)
+        solver_params: Workers, time limit, gap, seed and stage settings,
+            None = Cutting Settings (see get_solver_params)
+        stocks: Stock lengths to mix, [{"item", "length_mm", "priority"}]
+            (see normalize_stocks), None = stock_length only
+        stats: Optional dict, filled with the waste solve's status, objective,
+            bound and gap (mm of waste, see get_solve_stats) and "stages",
+            the stats of every stage
     
     Returns:
-        List of pattern dicts with 'pattern', 'qty', 'waste', 'used_length'
-        where pattern dict keys are segment_keys (length, segment_name)
+        List of pattern dicts with 'pattern', 'qty', 'waste', 'used_length',
+        'stock_length', 'stock_item' where pattern dict keys are segment_keys
     """
+    from cat_sat.services.optimization_job_service import (
+        get_progress_callback,
+        publish_progress,
+        publish_solver_result,
+    )
+
     # Phase 1: Get patterns
-    patterns = get_or_calculate_patterns(stock_length, piece_lengths, blade_width, 0.015, trim)
+    if not pattern_method:
+        pattern_method = get_pattern_generation_method(len(piece_lengths))
+    publish_progress("laser_patterns", message=pattern_method)
+
+    stocks = normalize_stocks(stock_length, stocks)
+
+    def generate(length, indices):
+        lengths = [piece_lengths[i] for i in indices]
+        if pattern_method == "Column Generation":
+            # Pool depends on demands, so it is not cached like full enumeration
+            from cat_sat.services.column_generation_service import generate_patterns_by_column_generation
+            return generate_patterns_by_column_generation(
+                length, lengths, [demands[i] for i in indices], blade_width, trim
+            )
+        return get_or_calculate_patterns(length, lengths, blade_width, 0.015, trim, method=pattern_method)
+
+    patterns, pattern_stock = generate_stock_patterns(stocks, piece_lengths, trim, generate, "Laser", max_surplus)
     
     if not patterns:
         frappe.throw("Không tìm được pattern nào phù hợp.")
     
+    publish_progress("laser_patterns", patterns=len(patterns))
+
     num_patterns = len(patterns)
     num_pieces = len(piece_lengths)
     
-    # Phase 2: Optimize distribution with auto-retry
+    # Phase 2: Optimize distribution
     # Cap upper bound to avoid INT32 overflow (max 2^31 - 1)
     MAX_INT32 = 2147483647
     total_demand = sum(demands)
     x_upper_bound = min(total_demand * 2, MAX_INT32)
     
-    production = []
-    surplus_vars = []
+    # Only non-zero counts, fed to LinearExpr.WeightedSum
+    build_start = time.perf_counter()
+    rows = build_sparse_columns(patterns, num_pieces)
+    # Waste of each pattern on its own stock length, plus the priority cost of that stock
+    stock_costs = get_stock_costs(stocks)
+    pattern_stock_lengths = [stocks[k]["length_mm"] for k in pattern_stock]
+    waste_per_pattern = [
+        int((pattern_stock_lengths[j] - obj_value + stock_costs[pattern_stock[j]]) * SCALING_FACTOR)
+        for j, (obj_value, _) in enumerate(patterns)
+    ]
     
-    # Auto-retry with increasing max_surplus if no solution found
     original_max_surplus = max_surplus
-    retry_count = 0
     max_retries = 5
+    # A minimal cover has at most total_demand bars, so no segment needs more surplus than this
+    surplus_upper_bound = [x_upper_bound * max(counts, default=0) for _, counts in rows]
     
-    while retry_count <= max_retries:
-        model = cp_model.CpModel()
-        x = [model.NewIntVar(0, x_upper_bound, f'x_{j}') for j in range(num_patterns)]
-        production = []
-        surplus_vars = []
-        
-        for i in range(num_pieces):
-            # Production = sum(pattern_count[i] * x[j]) for all patterns j
-            prod = sum(patterns[j][1][i] * x[j] for j in range(num_patterns))
-            production.append(prod)
-            
-            # Surplus variable - limited to current max_surplus
-            s = model.NewIntVar(0, max_surplus, f'surplus_{i}')
-            model.Add(s == prod - demands[i])
-            model.Add(prod >= demands[i])  # Must meet demand
-            model.Add(s <= max_surplus)  # Limit per segment
-            surplus_vars.append(s)
-        
-        # Calculate waste for each pattern (in mm, scaled)
-        waste_per_pattern = []
-        for obj_value, sol in patterns:
-            waste = stock_length - obj_value
-            waste_per_pattern.append(int(waste * SCALING_FACTOR))
-        
-        # Objective 1: Minimize total waste
-        total_waste = sum(waste_per_pattern[j] * x[j] for j in range(num_patterns))
-        model.Minimize(total_waste)
-        
-        solver = cp_model.CpSolver()
-        solver.parameters.max_time_in_seconds = 60
-        status = solver.Solve(model)
-        
-        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-            break  # Found solution
-        
-        # No solution - increase max_surplus and retry
+    # LP pre-check: raise the bound while even the LP relaxation is infeasible
+    from cat_sat.services.column_generation_service import is_surplus_bound_lp_feasible
+    retry_count = 0
+    while retry_count < max_retries and not is_surplus_bound_lp_feasible(
+        rows, num_patterns, demands, max_surplus
+    ):
         retry_count += 1
-        if retry_count <= max_retries:
-            max_surplus = max_surplus * 2  # Double the limit
-            frappe.logger().info(f"No solution with max_surplus={max_surplus//2}, retrying with {max_surplus}")
-        else:
-            raise ValueError(f"no_solution:Không tìm được phương án cắt sau {max_retries} lần thử (max_surplus cuối={max_surplus}). Kiểm tra lại dữ liệu đầu vào.")
+        max_surplus = max(max_surplus * 2, 1)
+    if retry_count:
+        frappe.logger().info(
+            f"LP relaxation infeasible with max_surplus={original_max_surplus}, using {max_surplus}"
+        )
     
-    min_waste = int(solver.ObjectiveValue())
+    model = cp_model.CpModel()
+    x = [model.NewIntVar(0, x_upper_bound, f'x_{j}') for j in range(num_patterns)]
+    surplus_vars = []
+    overshoot_vars = []
     
-    # Lock waste and minimize surplus
-    model.Add(total_waste == min_waste)
-    total_surplus = sum(surplus_vars)
-    model.Minimize(total_surplus)
+    for i in range(num_pieces):
+        # Demand is always met: sum(count_ij * x[j]) - surplus_i == demand_i
+        s = model.NewIntVar(0, surplus_upper_bound[i], f'surplus_{i}')
+        pattern_idx, counts = rows[i]
+        model.Add(
+            cp_model.LinearExpr.WeightedSum([*(x[j] for j in pattern_idx), s], [*counts, -1])
+            == demands[i]
+        )
+        surplus_vars.append(s)
+
+        # Elastic bound: surplus above max_surplus is allowed, minimized before the waste
+        o = model.NewIntVar(0, max(surplus_upper_bound[i] - max_surplus, 0), f'overshoot_{i}')
+        model.Add(o >= s - max_surplus)
+        overshoot_vars.append(o)
+
+    # Remnants on hand bound the bars cut from them
+    add_stock_limits(model, stocks, pattern_stock, lambda j: [(x[j], 1)])
     
-    # Add max_patterns constraint as simple upper bound (not a separate optimization phase)
+    # Hard cap on the distinct patterns; the pattern-count stage reuses the indicators
+    pattern_used = None
     if max_patterns > 0:
-        # Binary indicator: is pattern j used?
-        pattern_used = [model.NewBoolVar(f'used_{j}') for j in range(num_patterns)]
+        pattern_used = add_pattern_used(model, num_patterns, lambda j: [(x[j], 1)])
+        model.Add(cp_model.LinearExpr.Sum(pattern_used) <= max_patterns)
+
+    # Objective 0: Minimize overshoot; the waste stage then fixes it
+    total_waste = cp_model.LinearExpr.WeightedSum(x, waste_per_pattern)
+    total_overshoot = cp_model.LinearExpr.Sum(overshoot_vars)
+    model.Minimize(total_overshoot)
+
+    frappe.logger().info(
+        f"Laser Phase 2 model: {num_patterns} patterns x {num_pieces} segments, "
+        f"{sum(len(r[0]) for r in rows)} non-zeros, built in {time.perf_counter() - build_start:.3f}s"
+    )
+
+    # Warm start: previous result of this order topped up greedily, else greedy
+    from cat_sat.services.cutting_heuristic_service import build_pattern_hint
+    hint, hint_source = build_pattern_hint(patterns, demands, segment_keys, previous_solution, max_surplus,
+                                           pattern_stock_lengths, waste_per_pattern)
+    if hint:
         for j in range(num_patterns):
-            model.Add(x[j] >= 1).OnlyEnforceIf(pattern_used[j])
-            model.Add(x[j] == 0).OnlyEnforceIf(pattern_used[j].Not())
-        total_patterns_used = sum(pattern_used)
-        model.Add(total_patterns_used <= max_patterns)
-    
-    status = solver.Solve(model)
+            model.AddHint(x[j], min(hint[j], x_upper_bound))
+        for i in range(num_pieces):
+            pattern_idx, counts = rows[i]
+            surplus = sum(c * hint[j] for j, c in zip(pattern_idx, counts, strict=True)) - demands[i]
+            model.AddHint(surplus_vars[i], surplus)
+            model.AddHint(overshoot_vars[i], max(0, surplus - max_surplus))
+        if pattern_used is not None:
+            for j in range(num_patterns):
+                model.AddHint(pattern_used[j], hint[j] > 0)
+    
+    if solver_params is None:
+        solver_params = get_solver_params()["laser"]
+
+    solver = cp_model.CpSolver()
+    apply_solver_params(solver, solver_params)
+    solver.parameters.repair_hint = True
+    callback = get_progress_callback("laser_overshoot", retry_count)
+    status = solver.Solve(model, callback)
+    publish_solver_result("laser_overshoot", solver, status, retry_count)
+    log_solve("Laser overshoot solve", solver, status, callback, hint_source)
     
     if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
         if max_patterns > 0:
-            frappe.throw(f"Không tìm được phương án với max_patterns={max_patterns}. Thử tăng giới hạn pattern hoặc đặt = 0.")
-        else:
-            frappe.throw("Không tìm được phương án tối ưu tồn kho.")
+            raise ValueError(
+                f"no_solution:Không tìm được phương án với max_patterns={max_patterns}. "
+                "Thử tăng giới hạn pattern hoặc đặt = 0."
+            )
+        raise ValueError("no_solution:Không tìm được phương án cắt. Kiểm tra lại dữ liệu đầu vào.")
+
+    min_overshoot = sum(solver.Value(o) for o in overshoot_vars)
+    if min_overshoot:
+        frappe.logger().info(
+            f"No solution within max_surplus={max_surplus}; "
+            f"largest surplus {max(solver.Value(s) for s in surplus_vars)}"
+        )
+
+    # Later stages lock the ones before; a stage that finds no solution in
+    # its time budget leaves the previous stage's values
+    decision_vars = x + surplus_vars + overshoot_vars + (pattern_used or [])
+    values = [solver.Value(v) for v in decision_vars]
+    stages = [dict(get_solve_stats(solver, status), stage="laser_overshoot")]
+
+    # Stage 1: lock overshoot, then minimize waste
+    model.Add(total_overshoot <= min_overshoot)
+    model.Minimize(total_waste)
+    status = solve_stage(model, solver, solver_params, "laser_waste", "Laser waste solve",
+                         list(zip(decision_vars, values, strict=True)), "waste", stages, retry_count,
+                         SCALING_FACTOR)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        values = [solver.Value(v) for v in decision_vars]
+    if stats is not None:
+        stats.update({k: v for k, v in stages[-1].items() if k != "stage"})
+        stats["variables"] = len(model.Proto().variables)
+
+    # Stage 2: lock waste (within its tolerance), then minimize surplus
+    min_waste = sum(waste_per_pattern[j] * values[j] for j in range(num_patterns))
+    stock_used = sum(pattern_stock_lengths[j] * values[j] for j in range(num_patterns)) * SCALING_FACTOR
+    model.Add(total_waste <= with_tolerance(min_waste, solver_params.get("waste_tolerance", 0), stock_used))
+    total_surplus = cp_model.LinearExpr.Sum(surplus_vars)
+    model.Minimize(total_surplus)
+    status = solve_stage(model, solver, solver_params, "laser_surplus", "Laser surplus solve",
+                         list(zip(decision_vars, values, strict=True)), "surplus", stages, retry_count)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        values = [solver.Value(v) for v in decision_vars]
+
+    # Stage 3: lock surplus (within its tolerance), then minimize the distinct patterns (setups)
+    if solver_params.get("setup_time_limit", 0) > 0:
+        min_surplus = sum(values[num_patterns:num_patterns + num_pieces])
+        model.Add(total_surplus <= with_tolerance(min_surplus, solver_params.get("surplus_tolerance", 0),
+                                                  total_demand))
+        hints = list(zip(decision_vars, values, strict=True))
+        if pattern_used is None:
+            pattern_used = add_pattern_used(model, num_patterns, lambda j: [(x[j], 1)])
+            hints += [(pattern_used[j], values[j] > 0) for j in range(num_patterns)]
+        model.Minimize(cp_model.LinearExpr.Sum(pattern_used))
+        status = solve_stage(model, solver, solver_params, "laser_setups", "Laser setup solve",
+                             hints, "setup", stages, retry_count)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            values = [solver.Value(v) for v in decision_vars]
+    if stats is not None:
+        stats["stages"] = stages
     
     # Extract solution - use segment_keys as dict keys for correct mapping
     result_patterns = []
     for j in range(num_patterns):
-        qty = solver.Value(x[j])
+        qty = values[j]
         if qty > 0:
             obj_value, sol = patterns[j]
             # CRITICAL: Use segment_keys as dict keys, not just lengths
@@ -864,46 +1671,122 @@ def solve_laser_cutting_stock(piece_lengths, demands, segment_keys, piece_names,
             # obj_value includes trim, so subtract trim to get pure cuts+kerf
             # used_length = cuts + kerf only (not including trim)
             used_length = obj_value - trim
+            stock = stocks[pattern_stock[j]]
             
             result_patterns.append({
                 'pattern': pattern_dict,
                 'qty': qty,
                 'used_length': used_length,
-                'waste': stock_length - used_length  # This naturally includes trim
+                'waste': stock["length_mm"] - used_length,  # This naturally includes trim
+                'stock_length': stock["length_mm"],
+                'stock_item': stock["item"],
+                'steel_remnant': stock.get("remnant")
             })
     
     return result_patterns
 
 
+def get_bundled_formulation():
+    """
+    MCTĐ Phase 2 formulation from Cutting Settings
+
+    'Bundle Variables': one variable per pattern and bundle factor.
+    'Aggregated Bars': machine bars and manual bars per pattern, bundles split afterwards.
+    """
+    return frappe.get_single("Cutting Settings").get("mctd_formulation") or "Bundle Variables"
+
+
+def get_machine_bar_domain(machine_factors, max_bars):
+    """
+    Machine bar counts that are sums of bundle factors
+
+    Args:
+        machine_factors: Bundle factors > 1
+        max_bars: Upper bound on the bars of one pattern
+
+    Returns:
+        (unit, intervals): the factors' gcd and the representable counts in
+        units of it, as [[start, end], ...] for Domain.FromIntervals
+    """
+    if not machine_factors:
+        return 1, [[0, 0]]
+    unit = 0
+    for f in machine_factors:
+        unit = math.gcd(unit, f)
+    steps = [f // unit for f in machine_factors]
+    max_units = max(0, max_bars // unit)
+
+    # Past the Frobenius number every count is representable, so this stays a few intervals
+    reachable = [False] * (max_units + 1)
+    reachable[0] = True
+    for n in range(1, max_units + 1):
+        reachable[n] = any(n >= step and reachable[n - step] for step in steps)
+
+    intervals = []
+    for n, ok in enumerate(reachable):
+        if not ok:
+            continue
+        if intervals and intervals[-1][1] == n - 1:
+            intervals[-1][1] = n
+        else:
+            intervals.append([n, n])
+    return unit, intervals
+
+
 def solve_bundled_cutting_stock(piece_lengths, demands, segment_keys, piece_names, stock_length, blade_width, trim, 
-                                 factors, manual_cut_limit, max_over, max_segments_per_pattern=5):
+                                 factors, manual_cut_limit, max_over, max_segments_per_pattern=5,
+                                 previous_solution=None, solver_params=None, stocks=None, stats=None):
     """
     MCTĐ (Bundle cutting) optimization
     
     Phase 1: Generate patterns (max N different sizes from settings)
-    Phase 2: Optimize bundle distribution with factors
+    Phase 2: Optimize bundle distribution with factors: waste, then surplus,
+    then distinct patterns, as the stages of solve_laser_cutting_stock
     
     Args:
         piece_lengths: List of segment lengths
         demands: List of quantities needed
         segment_keys: List of (length, segment_name) tuples for pattern mapping
         piece_names: Dict mapping segment_key -> display name
+        previous_solution: Stored MCTĐ result of the same order, used as a
+            solution hint (see load_previous_solution)
+        solver_params: Workers, time limit, gap and seed, None = Cutting
+            Settings (see get_solver_params)
+        stocks: Stock lengths to mix (see solve_laser_cutting_stock)
+        stats: Optional dict, filled with the waste solve's status, objective,
+            bound and gap (mm of waste, see get_solve_stats) and "stages",
+            the stats of every stage
     """
+    from cat_sat.services.optimization_job_service import (
+        get_progress_callback,
+        publish_progress,
+        publish_solver_result,
+    )
+
     # Phase 1: Get patterns
-    patterns = get_or_calculate_patterns(stock_length, piece_lengths, blade_width, 0.015, trim)
+    publish_progress("mctd_patterns")
+
+    stocks = normalize_stocks(stock_length, stocks)
+    max_segs = max_segments_per_pattern if max_segments_per_pattern > 0 else 5
+
+    def generate(length, indices):
+        # Max N different sizes per pattern (MCTĐ machine constraint from settings), enforced while enumerating
+        return get_or_calculate_patterns(
+            length, [piece_lengths[i] for i in indices], blade_width, 0.015, trim, max_distinct=max_segs
+        )
+
+    # Phase 2 allows each segment a surplus of at least its own demand
+    patterns, pattern_stock = generate_stock_patterns(
+        stocks, piece_lengths, trim, generate, "MCTĐ", min(demands, default=0)
+    )
     
     if not patterns:
-        frappe.throw("Không tìm được pattern nào phù hợp.")
+        frappe.throw(
+            f"Không tìm được pattern nào phù hợp với tối đa {max_segs} loại đoạn mỗi cây. "
+            "Thử tăng giới hạn trong Cutting Settings."
+        )
     
-    # Filter to max N different sizes per pattern (MCTĐ machine constraint from settings)
-    max_segs = max_segments_per_pattern if max_segments_per_pattern > 0 else 5
-    if len(piece_lengths) > max_segs:
-        filtered = [
-            (obj, sol) for obj, sol in patterns
-            if sum(1 for s in sol if s > 0) <= max_segs
-        ]
-        if filtered:
-            patterns = filtered
+    publish_progress("mctd_patterns", patterns=len(patterns))
     
     num_patterns = len(patterns)
     num_pieces = len(piece_lengths)
@@ -917,88 +1800,212 @@ def solve_bundled_cutting_stock(piece_lengths, demands, segment_keys, piece_name
     
     # Filter out factor 0
     pos_factors = [f for f in factors if f > 0]
+    formulation = get_bundled_formulation()
     
-    # Variables: b[pattern][factor] = number of bundles
-    b = {}
-    for j in range(num_patterns):
-        for f in pos_factors:
-            # Upper bound estimation with INT32 cap
-            max_bundles = min(max(1, total_demand // f + 1), MAX_INT32)
-            b[(j, f)] = model.NewIntVar(0, max_bundles, f'b_{j}_{f}')
+    build_start = time.perf_counter()
+
+    rows = build_sparse_columns(patterns, num_pieces)
+    max_factor = max(pos_factors) if pos_factors else 1
+    # Relax constraint: allow more over-production with large bundle factors
+    # Each piece can have up to (max_over * max_factor) extra
+    max_surplus = [max(max_over * max_factor, demands[i]) for i in range(num_pieces)]
     
-    # Production for each piece type
-    production = []
+    # A pattern never cuts more bars than its scarcest piece can absorb; these
+    # tight bounds keep the objective within int64 (CP-SAT rejects the model otherwise)
+    bar_cap = [min(total_demand * 2, MAX_INT32)] * num_patterns
     for i in range(num_pieces):
-        terms = []
+        for j, count in zip(*rows[i], strict=True):
+            bar_cap[j] = min(bar_cap[j], (demands[i] + max_surplus[i]) // count)
+
+    # Bars of pattern j as terms [(var, coeff)]: production, waste and stock limits use them
+    if formulation == "Aggregated Bars":
+        # One machine-bars variable per pattern (in units of the factors' gcd, domain limited
+        # to sums of bundle factors) plus one manual-bars variable; bundles are split afterwards
+        machine_factors = [f for f in pos_factors if f > 1]
+        unit, intervals = get_machine_bar_domain(machine_factors, max(bar_cap))
+        machine = {}
+        if machine_factors:
+            for j in range(num_patterns):
+                cap = bar_cap[j] // unit
+                clipped = [[start, min(end, cap)] for start, end in intervals if start <= cap]
+                machine[j] = model.NewIntVarFromDomain(cp_model.Domain.FromIntervals(clipped), f'k_{j}')
+        manual = {}
+        if 1 in pos_factors:
+            manual = {j: model.NewIntVar(0, min(manual_cut_limit, bar_cap[j]), f'm_{j}') for j in range(num_patterns)}
+
+        def bar_terms(j):
+            terms = [(machine[j], unit)] if j in machine else []
+            return terms + ([(manual[j], 1)] if j in manual else [])
+        manual_vars = list(manual.values())
+    else:
+        # Variables: b[pattern][factor] = number of bundles
+        b = {}
         for j in range(num_patterns):
-            count_in_pattern = patterns[j][1][i]
-            if count_in_pattern > 0:
-                for f in pos_factors:
-                    terms.append(count_in_pattern * f * b[(j, f)])
+            for f in pos_factors:
+                b[(j, f)] = model.NewIntVar(0, bar_cap[j] // f, f'b_{j}_{f}')
         
-        if terms:
-            prod = sum(terms)
-        else:
-            prod = 0
-        production.append(prod)
+        def bar_terms(j):
+            return [(b[(j, f)], f) for f in pos_factors]
+        manual_vars = [b[(j, 1)] for j in range(num_patterns)] if 1 in pos_factors else []
     
-    # Constraints
+    # Production for each piece type, from the non-zero counts only:
+    # sum(count_ij * bars_j) - surplus_i == demand_i
     surplus_vars = []
-    max_factor = max(pos_factors) if pos_factors else 1
+    surplus_by_piece = {}
     for i in range(num_pieces):
-        if isinstance(production[i], int):
-            if production[i] < demands[i]:
+        pattern_idx, counts = rows[i]
+        if not pattern_idx:
+            if demands[i] > 0:
                 seg_name = piece_names.get(segment_keys[i], f"{piece_lengths[i]}mm")
                 frappe.throw(f"Không thể đáp ứng nhu cầu cho đoạn {seg_name}")
-        else:
-            model.Add(production[i] >= demands[i])
-            # Relax constraint: allow more over-production with large bundle factors
-            # Each piece can have up to (max_over * max_factor) extra
-            max_surplus = max(max_over * max_factor, demands[i])
-            model.Add(production[i] <= demands[i] + max_surplus)
-            
-            s = model.NewIntVar(0, max_surplus, f'surplus_{i}')
-            model.Add(s == production[i] - demands[i])
-            surplus_vars.append(s)
+            continue
+
+        s = model.NewIntVar(0, max_surplus[i], f'surplus_{i}')
+
+        prod_vars = []
+        prod_coeffs = []
+        for j, count in zip(pattern_idx, counts, strict=True):
+            for var, coeff in bar_terms(j):
+                prod_vars.append(var)
+                prod_coeffs.append(count * coeff)
+        model.Add(cp_model.LinearExpr.WeightedSum([*prod_vars, s], [*prod_coeffs, -1]) == demands[i])
+        surplus_vars.append(s)
+        surplus_by_piece[i] = s
     
     # Limit manual cuts (factor = 1)
-    if 1 in pos_factors:
-        manual_cuts = sum(b[(j, 1)] for j in range(num_patterns))
-        model.Add(manual_cuts <= manual_cut_limit)
+    if manual_vars:
+        model.Add(cp_model.LinearExpr.Sum(manual_vars) <= manual_cut_limit)
+
+    # Remnants on hand bound the bars cut from them
+    add_stock_limits(model, stocks, pattern_stock, bar_terms)
     
     # Calculate waste per pattern
-    waste_per_pattern = []
-    for obj_value, sol in patterns:
-        waste = stock_length - obj_value
-        waste_per_pattern.append(int(waste * 1000))  # Scale for integer math
-    
-    # Objective: Minimize waste (weighted by total bars used)
-    total_waste_terms = []
-    total_bars_terms = []
+    # Waste on the pattern's own stock length plus that stock's priority cost
+    stock_costs = get_stock_costs(stocks)
+    pattern_stock_lengths = [stocks[k]["length_mm"] for k in pattern_stock]
+    waste_per_pattern = [
+        round((pattern_stock_lengths[j] - obj_value + stock_costs[pattern_stock[j]]) * SCALING_FACTOR)
+        for j, (obj_value, _) in enumerate(patterns)
+    ]
+
+    # Objective: Minimize waste, then total bars (lexicographic):
+    # waste * W1 + bars * W2, where W1 exceeds any reachable bar count
+    # (every bar cuts at least one piece)
+    W1 = sum(demands) + sum(max_surplus) + 1
+    W2 = 1
+    obj_vars = []
+    obj_coeffs = []
+    waste_coeffs = []
     for j in range(num_patterns):
-        for f in pos_factors:
-            total_bars_terms.append(f * b[(j, f)])
-            total_waste_terms.append(waste_per_pattern[j] * f * b[(j, f)])
+        for var, coeff in bar_terms(j):
+            obj_vars.append(var)
+            obj_coeffs.append(waste_per_pattern[j] * coeff * W1 + coeff * W2)
+            waste_coeffs.append(waste_per_pattern[j] * coeff)
+    model.Minimize(cp_model.LinearExpr.WeightedSum(obj_vars, obj_coeffs))
+
+    frappe.logger().info(
+        f"MCTĐ Phase 2 model ({formulation}): {num_patterns} patterns x {len(pos_factors)} factors x "
+        f"{num_pieces} segments, {len(model.Proto().variables)} variables, {len(obj_vars)} "
+        f"objective terms, built in {time.perf_counter() - build_start:.3f}s"
+    )
     
-    # Multi-objective: waste * W1 + bars * W2
-    W1 = 1000000
-    W2 = 1
-    objective = sum(total_waste_terms) * W1 + sum(total_bars_terms) * W2
-    model.Minimize(objective)
+    # Warm start: bars per pattern (previous result or greedy) split into bundles
+    from cat_sat.services.cutting_heuristic_service import build_pattern_hint, decompose_into_bundles
+    hint, hint_source = build_pattern_hint(patterns, demands, segment_keys, previous_solution,
+                                           pattern_stock_lengths=pattern_stock_lengths,
+                                           waste=waste_per_pattern)
+    if hint:
+        manual_budget = manual_cut_limit
+        bars = [0] * num_patterns
+        for j in range(num_patterns):
+            bundles = decompose_into_bundles(hint[j], pos_factors, manual_budget) if hint[j] else {}
+            manual_budget -= bundles.get(1, 0)
+            bars[j] = sum(f * n for f, n in bundles.items())
+            if formulation == "Aggregated Bars":
+                if j in machine:
+                    model.AddHint(machine[j], (bars[j] - bundles.get(1, 0)) // unit)
+                if j in manual:
+                    model.AddHint(manual[j], bundles.get(1, 0))
+            else:
+                for f in pos_factors:
+                    model.AddHint(b[(j, f)], bundles.get(f, 0))
+        for i, s in surplus_by_piece.items():
+            pattern_idx, counts = rows[i]
+            model.AddHint(s, sum(c * bars[j] for j, c in zip(pattern_idx, counts, strict=True)) - demands[i])
+
+    if solver_params is None:
+        solver_params = get_solver_params()["bundled"]
     
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 60
-    solver.parameters.num_search_workers = 8
-    status = solver.Solve(model)
+    apply_solver_params(solver, solver_params)
+    solver.parameters.repair_hint = True
+    # Report progress in mm of waste (objective is waste * SCALING_FACTOR * W1 + bars)
+    callback = get_progress_callback("mctd", 0, SCALING_FACTOR * W1)
+    status = solver.Solve(model, callback)
+    publish_solver_result("mctd", solver, status, 0, SCALING_FACTOR * W1)
+    log_solve("MCTĐ solve", solver, status, callback, hint_source)
+    if stats is not None:
+        stats.update(get_solve_stats(solver, status, SCALING_FACTOR * W1))
+        stats["variables"] = len(model.Proto().variables)
     
     if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
         frappe.throw("Không tìm được phương án. Thử tăng cắt tay hoặc tồn kho cho phép.")
     
+    # Later stages lock the ones before, as in solve_laser_cutting_stock
+    decision_vars = obj_vars + surplus_vars
+    values = {v.Index(): solver.Value(v) for v in decision_vars}
+    stages = [dict(get_solve_stats(solver, status, SCALING_FACTOR * W1), stage="mctd")]
+
+    # Stage 2: lock waste (within its tolerance), then minimize surplus
+    min_waste = sum(c * values[v.Index()] for v, c in zip(obj_vars, waste_coeffs, strict=True))
+    stock_used = sum(
+        pattern_stock_lengths[j] * coeff * values[var.Index()] for j in range(num_patterns) for var, coeff in bar_terms(j)
+    ) * SCALING_FACTOR
+    model.Add(cp_model.LinearExpr.WeightedSum(obj_vars, waste_coeffs)
+              <= with_tolerance(min_waste, solver_params.get("waste_tolerance", 0), stock_used))
+    total_surplus = cp_model.LinearExpr.Sum(surplus_vars)
+    model.Minimize(total_surplus)
+    status = solve_stage(model, solver, solver_params, "mctd_surplus", "MCTĐ surplus solve",
+                         [(v, values[v.Index()]) for v in decision_vars], "surplus", stages)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        values = {v.Index(): solver.Value(v) for v in decision_vars}
+
+    # Stage 3: lock surplus (within its tolerance), then minimize the distinct patterns (setups)
+    if solver_params.get("setup_time_limit", 0) > 0:
+        min_surplus = sum(values[s.Index()] for s in surplus_vars)
+        model.Add(total_surplus <= with_tolerance(min_surplus, solver_params.get("surplus_tolerance", 0),
+                                                  total_demand))
+        pattern_used = add_pattern_used(model, num_patterns, bar_terms)
+        model.Minimize(cp_model.LinearExpr.Sum(pattern_used))
+        hints = [(v, values[v.Index()]) for v in decision_vars] + [
+            (pattern_used[j], any(values[var.Index()] for var, _ in bar_terms(j))) for j in range(num_patterns)
+        ]
+        status = solve_stage(model, solver, solver_params, "mctd_setups", "MCTĐ setup solve",
+                             hints, "setup", stages)
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            values = {v.Index(): solver.Value(v) for v in decision_vars}
+    if stats is not None:
+        stats["stages"] = stages
+
+    # Bundles per factor of each pattern
+    if formulation == "Aggregated Bars":
+        from cat_sat.services.cutting_heuristic_service import split_into_bundles
+        solution_bundles = {}
+        for j in range(num_patterns):
+            bundles = split_into_bundles(values[machine[j].Index()] * unit, machine_factors) if j in machine else {}
+            if j in manual and values[manual[j].Index()]:
+                bundles[1] = values[manual[j].Index()]
+            solution_bundles[j] = bundles
+    else:
+        solution_bundles = {
+            j: {f: values[b[(j, f)].Index()] for f in pos_factors} for j in range(num_patterns)
+        }
+
     # Extract solution - use segment_keys as dict keys
     result_patterns = []
     for j in range(num_patterns):
         for f in pos_factors:
-            num_bundles = solver.Value(b[(j, f)])
+            num_bundles = solution_bundles[j].get(f, 0)
             if num_bundles > 0:
                 obj_value, sol = patterns[j]
                 # CRITICAL: Use segment_keys as dict keys for correct mapping
@@ -1006,6 +2013,7 @@ def solve_bundled_cutting_stock(piece_lengths, demands, segment_keys, piece_name
                 
                 # obj_value includes trim, subtract it for pure cuts+kerf
                 used_length = obj_value - trim
+                stock = stocks[pattern_stock[j]]
                 
                 result_patterns.append({
                     'pattern': pattern_dict,
@@ -1013,7 +2021,10 @@ def solve_bundled_cutting_stock(piece_lengths, demands, segment_keys, piece_name
                     'factor': f,
                     'bundles': num_bundles,
                     'used_length': used_length,
-                    'waste': stock_length - used_length  # Includes trim naturally
+                    'waste': stock["length_mm"] - used_length,  # Includes trim naturally
+                    'stock_length': stock["length_mm"],
+                    'stock_item': stock["item"],
+                    'steel_remnant': stock.get("remnant")
                 })
     
     return result_patterns
@@ -3,6 +3,7 @@ Cutting Plan Service
 Updated for IEA design - uses pieces table and new field names
 """
 import frappe
+from cat_sat.services.steel_profile_service import get_items_for_profile
 
 
 def get_optimizer_input(plan_name: str) -> dict:
@@ -190,7 +191,11 @@ def create_cutting_orders(plan_name: str):
         co = frappe.new_doc("Cutting Order")
         co.cutting_plan = plan.name
         co.steel_profile = steel_profile
-        co.stock_length = 6000  # Default, should ideally come from Steel Profile
+        # Preferred bar of the profile; the optimizer mixes all of its lengths
+        stocks = get_items_for_profile(steel_profile) if steel_profile else []
+        stocks = [s for s in stocks if s.get("length_mm")]
+        co.stock_length = stocks[0]["length_mm"] if stocks else 6000
+        co.stock_item = stocks[0]["item"] if stocks else None
         co.trim_cut = default_trim  # Set default trim from settings
         
         for r in rows:
@@ -0,0 +1,236 @@
+"""
+Cutting Sequence Service
+Order the patterns of an optimization result for the cutting floor
+
+The solver returns patterns in variable order and operators start them by
+row, so consecutive rows rarely share a setup and the segments of one
+piece are spread over the whole run. sequence_patterns orders the patterns
+of each machine greedily: next comes the pattern with the fewest
+changeovers from the current one (lengths set up or taken off the stops,
+a different stock length) less the pieces (piece_code) it completes, so
+similar patterns run back to back and welding can start on whole pieces
+sooner.
+
+With cutting_sequence_priority = "Piece Completion" (Cutting Settings) the
+welding sets of the Cutting Specification lead instead: next comes the
+pattern that adds the most assemblable piece units per bar (see
+get_piece_sets), changeovers only break ties.
+
+Rows of one shared MCTĐ bundle (see assign_segment_keys) are cut together
+and stay next to each other.
+"""
+
+from collections import defaultdict
+
+import frappe
+from frappe.utils import cint, flt
+
+
+def get_segment_length(segment_key):
+    """Length of a segment key: (length, segment_name, piece_code) or a bare length"""
+    return segment_key[0] if isinstance(segment_key, tuple) else segment_key
+
+
+def get_piece_code(segment_key):
+    """Piece code of a segment key, "" for keys without one"""
+    return segment_key[2] if isinstance(segment_key, tuple) and len(segment_key) > 2 else ""
+
+
+def get_changeovers(current, candidate):
+    """
+    Setups to go from one pattern to the next
+
+    Returns:
+        Lengths added to or removed from the stops, plus 1 for a different
+        stock length; 0 for the first pattern (current None)
+    """
+    if current is None:
+        return 0
+    lengths = {get_segment_length(key) for key in current["pattern"]}
+    next_lengths = {get_segment_length(key) for key in candidate["pattern"]}
+    changeovers = len(lengths ^ next_lengths)
+    if current.get("stock_length") != candidate.get("stock_length"):
+        changeovers += 1
+    return changeovers
+
+
+def get_piece_sets(order):
+    """
+    Segments per piece of each welding piece (piece_code) of a Cutting Order
+
+    From the order's Cutting Specification, else those of the products of
+    its Cutting Plan; only details of the order's steel profile.
+
+    Returns:
+        {piece_code: {length_mm: segments per piece}}, empty without a specification
+    """
+    spec_names = [order.cutting_specification] if order.get("cutting_specification") else []
+    if not spec_names and order.get("cutting_plan"):
+        from cat_sat.services.cutting_plan_service import get_cutting_spec_for_item
+        plan_items = frappe.get_all(
+            "Cutting Plan Item",
+            filters={"parent": order.cutting_plan, "parenttype": "Cutting Plan"},
+            fields=["item_code", "cutting_specification"],
+        )
+        for row in plan_items:
+            spec_name = row.cutting_specification or get_cutting_spec_for_item(row.item_code)
+            if spec_name and spec_name not in spec_names:
+                spec_names.append(spec_name)
+
+    piece_sets = {}
+    for spec_name in spec_names:
+        spec = frappe.get_doc("Cutting Specification", spec_name)
+        pieces = defaultdict(lambda: defaultdict(int))
+        for d in spec.details:
+            if not d.bom_item or (order.steel_profile and d.steel_profile not in (None, "", order.steel_profile)):
+                continue
+            pieces[d.bom_item][flt(d.length_mm)] += cint(d.qty_per_unit) or 1
+        # A piece shared by several products has the same set in each
+        for piece_code, lengths in pieces.items():
+            piece_sets.setdefault(piece_code, dict(lengths))
+    return piece_sets
+
+
+def sequence_patterns(patterns, piece_of=get_piece_code, piece_sets=None):
+    """
+    Order patterns to minimize setups and complete pieces early
+
+    Machines run in parallel, so each machine is sequenced on its own and
+    a piece counts as complete once that machine has cut all of its
+    segments.
+
+    Args:
+        patterns: Pattern dicts with 'pattern' (segment_key -> count), 'qty',
+            'machine' and 'stock_length'
+        piece_of: segment_key -> piece code
+        piece_sets: Welding sets (see get_piece_sets) to sequence for
+            piece completion first, None = fewest setups first
+
+    Returns:
+        The patterns grouped by machine (in order of first appearance) in
+        cutting order, each with 'sequence' (1-based position on its machine)
+    """
+    by_machine = defaultdict(list)
+    for pat in patterns:
+        by_machine[pat.get("machine", "Laser")].append(pat)
+
+    result = []
+    for machine_patterns in by_machine.values():
+        if piece_sets:
+            ordered = _sequence_machine_by_pieces(machine_patterns, piece_of, piece_sets)
+        else:
+            ordered = _sequence_machine(machine_patterns, piece_of)
+        result.extend(_keep_bundles_together(ordered))
+    return result
+
+
+def _keep_bundles_together(ordered):
+    """Move the rows of each shared bundle up behind its first row and renumber"""
+    rows = []
+    placed = set()
+    for pat in ordered:
+        bundle = pat.get("shared_bundle")
+        if not bundle:
+            rows.append(pat)
+        elif bundle not in placed:
+            placed.add(bundle)
+            rows.extend(p for p in ordered if p.get("shared_bundle") == bundle)
+    return [dict(pat, sequence=n) for n, pat in enumerate(rows, 1)]
+
+
+def _sequence_machine(patterns, piece_of):
+    """Greedy sequence of one machine's patterns (see sequence_patterns)"""
+    # Segments still to cut per piece
+    left = defaultdict(int)
+    cut_by_pattern = []
+    for pat in patterns:
+        cut = defaultdict(int)
+        for key, count in pat["pattern"].items():
+            # Segments without a piece code complete nothing
+            if piece_of(key):
+                cut[piece_of(key)] += count * pat["qty"]
+        cut_by_pattern.append(cut)
+        for piece, count in cut.items():
+            left[piece] += count
+
+    def cost(j):
+        cut = cut_by_pattern[j]
+        completed = sum(1 for piece, count in cut.items() if 0 < left[piece] <= count)
+        # Then the pattern whose pieces are closest to complete, then solver order
+        return (
+            get_changeovers(current, patterns[j]) - completed,
+            sum(max(0, left[piece] - count) for piece, count in cut.items()),
+            j,
+        )
+
+    pending = list(range(len(patterns)))
+    current = None
+    ordered = []
+    while pending:
+        j = min(pending, key=cost)
+        pending.remove(j)
+        for piece, count in cut_by_pattern[j].items():
+            left[piece] -= count
+        current = patterns[j]
+        ordered.append(dict(current, sequence=len(ordered) + 1))
+    return ordered
+
+
+def _sequence_machine_by_pieces(patterns, piece_of, piece_sets):
+    """
+    Greedy sequence of one machine's patterns for piece completion
+
+    A piece's assemblable units are the minimum over its lengths of the
+    segments cut / segments per piece (only lengths cut on this machine).
+    Next comes the pattern with the largest gain in whole units per bar,
+    then in fractional units per bar (it cuts the bottleneck length), then
+    the fewest changeovers.
+    """
+    cut_by_pattern = []
+    lengths_cut = defaultdict(set)
+    for pat in patterns:
+        cut = defaultdict(int)
+        for key, count in pat["pattern"].items():
+            piece = piece_of(key)
+            if piece in piece_sets:
+                length = flt(get_segment_length(key))
+                cut[(piece, length)] += count * pat["qty"]
+                lengths_cut[piece].add(length)
+        cut_by_pattern.append(cut)
+
+    sets = {}
+    for piece, lengths in lengths_cut.items():
+        per_piece = {length: n for length, n in piece_sets[piece].items() if length in lengths}
+        if per_piece:
+            sets[piece] = per_piece
+
+    produced = defaultdict(int)
+
+    def units(piece, added=None):
+        added = added or {}
+        return min(
+            (produced[(piece, length)] + added.get((piece, length), 0)) / n
+            for length, n in sets[piece].items()
+        )
+
+    def cost(j):
+        cut = cut_by_pattern[j]
+        whole = fractional = 0
+        for piece in {piece for piece, _ in cut if piece in sets}:
+            before, after = units(piece), units(piece, cut)
+            whole += int(after) - int(before)
+            fractional += after - before
+        bars = patterns[j]["qty"] or 1
+        return (-whole / bars, -fractional / bars, get_changeovers(current, patterns[j]), j)
+
+    pending = list(range(len(patterns)))
+    current = None
+    ordered = []
+    while pending:
+        j = min(pending, key=cost)
+        pending.remove(j)
+        for piece_length, count in cut_by_pattern[j].items():
+            produced[piece_length] += count
+        current = patterns[j]
+        ordered.append(dict(current, sequence=len(ordered) + 1))
+    return ordered
@@ -0,0 +1,318 @@
+"""
+Decomposition Service
+Split a large Laser order into independent subproblems solved in parallel
+
+A 40-type order is one CP-SAT model whose Phase 1 pool and Phase 2 search
+both grow fast with the number of segment types. cluster_segments deals the
+types into clusters by length (snake draft), so every cluster keeps long
+pieces together with the short ones that fill their bars. Each cluster is
+a regular solve_laser_cutting_stock run in its own process (spawned, with
+its own site connection). A repair solve then takes the bars with the most
+waste out of the combined result and re-cuts their pieces across clusters;
+it also covers the demand of clusters that found no solution on their own
+(a small cluster of long pieces can have too few efficient patterns).
+
+The cluster processes are spawned from the optimization job, so this only
+runs on the long queue (see optimization_job_service.enqueue_optimization):
+a web request would block for the whole solve and the default queue's
+timeout is shorter than the cluster solves.
+"""
+
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import frappe
+from frappe.utils import cint
+
+
+def get_decomposition_clusters(num_pieces):
+    """
+    Number of clusters for a Laser order from Cutting Settings
+
+    Returns:
+        0 when the order is below laser_decomposition_min_types (or it is off)
+    """
+    settings = frappe.get_single("Cutting Settings")
+    min_types = cint(settings.get("laser_decomposition_min_types"))
+    if min_types <= 0 or num_pieces < min_types:
+        return 0
+    clusters = cint(settings.get("laser_decomposition_clusters") or 4)
+    # Keep at least a handful of types per cluster
+    return max(0, min(clusters, num_pieces // 5))
+
+
+def cluster_segments(piece_lengths, num_clusters):
+    """
+    Deal segment types into clusters by length in snake order
+
+    Longest first: 1..k, then k..1, ... so each cluster gets a similar spread
+    of long and short lengths and a similar total length.
+
+    Returns:
+        List of index lists into piece_lengths
+    """
+    order = sorted(range(len(piece_lengths)), key=lambda i: piece_lengths[i], reverse=True)
+    clusters = [[] for _ in range(num_clusters)]
+    for rank, i in enumerate(order):
+        lap, pos = divmod(rank, num_clusters)
+        clusters[pos if lap % 2 == 0 else num_clusters - 1 - pos].append(i)
+    return [sorted(c) for c in clusters if c]
+
+
+def _solve_cluster(site, sites_path, kwargs):
+    """
+    Process pool worker: one solve_laser_cutting_stock run with its own site connection
+
+    Returns:
+        (patterns, solve stats, elapsed); patterns is None if the cluster has
+        no solution on its own
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    try:
+        from cat_sat.services.cutting_optimization_service import solve_laser_cutting_stock
+        start = time.monotonic()
+        stats = {}
+        try:
+            result = solve_laser_cutting_stock(stats=stats, **kwargs)
+        except ValueError as e:
+            if not str(e).startswith("no_solution:"):
+                raise
+            result = None
+        return result, stats, time.monotonic() - start
+    finally:
+        frappe.destroy()
+
+
+def split_stock_limits(stocks, parts):
+    """
+    Share bounded stocks (remnants on hand) between independent solves
+
+    Returns:
+        One stocks list per part; max_qty is divided, remainder to the first
+        parts. A part can get an empty list when only bounded stocks are left;
+        None (the order's stock length) stays None for every part
+    """
+    if stocks is None:
+        return [None] * parts
+    shares = [[] for _ in range(parts)]
+    for stock in stocks:
+        for k in range(parts):
+            if stock.get("max_qty") is None:
+                shares[k].append(stock)
+                continue
+            qty = stock["max_qty"] // parts + (1 if k < stock["max_qty"] % parts else 0)
+            if qty > 0:
+                shares[k].append(dict(stock, max_qty=qty))
+    return shares
+
+
+def remaining_stock_limits(stocks, patterns):
+    """Bounded stocks less the bars already cut from them by patterns (empty when none are left)"""
+    if stocks is None:
+        return None
+    used = defaultdict(int)
+    for pat in patterns:
+        if pat.get("steel_remnant"):
+            used[pat["steel_remnant"]] += pat["qty"]
+
+    remaining = []
+    for stock in stocks:
+        if stock.get("max_qty") is None:
+            remaining.append(stock)
+        elif stock["max_qty"] > used[stock.get("remnant")]:
+            remaining.append(dict(stock, max_qty=stock["max_qty"] - used[stock.get("remnant")]))
+    return remaining
+
+
+def merge_patterns(patterns):
+    """Sum the quantities of identical patterns (same pieces on the same stock)"""
+    merged = {}
+    for pat in patterns:
+        key = (tuple(sorted(pat["pattern"].items())), pat.get("stock_length"), pat.get("steel_remnant"))
+        if key in merged:
+            merged[key]["qty"] += pat["qty"]
+        else:
+            merged[key] = dict(pat)
+    return sorted(merged.values(), key=lambda p: p["waste"])
+
+
+def solve_laser_decomposed(piece_lengths, demands, segment_keys, piece_names, stock_length, blade_width, trim,
+                           max_surplus, max_patterns=0, num_clusters=4, pattern_method=None,
+                           previous_solution=None, solver_params=None, stocks=None, stats=None):
+    """
+    Laser optimization of a large order as parallel cluster solves plus a repair solve
+
+    Arguments as solve_laser_cutting_stock. max_patterns is split evenly
+    over the clusters (the repair solve's patterns come on top). stats gets
+    the weakest status of the solves; cluster bounds do not bound the whole
+    order, so there is no solver bound. Spawns the cluster processes, so it
+    runs from the long-queue optimization job only.
+
+    Returns:
+        List of pattern dicts like solve_laser_cutting_stock
+    """
+    from cat_sat.services.cutting_optimization_service import get_solver_params
+    from cat_sat.services.optimization_job_service import publish_progress
+
+    if solver_params is None:
+        solver_params = get_solver_params()["laser"]
+
+    clusters = cluster_segments(piece_lengths, num_clusters)
+    cpu_count = os.cpu_count() or 1
+    workers = solver_params.get("workers") or cpu_count
+    cluster_params = dict(solver_params, workers=max(1, workers // len(clusters)))
+    # No more cluster processes than the cores can run with their CP-SAT workers
+    max_processes = max(1, min(len(clusters), cpu_count // cluster_params["workers"]))
+    cluster_max_patterns = max(1, max_patterns // len(clusters)) if max_patterns > 0 else 0
+
+    frappe.logger().info(
+        f"Laser decomposition: {len(piece_lengths)} segment types into {len(clusters)} clusters "
+        f"({', '.join(str(len(c)) for c in clusters)}), {cluster_params['workers']} workers each, "
+        f"{max_processes} at a time"
+    )
+
+    start = time.monotonic()
+    results = []
+    statuses = []
+    # Spawned workers: a forked child would share the parent's database connection
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_processes, mp_context=context) as pool:
+        futures = {}
+        for indices, cluster_stocks in zip(clusters, split_stock_limits(stocks, len(clusters)), strict=True):
+            if cluster_stocks == []:
+                # No stock left for this cluster: its types go to the repair solve
+                frappe.logger().info(f"Laser cluster of {len(indices)} types: no stock left, skipped")
+                continue
+            keys = [segment_keys[i] for i in indices]
+            kwargs = {
+                "piece_lengths": [piece_lengths[i] for i in indices],
+                "demands": [demands[i] for i in indices],
+                "segment_keys": keys,
+                "piece_names": {k: piece_names.get(k) for k in keys},
+                "stock_length": stock_length,
+                "blade_width": blade_width,
+                "trim": trim,
+                "max_surplus": max_surplus,
+                "max_patterns": cluster_max_patterns,
+                "pattern_method": pattern_method,
+                "previous_solution": previous_solution,
+                "solver_params": cluster_params,
+                "stocks": cluster_stocks,
+            }
+            futures[pool.submit(_solve_cluster, frappe.local.site, frappe.local.sites_path, kwargs)] = indices
+        publish_progress("laser_clusters", finished=0, total=len(futures))
+
+        for finished, future in enumerate(as_completed(futures), 1):
+            patterns, cluster_stats, elapsed = future.result()
+            statuses.append(cluster_stats.get("status"))
+            if patterns is None:
+                # Left to the repair solve, where these types can share bars with the others
+                frappe.logger().info(
+                    f"Laser cluster of {len(futures[future])} types: no solution in {elapsed:.1f}s"
+                )
+            else:
+                results.extend(patterns)
+                frappe.logger().info(
+                    f"Laser cluster of {len(futures[future])} types: {sum(p['qty'] for p in patterns)} bars "
+                    f"in {elapsed:.1f}s"
+                )
+            publish_progress("laser_clusters", finished=finished, total=len(futures))
+
+    frappe.logger().info(f"Laser clusters solved in {time.monotonic() - start:.1f}s wall time")
+
+    repair_stats = {}
+    patterns = repair_high_waste_bars(
+        results, piece_lengths, demands, segment_keys, piece_names, stock_length, blade_width, trim,
+        max_surplus, pattern_method, solver_params, stocks, repair_stats
+    )
+    if stats is not None:
+        statuses.append(repair_stats.get("status"))
+        statuses = [st for st in statuses if st]
+        stats.update({
+            "status": "OPTIMAL" if statuses and all(st == "OPTIMAL" for st in statuses) else "FEASIBLE",
+            "wall_time": round(time.monotonic() - start, 2),
+            "clusters": len(clusters),
+        })
+    return patterns
+
+
+def repair_high_waste_bars(patterns, piece_lengths, demands, segment_keys, piece_names, stock_length,
+                           blade_width, trim, max_surplus, pattern_method=None, solver_params=None,
+                           stocks=None, stats=None):
+    """
+    Re-cut the pieces of the most wasteful bars of a combined result in one solve
+
+    Patterns wasting more than the result's average share of their bar are
+    taken out; the demand they covered (net of what the kept bars already
+    produce) is solved again over all segment types, so pieces of different
+    clusters can share bars. The repair is kept only if it wastes less,
+    unless patterns leave demand uncovered (a cluster without a solution):
+    then the repair is required and its no_solution error is raised.
+    stats gets the repair solve's stats when it runs.
+    """
+    from cat_sat.services.cutting_optimization_service import solve_laser_cutting_stock
+    from cat_sat.services.optimization_job_service import publish_progress
+
+    total_stock = sum(p["qty"] * p["stock_length"] for p in patterns)
+    average_waste = sum(p["qty"] * p["waste"] for p in patterns) / total_stock if total_stock else 0
+
+    kept, removed = [], []
+    for pat in patterns:
+        (removed if pat["waste"] / pat["stock_length"] > average_waste else kept).append(pat)
+
+    covered = defaultdict(int)
+    for pat in patterns:
+        for key, count in pat["pattern"].items():
+            covered[key] += count * pat["qty"]
+    required = any(demands[i] > covered[key] for i, key in enumerate(segment_keys))
+
+    produced = defaultdict(int)
+    for pat in kept:
+        for key, count in pat["pattern"].items():
+            produced[key] += count * pat["qty"]
+    leftover = [i for i, key in enumerate(segment_keys) if demands[i] > produced[key]]
+    if not leftover or not (removed or required):
+        return merge_patterns(patterns)
+
+    repair_stocks = remaining_stock_limits(stocks, kept)
+    if repair_stocks == []:
+        if required:
+            raise ValueError("no_solution:Không còn cây sắt để cắt phần còn lại của lệnh.")
+        return merge_patterns(patterns)
+
+    publish_progress("laser_repair", patterns=len(removed))
+    removed_waste = sum(p["qty"] * p["waste"] for p in removed)
+    keys = [segment_keys[i] for i in leftover]
+    try:
+        repair = solve_laser_cutting_stock(
+            [piece_lengths[i] for i in leftover],
+            [demands[i] - produced[segment_keys[i]] for i in leftover],
+            keys,
+            {k: piece_names.get(k) for k in keys},
+            stock_length,
+            blade_width,
+            trim,
+            max_surplus,
+            pattern_method=pattern_method,
+            solver_params=solver_params,
+            stocks=repair_stocks,
+            stats=stats,
+        )
+    except Exception as e:
+        if required:
+            raise
+        frappe.logger().warning(f"Laser repair solve failed, keeping the cluster result: {e}")
+        return merge_patterns(patterns)
+
+    repair_waste = sum(p["qty"] * p["waste"] for p in repair)
+    frappe.logger().info(
+        f"Laser repair: {sum(p['qty'] for p in removed)} high-waste bars over {len(leftover)} types, "
+        f"waste {removed_waste:.0f}mm -> {repair_waste:.0f}mm"
+    )
+    if repair_waste >= removed_waste and not required:
+        return merge_patterns(patterns)
+    return merge_patterns(kept + repair)
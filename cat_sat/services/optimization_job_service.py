@@ -0,0 +1,359 @@
+"""
+Optimization Job Service
+Run cutting optimization on the `long` RQ queue and stream solver progress
+
+A long optimization (Phase 1 enumeration plus several 60s CP-SAT solves)
+must not hold a web worker. enqueue_optimization returns a job id at once;
+the job publishes realtime events to the user who started it:
+
+    cutting_optimization_progress  {key, stage, retry, objective, bound, elapsed, message}
+    cutting_optimization_done      {key, success, result | error}
+
+`key` is the Cutting Order name (form) or a random job key (portal pages),
+so a page only reacts to its own job.
+
+enqueue_plan_optimization fans a Cutting Plan out into one job per Cutting
+Order. The batch is tracked in a Redis hash; each finished order publishes
+cutting_plan_optimization_progress and the last one publishes
+cutting_plan_optimization_done with wall time vs. the sum of order times.
+"""
+
+import time
+
+import frappe
+
+try:
+    from ortools.sat.python import cp_model
+except ImportError:
+    cp_model = None
+
+OPTIMIZATION_QUEUE = "long"
+OPTIMIZATION_TIMEOUT = 3600
+
+PROGRESS_EVENT = "cutting_optimization_progress"
+DONE_EVENT = "cutting_optimization_done"
+
+# Minimum seconds between two solver progress events of one solve
+PROGRESS_INTERVAL = 1.0
+
+PLAN_PROGRESS_EVENT = "cutting_plan_optimization_progress"
+PLAN_DONE_EVENT = "cutting_plan_optimization_done"
+
+# Plan batch state in Redis: hash of order -> result, plus a finished counter
+_BATCH_KEY = "cat_sat_plan_optimization|{}"
+_BATCH_DONE_KEY = "cat_sat_plan_optimization_done|{}"
+_BATCH_TTL = 24 * 3600
+
+
+def set_progress_target(key, user=None):
+    """Route progress of the current job to `user` (None = stop publishing)"""
+    if key is None:
+        frappe.local.cutting_optimization_progress = None
+        return
+    frappe.local.cutting_optimization_progress = {
+        "key": key,
+        "user": user or frappe.session.user,
+    }
+
+
+def get_progress_target():
+    return getattr(frappe.local, "cutting_optimization_progress", None)
+
+
+def publish_progress(stage, message=None, **data):
+    """Publish one progress event if the current request/job has a target"""
+    target = get_progress_target()
+    if not target:
+        return
+    data.update({"key": target["key"], "stage": stage, "message": message})
+    frappe.publish_realtime(PROGRESS_EVENT, data, user=target["user"])
+
+
+def publish_done(result=None, error=None):
+    """Publish the final event; success waits for the job's commit"""
+    target = get_progress_target()
+    if not target:
+        return
+    data = {"key": target["key"], "success": error is None}
+    if error is None:
+        data["result"] = result
+    else:
+        data["error"] = error
+    frappe.publish_realtime(DONE_EVENT, data, user=target["user"], after_commit=error is None)
+
+
+if cp_model:
+    class SolverProgressCallback(cp_model.CpSolverSolutionCallback):
+        """Publish objective, bound and elapsed time of improving solutions (rate-limited)"""
+        def __init__(self, stage, retry=0, scale=1):
+            cp_model.CpSolverSolutionCallback.__init__(self)
+            self._stage = stage
+            self._retry = retry
+            self._scale = scale
+            self._last_sent = 0.0
+            self.first_solution_time = None
+
+        def on_solution_callback(self):
+            if self.first_solution_time is None:
+                self.first_solution_time = self.WallTime()
+            if not get_progress_target():
+                return
+            now = time.monotonic()
+            if now - self._last_sent < PROGRESS_INTERVAL:
+                return
+            self._last_sent = now
+            publish_progress(
+                self._stage,
+                retry=self._retry,
+                objective=self.ObjectiveValue() / self._scale,
+                bound=self.BestObjectiveBound() / self._scale,
+                elapsed=round(self.WallTime(), 1),
+            )
+
+
+def get_progress_callback(stage, retry=0, scale=1):
+    """
+    Solution callback for CpSolver.Solve (records time to first solution;
+    publishes only when the current job has a progress target)
+
+    Args:
+        stage: Stage name shown by the client (e.g. 'laser_waste')
+        retry: Retry number of the surrounding loop
+        scale: Divide objective/bound by this before publishing
+    """
+    if not cp_model:
+        return None
+    return SolverProgressCallback(stage, retry, scale)
+
+
+def publish_solver_result(stage, solver, status, retry=0, scale=1):
+    """Final progress event of a solve (the callback may have skipped it)"""
+    if not get_progress_target():
+        return
+    data = {"retry": retry, "elapsed": round(solver.WallTime(), 1), "status": solver.StatusName(status)}
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        data["objective"] = solver.ObjectiveValue() / scale
+        data["bound"] = solver.BestObjectiveBound() / scale
+    publish_progress(stage, **data)
+
+
+@frappe.whitelist()
+def enqueue_optimization(order_name: str):
+    """
+    Queue run_optimization for a Cutting Order on the long queue
+
+    Returns:
+        dict with job_id and the key used in realtime events
+    """
+    order = frappe.get_doc("Cutting Order", order_name)
+    order.check_permission("write")
+
+    if order.docstatus == 1:
+        frappe.throw("Không thể tối ưu hóa Lệnh cắt đã Submit. Vui lòng Cancel và Amend để chỉnh sửa.")
+
+    job_id = f"cutting_optimization::{order_name}"
+    job = frappe.enqueue(
+        "cat_sat.services.optimization_job_service.run_optimization_job",
+        queue=OPTIMIZATION_QUEUE,
+        timeout=OPTIMIZATION_TIMEOUT,
+        job_id=job_id,
+        deduplicate=True,
+        order_name=order_name,
+        user=frappe.session.user,
+    )
+    if not job:
+        frappe.throw(f"Lệnh cắt {order_name} đang được tối ưu, vui lòng chờ kết quả.")
+
+    return {"queued": True, "job_id": job.id, "key": order_name}
+
+
+def run_optimization_job(order_name, user=None):
+    """Background worker for enqueue_optimization"""
+    from cat_sat.services.cutting_optimization_service import run_optimization
+
+    set_progress_target(order_name, user)
+    try:
+        result = run_optimization(order_name)
+        publish_done(result)
+        return result
+    except Exception as e:
+        frappe.db.rollback()
+        publish_done(error=str(e))
+        raise
+    finally:
+        set_progress_target(None)
+
+
+def enqueue_portal_optimization(method, data):
+    """
+    Queue a portal optimization (run_laser/run_mctd) and return its key
+
+    Args:
+        method: Dotted path of the synchronous portal function
+        data: JSON payload passed through unchanged
+    """
+    key = frappe.generate_hash(length=12)
+    job = frappe.enqueue(
+        "cat_sat.services.optimization_job_service.run_portal_optimization_job",
+        queue=OPTIMIZATION_QUEUE,
+        timeout=OPTIMIZATION_TIMEOUT,
+        method=method,
+        data=data,
+        key=key,
+        user=frappe.session.user,
+    )
+    return {"success": True, "queued": True, "job_id": job.id if job else None, "key": key}
+
+
+def run_portal_optimization_job(method, data, key, user=None):
+    """Background worker for portal optimizations; the result travels in the done event"""
+    set_progress_target(key, user)
+    try:
+        result = frappe.get_attr(method)(data)
+        publish_done(result)
+        return result
+    except Exception as e:
+        publish_done(error=str(e))
+        raise
+    finally:
+        set_progress_target(None)
+
+
+@frappe.whitelist()
+def enqueue_plan_optimization(plan_name: str):
+    """
+    Queue one optimization job per open Cutting Order of a plan
+
+    Orders run concurrently on the available `long` workers, so the plan
+    finishes in about the time of its slowest order.
+
+    Returns:
+        dict with batch id and the queued order names
+    """
+    plan = frappe.get_doc("Cutting Plan", plan_name)
+    plan.check_permission("write")
+
+    orders = frappe.get_all(
+        "Cutting Order",
+        filters={"cutting_plan": plan_name, "docstatus": 0, "status": ["!=", "Completed"]},
+        pluck="name",
+        order_by="name",
+    )
+    if not orders:
+        frappe.throw("Kế hoạch cắt chưa có Lệnh cắt nào cần tối ưu.")
+
+    batch_id = frappe.generate_hash(length=12)
+    cache = frappe.cache()
+    batch_key = _BATCH_KEY.format(batch_id)
+    cache.hset(batch_key, "__meta__", {
+        "plan": plan_name,
+        "orders": orders,
+        "started": time.time(),
+        "user": frappe.session.user,
+    })
+    cache.expire(cache.make_key(batch_key), _BATCH_TTL)
+
+    queued, skipped = [], []
+    for order_name in orders:
+        job = frappe.enqueue(
+            "cat_sat.services.optimization_job_service.run_plan_order_job",
+            queue=OPTIMIZATION_QUEUE,
+            timeout=OPTIMIZATION_TIMEOUT,
+            job_id=f"cutting_optimization::{order_name}",
+            deduplicate=True,
+            order_name=order_name,
+            batch_id=batch_id,
+            user=frappe.session.user,
+        )
+        if job:
+            queued.append(order_name)
+        else:
+            # Already optimizing from the form; count it as not part of this batch
+            skipped.append(order_name)
+            _finish_plan_order(batch_id, order_name, {
+                "success": False, "elapsed": 0, "error": "Đang được tối ưu ở tiến trình khác",
+            })
+
+    return {"batch_id": batch_id, "orders": orders, "queued": queued, "skipped": skipped}
+
+
+def run_plan_order_job(order_name, batch_id, user=None):
+    """Background worker for one order of enqueue_plan_optimization"""
+    from cat_sat.services.cutting_optimization_service import run_optimization
+
+    set_progress_target(order_name, user)
+    start = time.monotonic()
+    try:
+        result = run_optimization(order_name)
+        if result.get("error"):
+            outcome = {"success": False, "error": result.get("message")}
+        else:
+            outcome = {
+                "success": True,
+                "patterns": result.get("patterns_count"),
+                "bars": result.get("total_bars"),
+                "remnant_kg": result.get("remnant_kg") or 0,
+            }
+        publish_done(result)
+    except Exception as e:
+        frappe.db.rollback()
+        outcome = {"success": False, "error": str(e)}
+        publish_done(error=str(e))
+    finally:
+        set_progress_target(None)
+
+    # Commit the order before the plan sees it as finished
+    frappe.db.commit()
+    outcome["elapsed"] = round(time.monotonic() - start, 2)
+    _finish_plan_order(batch_id, order_name, outcome)
+
+
+def _finish_plan_order(batch_id, order_name, outcome):
+    """Record one order's outcome; the last order of the batch publishes the summary"""
+    cache = frappe.cache()
+    batch_key = _BATCH_KEY.format(batch_id)
+    meta = cache.hget(batch_key, "__meta__")
+    if not meta:
+        return
+
+    cache.hset(batch_key, order_name, outcome)
+    done_key = cache.make_key(_BATCH_DONE_KEY.format(batch_id))
+    finished = cache.incrby(done_key, 1)
+    cache.expire(done_key, _BATCH_TTL)
+
+    total = len(meta["orders"])
+    frappe.publish_realtime(PLAN_PROGRESS_EVENT, {
+        "plan": meta["plan"],
+        "batch_id": batch_id,
+        "order": order_name,
+        "finished": finished,
+        "total": total,
+        **outcome,
+    }, user=meta["user"])
+
+    if finished < total:
+        return
+
+    # incrby is atomic, so exactly one job reaches the total.
+    # RedisWrapper.hgetall returns bytes field names
+    results = {
+        key.decode() if isinstance(key, bytes) else key: value
+        for key, value in cache.hgetall(batch_key).items()
+    }
+    results.pop("__meta__", None)
+    wall_time = time.time() - meta["started"]
+    sum_time = sum(r.get("elapsed", 0) for r in results.values())
+    remnant_kg = sum(r.get("remnant_kg", 0) for r in results.values())
+
+    frappe.logger().info(
+        f"Plan {meta['plan']} optimized: {total} orders, wall {wall_time:.1f}s, "
+        f"sum of orders {sum_time:.1f}s, speedup {sum_time / wall_time if wall_time else 0:.1f}x"
+    )
+    frappe.publish_realtime(PLAN_DONE_EVENT, {
+        "plan": meta["plan"],
+        "batch_id": batch_id,
+        "wall_time": round(wall_time, 1),
+        "sum_time": round(sum_time, 1),
+        "remnant_kg": round(remnant_kg, 2),
+        "results": results,
+    }, user=meta["user"])
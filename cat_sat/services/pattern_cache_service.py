@@ -0,0 +1,671 @@
+"""
+Pattern Cache Service
+Versioned binary store for Phase 1 patterns
+
+Entries are keyed by the sorted segment lengths and store count columns in
+that canonical order (version 2); callers remap to their own row order.
+File names are patterns_<family>_<lengths>.bin, where the family hash
+covers (stock_length, blade_width, trim) and the MCTĐ limit on different
+segment types per pattern, if any. All entries of one family form
+the index used to answer a request from a cached superset of lengths;
+each process keeps that index (the headers of the family's files) in
+memory, rebuilt only after a write or prune bumped the family's
+generation counter in Redis.
+
+Each cache entry is one file:
+    magic (8 bytes) | header length (uint32 LE) | JSON header (padded)
+    | counts matrix (num_patterns x num_pieces, int16/int32)
+    | used-length vector (num_patterns, float64)
+
+The arrays start on a 64-byte boundary and are read with np.fromfile in one
+pass each, so a load costs a single read instead of unpickling one Python
+object per count. Phase 2 works on lists: patterns_from_arrays converts
+the arrays once per lookup. Files with a different schema version are
+treated as stale and rebuilt; files that fail to parse are logged and
+removed instead of being ignored.
+
+Every hit touches the file mtime, which is the last-access time used for
+LRU eviction down to the size cap in Cutting Settings (daily job and
+`bench cat-sat-pattern-cache --prune`).
+
+Lookups go through two in-memory tiers before the disk (load_pattern_store):
+    1. per-process LRU of decoded arrays, keyed by site + entry file name
+       (the name already encodes the canonical length hash)
+    2. zlib-compressed file image in Redis (frappe.cache()), shared by all
+       gunicorn workers and RQ jobs, expiring after REDIS_CACHE_TTL
+Entries are immutable for a given name and version, so the tiers never
+need invalidation; pruning the disk only drops the cold copy.
+"""
+
+import glob
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+import frappe
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bump when the on-disk layout or column semantics change
+PATTERN_STORE_VERSION = 2
+
+PATTERN_STORE_MAGIC = b"CATSATPS"
+PATTERN_STORE_EXTENSION = ".bin"
+
+_ALIGNMENT = 64
+_USED_DTYPE = "<f8"
+
+# Hit/miss counters kept in Redis so all workers report together.
+# "hit" counts every exact hit; hit_memory/hit_redis split out the warm tiers.
+CACHE_STAT_EVENTS = ("hit", "hit_memory", "hit_redis", "superset", "miss")
+_STAT_KEY = "cat_sat_pattern_cache_{}"
+
+# Leftover temp files from interrupted writes are removed after this age
+_TMP_MAX_AGE_SECONDS = 3600
+
+# Level 1: decoded arrays per process (LRU, bounded by array bytes)
+MEMORY_CACHE_MAX_MB = 128
+
+# Level 2: compressed file images in Redis, kept for about one shift
+REDIS_CACHE_TTL = 12 * 3600
+REDIS_ENTRY_MAX_MB = 32
+_REDIS_KEY = "cat_sat_pattern_store|v{}|{}"
+
+# Warm hits refresh the disk LRU time at most this often per process
+_TOUCH_INTERVAL_SECONDS = 3600
+
+# Generation of a family's header index, bumped on every write and removal
+_INDEX_GENERATION_KEY = "cat_sat_pattern_index|v{}|{}"
+
+_memory_cache = OrderedDict()  # key -> [used, counts, header, nbytes, last_touch]
+_family_indexes = {}  # site|family -> (generation, {file name: header})
+_memory_cache_bytes = 0
+_memory_lock = threading.Lock()
+_known_folders = set()
+
+
+def get_cache_folder():
+    """Folder holding pattern cache files for the current site"""
+    cache_folder = os.path.join(frappe.get_site_path(), "private", "cutting_patterns_cache")
+    if cache_folder not in _known_folders:
+        os.makedirs(cache_folder, exist_ok=True)
+        _known_folders.add(cache_folder)
+    return cache_folder
+
+
+def write_pattern_store(path, patterns, params=None):
+    """
+    Write patterns to a binary store file (atomic replace)
+
+    Args:
+        path: Target file path
+        patterns: List of (obj_value, solution) tuples
+        params: JSON-serializable dict describing the inputs (stored in header);
+            piece_lengths are the canonical (sorted, scaled) lengths
+
+    Returns:
+        The file image that was written
+    """
+    num_patterns = len(patterns)
+    num_pieces = len(patterns[0][1]) if num_patterns else 0
+
+    counts = np.asarray([sol for _, sol in patterns], dtype=np.int64).reshape(num_patterns, num_pieces)
+    used = np.asarray([obj for obj, _ in patterns], dtype=_USED_DTYPE)
+
+    max_count = int(counts.max()) if counts.size else 0
+    count_dtype = "<i2" if max_count <= np.iinfo(np.int16).max else "<i4"
+
+    header = {
+        "version": PATTERN_STORE_VERSION,
+        "count_dtype": count_dtype,
+        "num_patterns": num_patterns,
+        "num_pieces": num_pieces,
+        "params": params or {},
+    }
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+
+    prefix_len = len(PATTERN_STORE_MAGIC) + 4
+    padded_len = -(-(prefix_len + len(header_bytes)) // _ALIGNMENT) * _ALIGNMENT - prefix_len
+    header_bytes = header_bytes.ljust(padded_len, b" ")
+
+    image = b"".join([
+        PATTERN_STORE_MAGIC,
+        struct.pack("<I", len(header_bytes)),
+        header_bytes,
+        np.ascontiguousarray(counts, dtype=count_dtype).tobytes(),
+        used.tobytes(),
+    ])
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image)
+    os.replace(tmp_path, path)
+    update_family_index(path, header)
+
+    return image
+
+
+def read_pattern_header(path):
+    """
+    Read and validate the header of a store file
+
+    Returns:
+        (header dict, data offset) or None if the file is missing, corrupt or stale
+    """
+    try:
+        with open(path, "rb") as f:
+            magic = f.read(len(PATTERN_STORE_MAGIC))
+            if magic != PATTERN_STORE_MAGIC:
+                raise ValueError("bad magic")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        _discard(path, f"corrupt header ({e})")
+        return None
+
+    if header.get("version") != PATTERN_STORE_VERSION:
+        _discard(path, f"stale schema version {header.get('version')} != {PATTERN_STORE_VERSION}")
+        return None
+
+    return header, len(PATTERN_STORE_MAGIC) + 4 + header_len
+
+
+def read_pattern_store(path):
+    """
+    Read the arrays of a store file
+
+    Returns:
+        (used, counts, header) or None if the file is missing, corrupt or stale
+    """
+    result = read_pattern_header(path)
+    if not result:
+        return None
+    header, offset = result
+
+    try:
+        num_patterns = int(header["num_patterns"])
+        num_pieces = int(header["num_pieces"])
+        count_dtype = np.dtype(header["count_dtype"])
+
+        counts_size = num_patterns * num_pieces * count_dtype.itemsize
+        expected_size = offset + counts_size + num_patterns * np.dtype(_USED_DTYPE).itemsize
+        if os.path.getsize(path) != expected_size:
+            raise ValueError(f"size {os.path.getsize(path)} != {expected_size}")
+
+        if not num_patterns:
+            return np.zeros(0, dtype=_USED_DTYPE), np.zeros((0, num_pieces), dtype=count_dtype), header
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            counts = np.fromfile(f, dtype=count_dtype, count=num_patterns * num_pieces)
+            used = np.fromfile(f, dtype=_USED_DTYPE, count=num_patterns)
+        counts = counts.reshape(num_patterns, num_pieces)
+    except Exception as e:
+        _discard(path, f"corrupt data ({e})")
+        return None
+
+    return used, counts, header
+
+
+def _parse_store_image(image):
+    """
+    Decode a complete file image held in memory
+
+    Returns:
+        (used, counts, header); raises ValueError if the image is not valid
+    """
+    prefix_len = len(PATTERN_STORE_MAGIC) + 4
+    if image[:len(PATTERN_STORE_MAGIC)] != PATTERN_STORE_MAGIC:
+        raise ValueError("bad magic")
+    (header_len,) = struct.unpack("<I", image[len(PATTERN_STORE_MAGIC):prefix_len])
+    header = json.loads(image[prefix_len:prefix_len + header_len].decode("utf-8"))
+    if header.get("version") != PATTERN_STORE_VERSION:
+        raise ValueError(f"schema version {header.get('version')}")
+
+    offset = prefix_len + header_len
+    num_patterns = int(header["num_patterns"])
+    num_pieces = int(header["num_pieces"])
+    count_dtype = np.dtype(header["count_dtype"])
+    counts_size = num_patterns * num_pieces * count_dtype.itemsize
+    if len(image) != offset + counts_size + num_patterns * np.dtype(_USED_DTYPE).itemsize:
+        raise ValueError("size mismatch")
+
+    counts = np.frombuffer(image, dtype=count_dtype, count=num_patterns * num_pieces, offset=offset)
+    used = np.frombuffer(image, dtype=_USED_DTYPE, count=num_patterns, offset=offset + counts_size)
+    return used, counts.reshape(num_patterns, num_pieces), header
+
+
+def _entry_key(path):
+    return f"{getattr(frappe.local, 'site', '')}|{os.path.basename(path)}"
+
+
+def _remember(key, used, counts, header, touched):
+    """Put decoded arrays into the per-process LRU"""
+    global _memory_cache_bytes
+
+    nbytes = used.nbytes + counts.nbytes
+    limit = MEMORY_CACHE_MAX_MB * 1024 * 1024
+    if nbytes > limit:
+        return
+
+    with _memory_lock:
+        old = _memory_cache.pop(key, None)
+        if old:
+            _memory_cache_bytes -= old[3]
+        _memory_cache[key] = [used, counts, header, nbytes, touched]
+        _memory_cache_bytes += nbytes
+        while _memory_cache_bytes > limit and _memory_cache:
+            _, evicted = _memory_cache.popitem(last=False)
+            _memory_cache_bytes -= evicted[3]
+
+
+def _publish(path, image):
+    """Share a file image with other processes through Redis"""
+    try:
+        data = zlib.compress(image, 1)
+        if len(data) > REDIS_ENTRY_MAX_MB * 1024 * 1024:
+            return
+        cache = frappe.cache()
+        cache.set(cache.make_key(_REDIS_KEY.format(PATTERN_STORE_VERSION, os.path.basename(path))),
+                  data, ex=REDIS_CACHE_TTL)
+    except Exception as e:
+        frappe.logger().warning(f"Pattern cache {os.path.basename(path)} not shared via Redis: {e}")
+
+
+def _fetch(path):
+    """Compressed file image from Redis, or None"""
+    try:
+        cache = frappe.cache()
+        data = cache.get(cache.make_key(_REDIS_KEY.format(PATTERN_STORE_VERSION, os.path.basename(path))))
+        return zlib.decompress(data) if data else None
+    except Exception:
+        return None
+
+
+def load_pattern_store(path):
+    """
+    Look an entry up in process memory, then Redis, then on disk
+
+    Warm hits do not read the file; the disk LRU time is refreshed at most
+    once per _TOUCH_INTERVAL_SECONDS so hot entries are not pruned.
+
+    Returns:
+        (used, counts, header, tier) with tier "memory", "redis" or "disk",
+        or None if the entry does not exist
+    """
+    key = _entry_key(path)
+    now = time.time()
+
+    with _memory_lock:
+        entry = _memory_cache.get(key)
+        if entry:
+            _memory_cache.move_to_end(key)
+            touch = now - entry[4] > _TOUCH_INTERVAL_SECONDS
+            if touch:
+                entry[4] = now
+    if entry:
+        if touch:
+            touch_pattern_store(path)
+        return entry[0], entry[1], entry[2], "memory"
+
+    image = _fetch(path)
+    if image:
+        try:
+            used, counts, header = _parse_store_image(image)
+        except Exception:
+            used = None
+        if used is not None:
+            touch_pattern_store(path)
+            _remember(key, used, counts, header, now)
+            return used, counts, header, "redis"
+
+    stored = read_pattern_store(path)
+    if not stored:
+        return None
+    used, counts, header = stored
+    touch_pattern_store(path)
+
+    _remember(key, used, counts, header, now)
+    try:
+        with open(path, "rb") as f:
+            _publish(path, f.read())
+    except OSError:
+        pass
+    return used, counts, header, "disk"
+
+
+def save_pattern_store(path, patterns, params=None):
+    """Write an entry to disk and prime the memory and Redis tiers"""
+    image = write_pattern_store(path, patterns, params)
+    used, counts, header = _parse_store_image(image)
+    _remember(_entry_key(path), used, counts, header, time.time())
+    _publish(path, image)
+
+
+def _family_of(path):
+    """Family hash from an entry file name (patterns_<family>_<lengths>.bin)"""
+    name = os.path.basename(path)
+    if not (name.startswith("patterns_") and name.endswith(PATTERN_STORE_EXTENSION)):
+        return None
+    return name[len("patterns_"):].split("_", 1)[0]
+
+
+def _index_generation(family):
+    """Current generation of a family's index in Redis (None if Redis is unavailable)"""
+    try:
+        cache = frappe.cache()
+        return int(cache.get(cache.make_key(_INDEX_GENERATION_KEY.format(PATTERN_STORE_VERSION, family))) or 0)
+    except Exception:
+        return None
+
+
+def _bump_generation(family):
+    """Invalidate a family's index in every process; the new generation, None if Redis is unavailable"""
+    try:
+        cache = frappe.cache()
+        return int(cache.incrby(cache.make_key(_INDEX_GENERATION_KEY.format(PATTERN_STORE_VERSION, family)), 1))
+    except Exception:
+        return None
+
+
+def update_family_index(path, header=None):
+    """
+    Record a written (header) or removed (None) entry in its family's index
+
+    Other processes rebuild their index on the next lookup. This process
+    updates its own in place unless another one changed the family since
+    the index was built.
+    """
+    family = _family_of(path)
+    if not family:
+        return
+    generation = _bump_generation(family)
+    key = f"{getattr(frappe.local, 'site', '')}|{family}"
+    with _memory_lock:
+        cached = _family_indexes.pop(key, None)
+        if not cached:
+            return
+        # No other change since the build: apply this one in place
+        in_step = cached[0] is None if generation is None else cached[0] == generation - 1
+        if in_step:
+            index = cached[1]
+            if header is None:
+                index.pop(os.path.basename(path), None)
+            else:
+                index[os.path.basename(path)] = header
+            _family_indexes[key] = (generation, index)
+
+
+def get_family_index(family):
+    """
+    Headers of all entries of a family, by file name
+
+    Read from disk once per process and generation; without Redis the index
+    only follows this process's own writes and removals.
+    """
+    key = f"{getattr(frappe.local, 'site', '')}|{family}"
+    # Read the generation first: a write while the index is built bumps it again
+    generation = _index_generation(family)
+    with _memory_lock:
+        cached = _family_indexes.get(key)
+    if cached and (generation is None or cached[0] == generation):
+        return cached[1]
+
+    index = {}
+    for path in glob.glob(os.path.join(get_cache_folder(), f"patterns_{family}_*{PATTERN_STORE_EXTENSION}")):
+        result = read_pattern_header(path)
+        if result:
+            index[os.path.basename(path)] = result[0]
+    with _memory_lock:
+        _family_indexes[key] = (generation, index)
+    return index
+
+
+def find_superset_patterns(family, canonical, min_used, scaling_factor):
+    """
+    Answer "patterns over these lengths" from a cached superset entry
+
+    A complete enumeration over a superset of lengths contains every pattern
+    over the subset: those are exactly its rows that use none of the extra
+    columns. The superset must have been built with a minimum fill no higher
+    than ours; its rows are then filtered down to our own minimum fill.
+
+    Args:
+        family: Family hash of (stock_length, blade_width, trim[, max_distinct])
+        canonical: Sorted integer-scaled lengths requested
+        min_used: Scaled minimum material a pattern must use (incl. trim)
+        scaling_factor: Length scaling used for the integer values
+
+    Returns:
+        (used, counts, source file name) with counts in canonical order, or None
+    """
+    wanted = Counter(canonical)
+    best = None
+
+    folder = get_cache_folder()
+    for name, header in get_family_index(family).items():
+        path = os.path.join(folder, name)
+        params = header.get("params") or {}
+        lengths = params.get("piece_lengths") or []
+
+        if not params.get("complete") or params.get("min_used") is None:
+            continue
+        if params["min_used"] > min_used or len(lengths) < len(canonical):
+            continue
+        if Counter(lengths) & wanted != wanted:
+            continue
+        if best is None or header["num_patterns"] < best[1]["num_patterns"]:
+            best = (path, header, lengths)
+
+    if not best:
+        return None
+
+    path, _, lengths = best
+    stored = load_pattern_store(path)
+    if not stored:
+        return None
+    used, counts = stored[0], stored[1]
+
+    # Map each requested column to a distinct superset column of equal length
+    available = {}
+    for col, length in enumerate(lengths):
+        available.setdefault(length, []).append(col)
+    mapped = [available[length].pop(0) for length in canonical]
+    extra = [col for cols in available.values() for col in cols]
+
+    used_int = np.rint(np.asarray(used) * scaling_factor).astype(np.int64)
+    keep = used_int >= min_used
+    if extra:
+        keep &= ~np.asarray(counts[:, extra]).any(axis=1)
+
+    return np.asarray(used[keep]), np.asarray(counts[keep][:, mapped]), os.path.basename(path)
+
+
+def patterns_from_arrays(used, counts):
+    """Convert store arrays back to the (obj_value, solution) list used by Phase 2"""
+    return list(zip(used.tolist(), counts.tolist(), strict=True))
+
+
+def _discard(path, reason):
+    frappe.logger().warning(f"Pattern cache {os.path.basename(path)} discarded: {reason}")
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    update_family_index(path)
+
+
+def touch_pattern_store(path):
+    """Mark an entry as used now (mtime is the LRU access time)"""
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def record_cache_event(event):
+    """Count a cache lookup outcome (one of CACHE_STAT_EVENTS)"""
+    try:
+        cache = frappe.cache()
+        cache.incrby(cache.make_key(_STAT_KEY.format(event)), 1)
+    except Exception:
+        pass  # Statistics must never break an optimization
+
+
+def get_cache_counters():
+    """Current hit/miss counters from Redis"""
+    counters = {}
+    cache = frappe.cache()
+    for event in CACHE_STAT_EVENTS:
+        try:
+            value = cache.get(cache.make_key(_STAT_KEY.format(event)))
+            counters[event] = int(value or 0)
+        except Exception:
+            counters[event] = 0
+    return counters
+
+
+def _list_entries():
+    """(path, size, mtime) of every pattern store file, oldest access first"""
+    entries = []
+    for path in glob.glob(os.path.join(get_cache_folder(), f"patterns_*{PATTERN_STORE_EXTENSION}")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((path, st.st_size, st.st_mtime))
+    entries.sort(key=lambda e: e[2])
+    return entries
+
+
+def get_pattern_cache_stats(limit=10):
+    """
+    Size, hit rate and largest entries of the pattern cache
+
+    Returns:
+        dict with entry count, total size, counters, hit rate and the
+        `limit` largest entries
+    """
+    entries = _list_entries()
+    counters = get_cache_counters()
+    hits = counters["hit"] + counters["superset"]
+    lookups = hits + counters["miss"]
+
+    largest = []
+    for path, size, mtime in sorted(entries, key=lambda e: e[1], reverse=True)[:limit]:
+        result = read_pattern_header(path)
+        header = result[0] if result else {}
+        params = header.get("params") or {}
+        largest.append({
+            "file": os.path.basename(path),
+            "size_mb": round(size / 1024 / 1024, 2),
+            "patterns": header.get("num_patterns", 0),
+            "lengths": header.get("num_pieces", 0),
+            "stock_length": params.get("stock_length"),
+            "last_access": time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime)),
+        })
+
+    folder = get_cache_folder()
+    return {
+        "folder": folder,
+        "entries": len(entries),
+        "size_mb": round(sum(e[1] for e in entries) / 1024 / 1024, 2),
+        "legacy_files": len(glob.glob(os.path.join(folder, "patterns_*.pkl"))),
+        "counters": counters,
+        "hit_rate": round(hits / lookups * 100, 1) if lookups else 0,
+        "largest": largest,
+    }
+
+
+def prune_pattern_cache(max_size_mb=None, max_age_days=None):
+    """
+    Evict old entries and enforce the size cap (least recently used first)
+
+    Also removes legacy pickle caches, stale or corrupt entries and
+    leftover temp files. Limits default to Cutting Settings; 0 = no limit.
+    Used by the daily scheduler job.
+
+    Returns:
+        dict with removed entry count, freed MB and remaining size
+    """
+    if max_size_mb is None or max_age_days is None:
+        settings = frappe.get_single("Cutting Settings")
+        if max_size_mb is None:
+            max_size_mb = settings.get("pattern_cache_max_size_mb") or 0
+        if max_age_days is None:
+            max_age_days = settings.get("pattern_cache_max_age_days") or 0
+
+    folder = get_cache_folder()
+    now = time.time()
+    removed = 0
+    freed = 0
+
+    def remove(path, size):
+        nonlocal removed, freed
+        try:
+            os.remove(path)
+            removed += 1
+            freed += size
+        except OSError:
+            pass
+        update_family_index(path)
+
+    # Legacy pickles and interrupted writes
+    for path in glob.glob(os.path.join(folder, "patterns_*.pkl")):
+        remove(path, os.path.getsize(path))
+    for path in glob.glob(os.path.join(folder, "*.tmp")):
+        if now - os.path.getmtime(path) > _TMP_MAX_AGE_SECONDS:
+            remove(path, os.path.getsize(path))
+
+    # Stale and corrupt entries are discarded by the header check itself
+    for path, size, _ in _list_entries():
+        if not read_pattern_header(path):
+            removed += 1
+            freed += size
+
+    entries = _list_entries()
+    if max_age_days:
+        cutoff = now - float(max_age_days) * 86400
+        for path, size, mtime in entries:
+            if mtime < cutoff:
+                remove(path, size)
+        entries = _list_entries()
+
+    total = sum(e[1] for e in entries)
+    if max_size_mb:
+        limit = float(max_size_mb) * 1024 * 1024
+        for path, size, _ in entries:
+            if total <= limit:
+                break
+            remove(path, size)
+            total -= size
+
+    if removed:
+        frappe.logger().info(
+            f"Pattern cache pruned: {removed} files, {freed / 1024 / 1024:.1f} MB freed, "
+            f"{total / 1024 / 1024:.1f} MB remaining"
+        )
+
+    return {
+        "removed": removed,
+        "freed_mb": round(freed / 1024 / 1024, 2),
+        "size_mb": round(total / 1024 / 1024, 2),
+    }
+
+
+def enforce_cache_size_limit():
+    """Cheap check after a write: prune only when the folder exceeds the cap"""
+    max_size_mb = frappe.get_single("Cutting Settings").get("pattern_cache_max_size_mb") or 0
+    if not max_size_mb:
+        return
+    if sum(e[1] for e in _list_entries()) > float(max_size_mb) * 1024 * 1024:
+        prune_pattern_cache(max_size_mb=max_size_mb, max_age_days=0)
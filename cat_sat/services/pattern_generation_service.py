@@ -0,0 +1,246 @@
+"""
+Pattern Generation Service
+Fast Phase 1 generators that do not go through a CP-SAT solution callback
+
+generate_patterns_dp enumerates the same pattern set as
+find_efficient_cutting_patterns (stock length, trim, kerf and adaptive
+minimum utilization), but as a depth-first search over integer-scaled
+lengths pruned by a NumPy reachability table, so every branch it opens
+leads to at least one valid pattern. Both take the MCTĐ limit on different
+segment types per pattern (max_distinct), enforced during the search.
+"""
+
+import math
+
+import frappe
+
+from cat_sat.services.cutting_optimization_service import (
+    SCALING_FACTOR,
+    SOLUTION_LIMIT,
+    get_max_pieces_per_pattern,
+    get_min_used,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _build_reach_tables(weights, capacity):
+    """
+    best[i][c] = largest total weight <= c that items i..n-1 can fill exactly
+
+    Items are unbounded here: get_max_pieces_per_pattern never binds below
+    the bar capacity, so the table matches the enumeration constraints.
+    """
+    num_items = len(weights)
+    size = capacity + 1
+    positions = np.arange(size)
+
+    reach = np.zeros(size, dtype=bool)
+    reach[0] = True
+    tables = [None] * (num_items + 1)
+    tables[num_items] = np.maximum.accumulate(np.where(reach, positions, -1))
+
+    for i in range(num_items - 1, -1, -1):
+        w = weights[i]
+        if 0 < w <= capacity:
+            # Unbounded "reach[c] |= reach[c - w]" along each residue class mod w
+            padded = np.zeros(-(-size // w) * w, dtype=bool)
+            padded[:size] = reach
+            reach = np.logical_or.accumulate(padded.reshape(-1, w), axis=0).reshape(-1)[:size]
+        tables[i] = np.maximum.accumulate(np.where(reach, positions, -1))
+
+    return tables
+
+
+def generate_patterns_dp(stock_length, piece_lengths, blade_width, max_waste_pct, trim, limit=SOLUTION_LIMIT,
+                         max_distinct=0):
+    """
+    Phase 1: Find all valid cutting patterns without CP-SAT
+
+    Args:
+        stock_length: Raw stock length (mm)
+        piece_lengths: List of segment lengths (mm)
+        blade_width: Kerf width (mm)
+        max_waste_pct: Maximum waste percentage (0.01 = 1%)
+        trim: Trim cut at start (mm)
+        limit: Maximum number of patterns to return
+        max_distinct: Maximum number of different segment types in a pattern
+            (MCTĐ machine limit), 0 = no limit
+
+    Returns:
+        List of (obj_value, solution) tuples sorted by obj_value descending,
+        same contract as find_efficient_cutting_patterns
+    """
+    if np is None:
+        frappe.throw("Thư viện 'numpy' chưa được cài đặt. Vui lòng cài đặt: 'pip install numpy'")
+
+    stock_int = int(stock_length * SCALING_FACTOR)
+    pieces_int = [int(l * SCALING_FACTOR) for l in piece_lengths]
+    blade_int = int(blade_width * SCALING_FACTOR)
+    trim_int = int(trim * SCALING_FACTOR)
+    num_pieces = len(pieces_int)
+
+    if not num_pieces:
+        return []
+
+    max_count = get_max_pieces_per_pattern(stock_int, pieces_int)
+    min_used = get_min_used(stock_int, pieces_int, max_waste_pct)
+
+    # Work on sum(count * (length + kerf)) between the fill bounds, in gcd units
+    weights = [p + blade_int for p in pieces_int]
+    divisor = 0
+    for w in weights:
+        divisor = math.gcd(divisor, w)
+    divisor = divisor or 1
+
+    capacity = (stock_int - trim_int) // divisor
+    min_fill = max(0, -(-(min_used - trim_int) // divisor))
+    if capacity < min_fill or capacity < 0:
+        return []
+
+    weights = [w // divisor for w in weights]
+    best = _build_reach_tables(weights, capacity)
+
+    results = []
+    counts = [0] * num_pieces
+    last = num_pieces - 1
+    limit_reached = False
+    if max_distinct <= 0 or max_distinct >= num_pieces:
+        max_distinct = num_pieces
+
+    def emit(used):
+        obj_value = (used * divisor + trim_int) / SCALING_FACTOR
+        results.append((obj_value, list(counts)))
+
+    def search(i, used, distinct):
+        nonlocal limit_reached
+        w = weights[i]
+        room = capacity - used
+        # No more segment types once the distinct-size limit is reached
+        full = distinct >= max_distinct
+
+        if i == last:
+            # Closed form for the last segment type
+            if w <= 0:
+                if used >= min_fill:
+                    counts[i] = 0
+                    emit(used)
+                return
+            low = max(0, -(-(min_fill - used) // w))
+            high = 0 if full else min(max_count, room // w)
+            for c in range(low, high + 1):
+                if len(results) >= limit:
+                    limit_reached = True
+                    return
+                counts[i] = c
+                emit(used + c * w)
+            counts[i] = 0
+            return
+
+        next_best = best[i + 1]
+        high = min(max_count, room // w) if w > 0 and not full else 0
+        for c in range(high + 1):
+            new_used = used + c * w
+            # Prune: the remaining types can no longer reach the minimum fill
+            if new_used + int(next_best[capacity - new_used]) < min_fill:
+                continue
+            counts[i] = c
+            if c and distinct + 1 >= max_distinct:
+                # Limit reached: the remaining types stay at 0
+                if new_used >= min_fill:
+                    if len(results) >= limit:
+                        limit_reached = True
+                        break
+                    emit(new_used)
+                continue
+            search(i + 1, new_used, distinct + (1 if c else 0))
+            if limit_reached:
+                break
+        counts[i] = 0
+
+    if int(best[0][capacity]) >= min_fill:
+        search(0, 0, 0)
+
+    if limit_reached:
+        frappe.logger().warning(
+            f"DP pattern generation stopped at limit={limit} for {num_pieces} segment types; "
+            "remaining patterns were dropped."
+        )
+
+    # Sort by obj_value descending (higher usage = less waste = better)
+    results.sort(key=lambda x: x[0], reverse=True)
+
+    return results
+
+
+def prune_dominated_patterns(patterns, max_surplus=0):
+    """
+    Remove duplicate and dominated patterns before the Phase 2 model is built
+
+    Duplicates are always removed. A pattern is dominated when the set also contains the same pattern with
+    one more segment of some type: that pattern produces everything the first
+    one does with less waste. A Phase 1 set holds every count vector between a
+    pattern and any pattern dominating it (all of them fit and reach the
+    minimum fill), so checking these single-step neighbours finds every
+    dominated pattern of a full enumeration. For other pools (column
+    generation, truncated enumeration) only provably dominated patterns go.
+
+    Every bar of the dominating pattern cuts one segment more than needed, so
+    dominated patterns are only removed when some surplus is allowed; with
+    max_surplus=0 dropping them could leave no exact cover.
+
+    Duplicates are patterns with identical count vectors; the one with the
+    highest material usage is kept.
+
+    Args:
+        patterns: List of (obj_value, solution) tuples
+        max_surplus: Surplus allowed per segment in Phase 2; 0 keeps
+            dominated patterns
+
+    Returns:
+        (pruned_patterns, removed_duplicates, removed_dominated)
+    """
+    if np is None or len(patterns) < 2:
+        return patterns, 0, 0
+
+    counts = np.asarray([sol for _, sol in patterns], dtype=np.int64)
+    num_patterns, num_pieces = counts.shape
+
+    # Duplicates: keep the first occurrence in usage order
+    order = sorted(range(num_patterns), key=lambda j: patterns[j][0], reverse=True)
+    _, first = np.unique(counts[order], axis=0, return_index=True)
+    unique_idx = np.sort(np.asarray(order)[first])
+    removed_duplicates = num_patterns - len(unique_idx)
+
+    if max_surplus <= 0:
+        return [patterns[j] for j in unique_idx], removed_duplicates, 0
+
+    matrix = counts[unique_idx]
+
+    # Hash each count vector; "one more of segment i" is then hash + weight_i
+    rng = np.random.default_rng(20260113)
+    hash_weights = rng.integers(1, 2**63 - 1, size=num_pieces, dtype=np.int64).astype(np.uint64)
+    hashes = (matrix.astype(np.uint64) * hash_weights).sum(axis=1, dtype=np.uint64)
+    hash_order = np.argsort(hashes)
+    sorted_hashes = hashes[hash_order]
+
+    dominated = np.zeros(len(matrix), dtype=bool)
+    for i in range(num_pieces):
+        targets = hashes + hash_weights[i]
+        pos = np.searchsorted(sorted_hashes, targets)
+        pos[pos >= len(sorted_hashes)] = 0
+        hit = np.flatnonzero(sorted_hashes[pos] == targets)
+        if not len(hit):
+            continue
+        # Confirm exactly: candidate == pattern + one segment of type i
+        diff = matrix[hash_order[pos[hit]]] - matrix[hit]
+        exact = (diff[:, i] == 1) & (np.count_nonzero(diff, axis=1) == 1)
+        dominated[hit[exact]] = True
+
+    kept = unique_idx[~dominated]
+    removed_dominated = int(dominated.sum())
+
+    return [patterns[j] for j in kept], removed_duplicates, removed_dominated
@@ -0,0 +1,193 @@
+"""
+Remnant Service
+Usable offcuts (Steel Remnant) per steel profile
+
+record_pattern_remnants runs when cuts of a pattern are recorded: the
+offcut of every bar (waste minus trim, floored to REMNANT_LENGTH_STEP) goes
+to the remnant store once it reaches remnant_min_length, and bars planned
+on a remnant take it out again. get_remnant_stocks feeds the store to the
+optimizer as stock lengths bounded by the quantity on hand, with a better
+priority than any new bar so remnants are consumed first.
+
+A saved optimization result reserves its remnant bars until they are cut:
+get_reserved_remnants counts the uncut bars planned on each remnant by the
+other open Cutting Orders, and get_remnant_stocks leaves them out, so two
+orders never plan the same bars.
+"""
+
+import frappe
+from frappe.utils import cint, flt
+
+# Remnant lengths are floored to this step (mm) to keep the number of
+# distinct stock lengths (and Phase 1 runs) small
+REMNANT_LENGTH_STEP = 10
+
+# Stock priority of remnants; new bars start at 1
+REMNANT_PRIORITY = 0
+
+
+def get_order_trim(order):
+    """Trim cut of a Cutting Order, defaulting from Cutting Settings like the optimizer"""
+    if flt(order.trim_cut):
+        return flt(order.trim_cut)
+    settings = frappe.get_single("Cutting Settings")
+    if order.enable_bundling:
+        return flt(settings.mctd_trim_cut or 15)
+    return flt(settings.laser_trim_cut or 10)
+
+
+def get_remnant_length(waste, trim):
+    """Usable length of the offcut left by one bar of a pattern"""
+    length = cint(flt(waste) - flt(trim))
+    return max(0, length - length % REMNANT_LENGTH_STEP)
+
+
+def adjust_remnant(steel_profile, length_mm, qty, cutting_order=None):
+    """
+    Add (qty > 0) or take out (qty < 0) remnants of one profile and length
+
+    Returns:
+        Steel Remnant name, or None if there was nothing to take out
+    """
+    name = frappe.db.get_value("Steel Remnant", {"steel_profile": steel_profile, "length_mm": length_mm})
+    if name:
+        doc = frappe.get_doc("Steel Remnant", name)
+        doc.qty = max(0, cint(doc.qty) + qty)
+    elif qty > 0:
+        doc = frappe.new_doc("Steel Remnant")
+        doc.steel_profile = steel_profile
+        doc.length_mm = length_mm
+        doc.qty = qty
+    else:
+        return None
+
+    if cutting_order:
+        doc.last_cutting_order = cutting_order
+    doc.save(ignore_permissions=True)
+    return doc.name
+
+
+def record_pattern_remnants(order, row, qty):
+    """
+    Update the remnant store for `qty` bars cut from a Cutting Pattern row
+
+    Args:
+        order: Cutting Order doc
+        row: Cutting Pattern row (waste, steel_remnant)
+        qty: Bars cut in this session
+    """
+    if qty <= 0 or not order.steel_profile:
+        return
+
+    # The bars came out of the remnant store
+    if row.steel_remnant:
+        remnant = frappe.db.get_value("Steel Remnant", row.steel_remnant, ["length_mm", "qty"], as_dict=True)
+        if remnant:
+            if cint(remnant.qty) < qty:
+                frappe.log_error(
+                    f"{order.name}: cắt {qty} thanh từ {row.steel_remnant} nhưng tồn chỉ còn {cint(remnant.qty)}",
+                    "Steel Remnant",
+                )
+            taken = min(qty, cint(remnant.qty))
+            if taken:
+                adjust_remnant(order.steel_profile, remnant.length_mm, -taken, order.name)
+
+    min_length = cint(frappe.get_single("Cutting Settings").get("remnant_min_length"))
+    if min_length <= 0:
+        return
+
+    length_mm = get_remnant_length(row.waste, get_order_trim(order))
+    if length_mm >= min_length:
+        adjust_remnant(order.steel_profile, length_mm, qty, order.name)
+
+
+def get_reserved_remnants(steel_profile, exclude_order=None):
+    """
+    Remnant bars planned by open Cutting Orders and not cut yet
+
+    Args:
+        steel_profile: Steel Profile of the remnants
+        exclude_order: Cutting Order being optimized (its old result is replaced)
+
+    Returns:
+        {Steel Remnant name: reserved bars}
+    """
+    rows = frappe.db.sql(
+        """
+        SELECT cp.steel_remnant, SUM(GREATEST(cp.qty - COALESCE(cp.cut_qty, 0), 0))
+        FROM `tabCutting Pattern` cp
+        JOIN `tabCutting Order` co ON co.name = cp.parent AND cp.parenttype = 'Cutting Order'
+        WHERE co.steel_profile = %(steel_profile)s
+            AND co.name != %(exclude_order)s
+            AND co.docstatus < 2
+            AND co.status != 'Completed'
+            AND COALESCE(cp.steel_remnant, '') != ''
+        GROUP BY cp.steel_remnant
+        """,
+        {"steel_profile": steel_profile, "exclude_order": exclude_order or ""},
+    )
+    return {name: cint(bars) for name, bars in rows}
+
+
+def get_remnant_stocks(steel_profile, exclude_order=None):
+    """
+    Remnants on hand and not reserved by other open orders as optimizer
+    stock, longest first
+
+    Args:
+        steel_profile: Steel Profile of the remnants
+        exclude_order: Cutting Order being optimized, see get_reserved_remnants
+
+    Returns:
+        List of {"item", "length_mm", "priority", "max_qty", "remnant"}
+        (see normalize_stocks)
+    """
+    max_lengths = cint(frappe.get_single("Cutting Settings").get("remnant_max_lengths") or 20)
+    reserved = get_reserved_remnants(steel_profile, exclude_order)
+    rows = frappe.get_all(
+        "Steel Remnant",
+        filters={"steel_profile": steel_profile, "qty": [">", 0]},
+        fields=["name", "length_mm", "qty"],
+        order_by="length_mm desc",
+    )
+    stocks = []
+    for r in rows:
+        available = cint(r.qty) - reserved.get(r.name, 0)
+        if available <= 0:
+            continue
+        stocks.append(
+            {
+                "item": None,
+                "length_mm": flt(r.length_mm),
+                "priority": REMNANT_PRIORITY,
+                "max_qty": available,
+                "remnant": r.name,
+            }
+        )
+        if len(stocks) >= max_lengths:
+            break
+    return stocks
+
+
+def get_remnant_savings(patterns, steel_profile):
+    """
+    Remnant bars used by an optimization result and the steel they save
+
+    Returns:
+        dict with bars, length_m and weight_kg (0 if the profile has no weight_per_meter)
+    """
+    bars = 0
+    length_mm = 0
+    for pat in patterns:
+        if pat.get("steel_remnant"):
+            bars += pat["qty"]
+            length_mm += pat["qty"] * flt(pat.get("stock_length"))
+
+    weight_per_meter = 0
+    if bars and steel_profile:
+        weight_per_meter = flt(frappe.db.get_value("Steel Profile", steel_profile, "weight_per_meter"))
+    return {
+        "bars": bars,
+        "length_m": round(length_mm / 1000.0, 2),
+        "weight_kg": round(length_mm / 1000.0 * weight_per_meter, 2),
+    }
@@ -0,0 +1,163 @@
+"""
+Segment Assignment Service
+Optimize over distinct lengths, then hand the pieces back to segment keys
+
+Segments of equal length but different machining or piece stay separate
+keys in a Cutting Order, so Phase 1 used to enumerate every split of a
+length's count between those keys, which multiplies the pattern pool and
+hits SOLUTION_LIMIT. The cut itself only depends on the length:
+group_segments_by_length pools the keys of each length into one column for
+both phases, and assign_segment_keys distributes the pieces of the solved
+bars back to the keys (demand plus an even share of the surplus).
+"""
+
+from collections import defaultdict
+
+from frappe.utils import flt
+
+
+def group_segments_by_length(piece_lengths, demands, segment_keys, piece_names, previous_solution=None):
+    """
+    Pool segment keys of equal length
+
+    Returns:
+        dict with piece_lengths, demands, segment_keys, piece_names and
+        previous_solution over the distinct lengths (keys (length, "<length>mm", "")),
+        and groups: original indices of each distinct length, in input order
+    """
+    index = {}
+    groups = []
+    for i, length in enumerate(piece_lengths):
+        if length not in index:
+            index[length] = len(groups)
+            groups.append([])
+        groups[index[length]].append(i)
+
+    lengths = [piece_lengths[g[0]] for g in groups]
+    keys = [(flt(length), f"{length}mm", "") for length in lengths]
+
+    # Stored patterns are per key; count their pieces per length like the new columns
+    previous = None
+    if previous_solution:
+        previous = []
+        for seg_counts, qty, stock_length in previous_solution:
+            counts = defaultdict(int)
+            for key, count in seg_counts.items():
+                length = flt(key[0] if isinstance(key, tuple) else key)
+                counts[(length, f"{length}mm", "")] += count
+            previous.append((dict(counts), qty, stock_length))
+
+    return {
+        "piece_lengths": lengths,
+        "demands": [sum(demands[i] for i in g) for g in groups],
+        "segment_keys": keys,
+        "piece_names": {
+            key: " / ".join(str(piece_names.get(segment_keys[i]) or segment_keys[i]) for i in g)
+            for key, g in zip(keys, groups)
+        },
+        "previous_solution": previous,
+        "groups": groups,
+    }
+
+
+def assign_segment_keys(patterns, grouped, segment_keys, demands):
+    """
+    Split the pieces of patterns over distinct lengths between the segment keys
+
+    Each key's target is its demand plus an even share of the surplus of
+    its length. Bars are filled in cutting units (one bar, or one bundle of
+    `factor` bars for MCTĐ rows with bundles): each slot of a length goes
+    to the first key of that length still short of its target, for the
+    whole unit while that key needs at least the unit's pieces or no other
+    key needs any. Consecutive units with the same split stay one pattern,
+    so a pattern is only split where a key's target is reached.
+
+    A bundle whose slot has to serve two keys is cut as one bundle all the
+    same and its pieces sorted by key after cutting: its rows keep the
+    factor, have no bundles and share a shared_bundle number.
+
+    Args:
+        patterns: Solver result over grouped["segment_keys"]
+        grouped: Output of group_segments_by_length
+        segment_keys: Original segment keys
+        demands: Original demands
+
+    Returns:
+        Pattern dicts over the original segment keys
+    """
+    produced = defaultdict(int)
+    for pat in patterns:
+        for group_key, count in pat["pattern"].items():
+            produced[group_key] += count * pat["qty"]
+
+    group_of = {}
+    remaining = {}
+    for group_key, group, demand in zip(grouped["segment_keys"], grouped["groups"], grouped["demands"]):
+        keys = [segment_keys[i] for i in group]
+        group_of[group_key] = keys
+        share, extra = divmod(max(0, produced[group_key] - demand), len(keys))
+        for n, i in enumerate(group):
+            remaining[segment_keys[i]] = demands[i] + share + (1 if n < extra else 0)
+
+    def take(keys):
+        # Production covers the targets exactly; the last key takes any rounding
+        key = next((k for k in keys if remaining[k] > 0), keys[-1])
+        remaining[key] -= 1
+        return key
+
+    result = []
+    shared_bundles = 0
+    for pat in patterns:
+        unit = pat["factor"] if pat.get("bundles") else 1
+        current, run = None, 0
+        for _ in range(pat["qty"] // unit):
+            # Split of each bar of this unit
+            bars = [defaultdict(int) for _ in range(unit)]
+            for group_key, count in pat["pattern"].items():
+                keys = group_of[group_key]
+                for _ in range(count):
+                    key = next((k for k in keys if remaining[k] > 0), keys[-1])
+                    if remaining[key] >= unit or not any(remaining[k] > 0 for k in keys if k != key):
+                        remaining[key] -= unit
+                        for split in bars:
+                            split[key] += 1
+                    else:
+                        for split in bars:
+                            split[take(keys)] += 1
+            bars = [dict(split) for split in bars]
+
+            if all(split == bars[0] for split in bars):
+                if bars[0] != current:
+                    if run:
+                        result.append(_split_pattern(pat, current, run))
+                    current, run = bars[0], 0
+                run += unit
+                continue
+
+            # Shared bundle: one row per run of equal bars
+            if run:
+                result.append(_split_pattern(pat, current, run))
+            current, run = None, 0
+            shared_bundles += 1
+            start = 0
+            for end in range(1, unit + 1):
+                if end == unit or bars[end] != bars[start]:
+                    row = _split_pattern(pat, bars[start], end - start)
+                    row["shared_bundle"] = shared_bundles
+                    result.append(row)
+                    start = end
+        if run:
+            result.append(_split_pattern(pat, current, run))
+    return result
+
+
+def _split_pattern(pat, split, bars):
+    """Copy of a solver pattern with its own segment counts and number of bars"""
+    row = dict(pat, pattern=split, qty=bars)
+    if "bundles" in pat:
+        if bars % pat["factor"]:
+            # Part of a shared bundle
+            row.pop("bundles")
+        else:
+            row["bundles"] = bars // pat["factor"]
+    return row
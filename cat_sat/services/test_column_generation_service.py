@@ -0,0 +1,78 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import itertools
+import unittest
+
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.column_generation_service import (
+	generate_patterns_by_column_generation,
+	is_surplus_bound_lp_feasible,
+	price_pattern,
+	pywraplp,
+	solve_master_lp,
+)
+from cat_sat.services.cutting_optimization_service import SCALING_FACTOR
+
+STOCK_LENGTH = 6000
+BLADE_WIDTH = 1
+TRIM = 10
+
+
+def _all_patterns(piece_lengths, demands):
+	"""Every feasible count vector with counts bounded by demand, like the pricing step"""
+	capacity = int((STOCK_LENGTH - TRIM) * SCALING_FACTOR)
+	weights = [int((length + BLADE_WIDTH) * SCALING_FACTOR) for length in piece_lengths]
+	bounds = [min(capacity // w, d) for w, d in zip(weights, demands)]
+	return [
+		list(counts)
+		for counts in itertools.product(*(range(b + 1) for b in bounds))
+		if any(counts) and sum(c * w for c, w in zip(counts, weights)) <= capacity
+	]
+
+
+@unittest.skipIf(pywraplp is None, "ortools is not installed")
+class TestColumnGenerationService(FrappeTestCase):
+	def test_lp_bound_matches_enumeration(self):
+		piece_lengths = [2500, 1700, 1100, 600]
+		demands = [5, 7, 9, 11]
+
+		pool = generate_patterns_by_column_generation(STOCK_LENGTH, piece_lengths, demands, BLADE_WIDTH, TRIM)
+		cg_bound = solve_master_lp([counts for _, counts in pool], demands)[0]
+		full_bound = solve_master_lp(_all_patterns(piece_lengths, demands), demands)[0]
+
+		self.assertAlmostEqual(cg_bound, full_bound, places=6)
+		# Far fewer columns than the full enumeration
+		self.assertLess(len(pool), len(_all_patterns(piece_lengths, demands)))
+		for used, counts in pool:
+			self.assertLessEqual(used, STOCK_LENGTH)
+			self.assertTrue(all(0 <= c <= d for c, d in zip(counts, demands)))
+
+	def test_price_pattern(self):
+		values = [0.45, 0.3, 0.2]
+		weights = [25010, 17010, 11010]
+		bounds = [2, 3, 5]
+		capacity = 59900
+
+		best = max(
+			(sum(v * c for v, c in zip(values, counts)), list(counts))
+			for counts in itertools.product(*(range(b + 1) for b in bounds))
+			if sum(w * c for w, c in zip(weights, counts)) <= capacity
+		)
+		value, counts = price_pattern(values, weights, bounds, capacity)
+		self.assertAlmostEqual(value, best[0])
+		self.assertAlmostEqual(sum(v * c for v, c in zip(values, counts)), best[0])
+		self.assertLessEqual(sum(w * c for w, c in zip(weights, counts)), capacity)
+
+	def test_surplus_bound_lp(self):
+		# One pattern cutting 2 of segment 0 and 1 of segment 1
+		rows = [([0], [2]), ([0], [1])]
+		# Segment 1 needs 2 bars, which cut 4 of segment 0
+		self.assertFalse(is_surplus_bound_lp_feasible(rows, 1, [2, 2], 0))
+		self.assertFalse(is_surplus_bound_lp_feasible(rows, 1, [2, 2], 1))
+		self.assertTrue(is_surplus_bound_lp_feasible(rows, 1, [2, 2], 2))
+
+		# A second pattern for segment 1 alone makes an exact cover possible
+		rows = [([0], [2]), ([0, 1], [1, 1])]
+		self.assertTrue(is_surplus_bound_lp_feasible(rows, 2, [2, 2], 0))
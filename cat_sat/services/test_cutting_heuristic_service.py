@@ -0,0 +1,118 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import unittest
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.cutting_heuristic_service import (
+	decompose_into_bundles,
+	fit_decreasing,
+	greedy_pattern_assignment,
+	map_previous_solution,
+	np,
+	preview_cutting_plan,
+	split_into_bundles,
+	trim_surplus,
+)
+
+SHORT = (1000.0, "A", "P1")
+LONG = (1500.0, "B", "P1")
+
+# Pool over [SHORT, LONG]
+PATTERNS = [(5990.0, [2, 1]), (5980.0, [0, 3]), (5000.0, [1, 0])]
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestCuttingHeuristicService(FrappeTestCase):
+	def test_greedy_pattern_assignment(self):
+		# Tie on coverage: higher usage first, repeated while still useful
+		self.assertEqual(greedy_pattern_assignment(PATTERNS, [4, 3]), [3, 0, 0])
+		# Waste breaks the tie when given
+		self.assertEqual(greedy_pattern_assignment(PATTERNS, [4, 3], waste=[100, 0, 1000]), [2, 1, 0])
+		# Tops up a starting solution
+		self.assertEqual(greedy_pattern_assignment(PATTERNS, [4, 3], initial=[0, 1, 0]), [2, 1, 0])
+		# The pool cannot cut the second segment
+		self.assertIsNone(greedy_pattern_assignment([(5000.0, [1, 0])], [1, 1]))
+
+	def test_map_previous_solution(self):
+		keys = [SHORT, LONG]
+		previous = [({SHORT: 2, LONG: 1}, 4, 6000.0)]
+		self.assertEqual(map_previous_solution(previous, PATTERNS, keys), [4, 0, 0])
+
+		# Stored piece codes from the source item fall back to (length, segment_name)
+		previous = [({(1000.0, "A", "ITEM-1"): 2, (1500.0, "B", "ITEM-1"): 1}, 4, 6000.0)]
+		self.assertEqual(map_previous_solution(previous, PATTERNS, keys), [4, 0, 0])
+
+		# Patterns over unknown segments or no longer in the pool are skipped
+		previous = [({(700.0, "C", ""): 8}, 2, 6000.0), ({SHORT: 5}, 1, 6000.0)]
+		self.assertIsNone(map_previous_solution(previous, PATTERNS, keys))
+
+		# Mixed stock: the stock length has to match, unless the row has none
+		stocks = [5850.0, 6000.0, 6000.0]
+		self.assertIsNone(map_previous_solution([({SHORT: 2, LONG: 1}, 4, 6000.0)], PATTERNS, keys, stocks))
+		self.assertEqual(
+			map_previous_solution([({SHORT: 2, LONG: 1}, 4, 0.0)], PATTERNS, keys, stocks), [4, 0, 0]
+		)
+
+	def test_trim_surplus(self):
+		# [3, 2, 0] cuts 6 and 9 pieces for a demand of 4 and 3
+		x = trim_surplus([3, 2, 0], PATTERNS, [4, 3], 1)
+		self.assertEqual(x, [2, 0, 0])
+		produced = [sum(x[j] * sol[i] for j, (_, sol) in enumerate(PATTERNS)) for i in range(2)]
+		self.assertTrue(all(p <= d + 1 for p, d in zip(produced, [4, 3])))
+
+		# Already within the bound: 4 and 5 pieces
+		self.assertEqual(trim_surplus([2, 1, 0], PATTERNS, [4, 3], 2), [2, 1, 0])
+
+	def test_decompose_into_bundles(self):
+		factors = [1, 14, 16, 18, 20]
+		self.assertEqual(decompose_into_bundles(50, factors), {20: 2, 1: 10})
+		# Too many leftover bars for manual cutting: one more of the smallest bundle
+		self.assertEqual(decompose_into_bundles(50, factors, manual_cut_limit=5), {20: 2, 14: 1})
+		self.assertEqual(decompose_into_bundles(10, [14]), {14: 1})
+		self.assertEqual(decompose_into_bundles(0, factors), {})
+
+	def test_split_into_bundles(self):
+		factors = [14, 16, 18, 20]
+		for bars in (14, 32, 46, 70):
+			bundles = split_into_bundles(bars, factors)
+			self.assertEqual(sum(f * n for f, n in bundles.items()), bars)
+		self.assertEqual(sum(split_into_bundles(32, factors).values()), 2)
+		self.assertEqual(split_into_bundles(60, factors), {20: 3})
+		self.assertEqual(split_into_bundles(0, factors), {})
+
+		with self.assertRaises(frappe.ValidationError):
+			split_into_bundles(15, factors)
+
+	def test_fit_decreasing(self):
+		lengths = [2400, 1850, 1200, 735]
+		demands = [3, 4, 5, 6]
+		for best_fit in (True, False):
+			layouts = fit_decreasing(lengths, demands, 6000, 1, 10, best_fit=best_fit)
+			produced = [sum(sol[i] * qty for _, sol, qty in layouts) for i in range(len(lengths))]
+			self.assertEqual(produced, demands)
+			for used, sol, _ in layouts:
+				self.assertLessEqual(used, 6000)
+				self.assertAlmostEqual(used, sum(c * (l + 1) for c, l in zip(sol, lengths)) + 10)
+			self.assertEqual([r[0] for r in layouts], sorted((r[0] for r in layouts), reverse=True))
+
+		# 2400 + 2400 + 1200 does not fit with kerf and trim: the 1200s open a second bar
+		layouts = fit_decreasing([2400, 1200], [2, 2], 6000, 1, 10, best_fit=False)
+		self.assertEqual([(sol, qty) for _, sol, qty in layouts], [([2, 0], 1), ([0, 2], 1)])
+
+		with self.assertRaises(frappe.ValidationError):
+			fit_decreasing([6100], [1], 6000, 1, 10)
+
+	def test_preview_cutting_plan(self):
+		keys = [LONG, SHORT]
+		plan = preview_cutting_plan([1500, 1000], [3, 4], keys, 6000, 1, 10)
+		produced = {key: sum(p["pattern"].get(key, 0) * p["qty"] for p in plan) for key in keys}
+		self.assertEqual(produced, {LONG: 3, SHORT: 4})
+		for p in plan:
+			# used_length leaves out the trim, waste includes it
+			self.assertAlmostEqual(p["used_length"] + p["waste"], 6000)
+			self.assertGreaterEqual(p["waste"], 10)
+		# 3 x 1501 + 1001 fits one bar, the other three 1000s share the second
+		self.assertEqual(sum(p["qty"] for p in plan), 2)
@@ -0,0 +1,331 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import unittest
+from collections import defaultdict
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services import cutting_optimization_service
+from cat_sat.services.cutting_optimization_service import (
+	SCALING_FACTOR,
+	_run_optimization_impl,
+	apply_solver_params,
+	build_run_report,
+	build_sparse_columns,
+	combine_run_reports,
+	cp_model,
+	generate_stock_patterns,
+	get_bar_lower_bound,
+	get_solver_params,
+	normalize_stocks,
+	solve_bundled_cutting_stock,
+	solve_laser_cutting_stock,
+)
+from cat_sat.services.pattern_generation_service import generate_patterns_dp
+
+TEST_PROFILE = "_Test V30"
+
+
+def _make_order(items, **fields):
+	if not frappe.db.exists("Steel Profile", TEST_PROFILE):
+		frappe.get_doc(
+			{"doctype": "Steel Profile", "profile_code": TEST_PROFILE, "shape": "V", "dimension": "30x30"}
+		).insert(ignore_permissions=True)
+
+	order = frappe.get_doc(
+		{
+			"doctype": "Cutting Order",
+			"steel_profile": TEST_PROFILE,
+			"stock_length": 6000,
+			"trim_cut": 10,
+			"use_profile_stocks": 0,
+			"use_remnants": 0,
+			"solver_laser_time_limit": 5,
+			"items": items,
+			**fields,
+		}
+	)
+	return order.insert(ignore_permissions=True)
+
+
+def _dense_min_waste(patterns, demands, stock_length, max_surplus):
+	"""Reference Phase 2 waste from the dense formulation (every pattern in every row)"""
+	model = cp_model.CpModel()
+	x = [model.NewIntVar(0, sum(demands) * 2, f"x_{j}") for j in range(len(patterns))]
+	for i, demand in enumerate(demands):
+		produced = sum(sol[i] * x[j] for j, (_, sol) in enumerate(patterns))
+		model.Add(produced >= demand)
+		model.Add(produced - demand <= max_surplus)
+	model.Minimize(
+		sum(int((stock_length - used) * SCALING_FACTOR) * x[j] for j, (used, _) in enumerate(patterns))
+	)
+	solver = cp_model.CpSolver()
+	solver.parameters.num_workers = 1
+	if solver.Solve(model) != cp_model.OPTIMAL:
+		return None
+	return round(solver.ObjectiveValue() / SCALING_FACTOR, 3)
+
+
+def _doubling_min_waste(patterns, demands, stock_length, max_surplus):
+	"""The retry loop the elastic bound replaced: double max_surplus until a plan exists"""
+	while (waste := _dense_min_waste(patterns, demands, stock_length, max_surplus)) is None:
+		max_surplus = max(max_surplus * 2, 1)
+	return waste, max_surplus
+
+
+@unittest.skipIf(cp_model is None, "ortools is not installed")
+class TestCuttingOptimizationService(FrappeTestCase):
+	def test_run_saves_result(self):
+		items = [
+			{"segment_name": "Chân", "length_mm": 1850, "qty": 12},
+			{"segment_name": "Giằng", "length_mm": 980, "qty": 20},
+			{"segment_name": "Tay", "length_mm": 980, "qty": 6, "punch_holes": 2},
+		]
+		order = _make_order(items)
+
+		result = _run_optimization_impl(order.name)
+		self.assertTrue(result["success"])
+
+		order.reload()
+		self.assertEqual(order.status, "Optimized")
+		self.assertTrue(order.optimization_result)
+		rows = order.optimization_result
+		self.assertEqual([row.sequence for row in rows], list(range(1, len(rows) + 1)))
+		self.assertEqual(order.total_bars, sum(row.qty for row in rows))
+
+		# Pattern Segments of the saved rows cover every segment key's demand
+		produced = defaultdict(int)
+		for row in rows:
+			for seg in frappe.get_all(
+				"Pattern Segment",
+				filters={"parent": row.name, "parenttype": "Cutting Pattern"},
+				fields=["segment_name", "quantity"],
+			):
+				produced[seg.segment_name] += seg.quantity * row.qty
+		for item in items:
+			self.assertGreaterEqual(produced[item["segment_name"]], item["qty"])
+
+
+@unittest.skipIf(cp_model is None, "ortools is not installed")
+class TestPhase2Model(FrappeTestCase):
+	def test_build_sparse_columns(self):
+		patterns = [(5990.0, [2, 0, 1]), (5980.0, [0, 3, 0]), (4000.0, [1, 1, 0])]
+		self.assertEqual(
+			build_sparse_columns(patterns, 3),
+			[([0, 2], [2, 1]), ([1, 2], [3, 1]), ([0], [1])],
+		)
+
+	def test_sparse_model_matches_dense(self):
+		lengths = [1490.0, 985.0, 735.0]
+		demands = [9, 7, 13]
+		keys = [(length, f"S{i}", "") for i, length in enumerate(lengths)]
+		pool = generate_patterns_dp(6000, lengths, 1, 0.015, 10)
+
+		with patch.object(cutting_optimization_service, "get_or_calculate_patterns", return_value=pool):
+			result = solve_laser_cutting_stock(
+				lengths, demands, keys, {}, 6000, 1, 10, 3, pattern_method="Dynamic Programming"
+			)
+
+		produced = [sum(p["pattern"].get(key, 0) * p["qty"] for p in result) for key in keys]
+		self.assertTrue(all(0 <= p - d <= 3 for p, d in zip(produced, demands, strict=True)))
+		# Result waste includes the trim cut, the model's does not
+		waste = sum((p["waste"] - 10) * p["qty"] for p in result)
+		self.assertAlmostEqual(waste, _dense_min_waste(pool, demands, 6000, 3), places=3)
+
+	def solve_stages(self, max_patterns=0, **params):
+		"""Laser solve over [1490, 985, 735] with max_surplus 10; (result, waste, surplus, stage names)"""
+		lengths = [1490.0, 985.0, 735.0]
+		demands = [9, 7, 13]
+		keys = [(length, f"S{i}", "") for i, length in enumerate(lengths)]
+		pool = generate_patterns_dp(6000, lengths, 1, 0.015, 10)
+		stats = {}
+		with patch.object(cutting_optimization_service, "get_or_calculate_patterns", return_value=pool):
+			result = solve_laser_cutting_stock(
+				lengths, demands, keys, {}, 6000, 1, 10, 10, max_patterns, pattern_method="Dynamic Programming",
+				solver_params={"workers": 1, "time_limit": 10, **params}, stats=stats,
+			)
+		waste = sum((p["waste"] - 10) * p["qty"] for p in result)
+		surplus = sum(sum(p["pattern"].get(key, 0) * p["qty"] for p in result) for key in keys) - sum(demands)
+		return result, waste, surplus, [stage["stage"] for stage in stats["stages"]]
+
+	def test_setup_stage_tolerances(self):
+		result, waste, surplus, stages = self.solve_stages()
+		self.assertEqual((len(result), waste, surplus), (4, 361, 5))
+		self.assertEqual(stages, ["laser_overshoot", "laser_waste", "laser_surplus"])
+
+		# Waste and surplus locked at their optimum
+		result, waste, surplus, stages = self.solve_stages(setup_time_limit=10)
+		self.assertEqual((len(result), waste, surplus), (3, 361, 5))
+		self.assertEqual(stages, ["laser_overshoot", "laser_waste", "laser_surplus", "laser_setups"])
+
+		# 0.2 % of the 36000mm of stock (72mm) and 10 % of the 29 pieces (2) buy one setup
+		result, waste, surplus, _ = self.solve_stages(
+			setup_time_limit=10, waste_tolerance=0.002, surplus_tolerance=0.1
+		)
+		self.assertEqual(len(result), 2)
+		self.assertLessEqual(waste, 361 + 72)
+		self.assertLessEqual(surplus, 5 + 2)
+
+	def test_setup_stage_falls_back_to_previous_stage(self):
+		solve_stage = cutting_optimization_service.solve_stage
+
+		def time_out_setups(*args, **kwargs):
+			if args[6] == "setup":
+				return cp_model.UNKNOWN
+			return solve_stage(*args, **kwargs)
+
+		with patch.object(cutting_optimization_service, "solve_stage", side_effect=time_out_setups):
+			result = self.solve_stages(setup_time_limit=10)[0]
+		self.assertEqual(result, self.solve_stages()[0])
+
+	def test_max_patterns_is_a_hard_cap(self):
+		result, _, _, stages = self.solve_stages(max_patterns=2)
+		self.assertEqual(len(result), 2)
+		self.assertEqual(stages, ["laser_overshoot", "laser_waste", "laser_surplus"])
+		self.assertEqual(len(self.solve_stages(max_patterns=1)[0]), 1)
+
+	def test_elastic_surplus_matches_doubling(self):
+		lengths = [1490.0, 985.0, 735.0]
+		demands = [9, 7, 13]
+		keys = [(length, f"S{i}", "") for i, length in enumerate(lengths)]
+		pool = generate_patterns_dp(6000, lengths, 1, 0.015, 10)
+
+		stats = {}
+		with patch.object(cutting_optimization_service, "get_or_calculate_patterns", return_value=pool):
+			result = solve_laser_cutting_stock(
+				lengths, demands, keys, {}, 6000, 1, 10, 1, pattern_method="Dynamic Programming",
+				solver_params={"workers": 1, "time_limit": 10}, stats=stats,
+			)
+
+		# No plan within a surplus of 1: the loop needed 2, the elastic bound overshoots to it
+		waste, relaxed = _doubling_min_waste(pool, demands, 6000, 1)
+		self.assertEqual(relaxed, 2)
+		produced = [sum(p["pattern"].get(key, 0) * p["qty"] for p in result) for key in keys]
+		self.assertTrue(all(0 <= p - d <= relaxed for p, d in zip(produced, demands, strict=True)))
+		self.assertGreater(stats["stages"][0]["objective"], 0)
+		self.assertAlmostEqual(sum((p["waste"] - 10) * p["qty"] for p in result), waste, places=3)
+
+	def test_solver_params(self):
+		settings = frappe._dict(
+			solver_laser_workers=4, solver_laser_time_limit=30, solver_relative_gap=0.5, solver_random_seed=7
+		)
+		order = frappe._dict(solver_laser_time_limit=5, solver_bundled_workers=2, solver_random_seed=0)
+		with patch.object(cutting_optimization_service.frappe, "get_single", return_value=settings):
+			params = get_solver_params(order)
+			portal = get_solver_params()
+
+		# Non-zero order values win, the rest come from the settings or the defaults
+		laser = params["laser"]
+		self.assertEqual(
+			(laser["workers"], laser["time_limit"], laser["relative_gap"], laser["random_seed"]), (4, 5, 0.5, 7)
+		)
+		self.assertEqual((params["bundled"]["workers"], params["bundled"]["time_limit"]), (2, 60))
+		self.assertEqual((portal["laser"]["time_limit"], portal["bundled"]["workers"]), (30, 8))
+		# The pattern-count stage is opt-in
+		self.assertEqual(laser["setup_time_limit"], 0)
+
+	def test_apply_solver_params(self):
+		solver = cp_model.CpSolver()
+		apply_solver_params(solver, {"workers": 3, "time_limit": 12, "relative_gap": 0.01, "random_seed": 5})
+		self.assertEqual(solver.parameters.num_search_workers, 3)
+		self.assertEqual(solver.parameters.max_time_in_seconds, 12)
+		self.assertAlmostEqual(solver.parameters.relative_gap_limit, 0.01)
+		self.assertEqual(solver.parameters.random_seed, 5)
+
+		# 0 keeps the CP-SAT defaults
+		solver = cp_model.CpSolver()
+		defaults = cp_model.CpSolver().parameters
+		apply_solver_params(solver, {"workers": 0, "time_limit": 0, "relative_gap": 0})
+		self.assertEqual(solver.parameters.num_search_workers, defaults.num_search_workers)
+		self.assertEqual(solver.parameters.max_time_in_seconds, defaults.max_time_in_seconds)
+		self.assertEqual(solver.parameters.relative_gap_limit, defaults.relative_gap_limit)
+
+	def test_normalize_stocks(self):
+		stocks = [
+			{"item": "V30-6000-B", "length_mm": 6000, "priority": 2},
+			{"item": "V30-5850", "length_mm": 5850, "priority": 1},
+			{"item": "V30-6000-A", "length_mm": 6000, "priority": 1},
+		]
+		# One entry per length with its best priority; longer first on a tie
+		self.assertEqual(
+			[(s["item"], s["length_mm"], s["priority"]) for s in normalize_stocks(6000, stocks)],
+			[("V30-6000-A", 6000, 1), ("V30-5850", 5850, 1)],
+		)
+		# No stock items: the order's own stock length
+		self.assertEqual(normalize_stocks(5850), [{"item": None, "length_mm": 5850, "priority": 1}])
+
+	def test_generate_stock_patterns(self):
+		stocks = normalize_stocks(6000, [{"length_mm": 6000, "priority": 1}, {"length_mm": 2500, "priority": 2}])
+		pools = {6000: [(5012.0, [1, 1])], 2500: [(2411.0, [1])]}
+		calls = []
+
+		def generate(stock_length, indices):
+			calls.append((stock_length, indices))
+			return pools[stock_length]
+
+		with patch.object(cutting_optimization_service.frappe, "get_single", return_value=frappe._dict()):
+			patterns, pattern_stock = generate_stock_patterns(stocks, [2400.0, 2600.0], 10, generate)
+
+		# Only the segment that fits goes into the short stock's pool, widened to all segments
+		self.assertEqual(calls, [(6000, [0, 1]), (2500, [0])])
+		self.assertEqual(patterns, [(5012.0, [1, 1]), (2411.0, [1, 0])])
+		self.assertEqual(pattern_stock, [0, 1])
+
+	def test_bar_lower_bound(self):
+		stocks = [{"length_mm": 5850.0}, {"length_mm": 6000.0}]
+		# (1490 + 1) * 8 + (985 + 1) * 6 = 17844mm over 5990mm usable
+		self.assertEqual(get_bar_lower_bound([1490.0, 985.0], [8, 6], 1, 10, stocks), 3)
+		self.assertEqual(get_bar_lower_bound([2994.0], [4], 1, 10, stocks), 2)
+
+	def test_run_reports(self):
+		laser = build_run_report(
+			[{"qty": 3}, {"qty": 1}], 3, {"status": "OPTIMAL", "objective": 120.0, "bound": 120.0, "gap_pct": 0.0}
+		)
+		self.assertEqual((laser["bars"], laser["gap_pct"], laser["solver_status"]), (4, 25.0, "OPTIMAL"))
+		mctd = build_run_report(
+			[{"qty": 6}], 6, {"status": "FEASIBLE", "objective": 300.0, "bound": 200.0, "gap_pct": 33.33}
+		)
+
+		combined = combine_run_reports([laser, mctd, {}])
+		self.assertEqual((combined["bars"], combined["lower_bound_bars"], combined["gap_pct"]), (10, 9, 10.0))
+		self.assertEqual((laser["patterns"], combined["patterns"]), (2, 3))
+		# The weakest status; bounds and objectives add up
+		self.assertEqual(combined["solver_status"], "FEASIBLE")
+		self.assertEqual((combined["solver_objective"], combined["solver_bound"]), (420.0, 320.0))
+		self.assertEqual(combined["solver_gap_pct"], 23.81)
+
+		# A run without a solver bound (decomposed Laser) leaves the order without one
+		combined = combine_run_reports([laser, build_run_report([{"qty": 6}], 6, {"status": "FEASIBLE"})])
+		self.assertIsNone(combined["solver_bound"])
+		self.assertEqual(combine_run_reports([None, {}]), {})
+
+	def test_aggregated_bars_matches_bundle_variables(self):
+		lengths = [1490.0, 985.0, 735.0]
+		demands = [40, 30, 50]
+		keys = [(length, f"S{i}", "") for i, length in enumerate(lengths)]
+		pool = generate_patterns_dp(6000, lengths, 1, 0.015, 10)
+
+		results = {}
+		for formulation in ("Bundle Variables", "Aggregated Bars"):
+			stats = {}
+			with patch.object(
+				cutting_optimization_service, "get_or_calculate_patterns", return_value=pool
+			), patch.object(cutting_optimization_service, "get_bundled_formulation", return_value=formulation):
+				result = solve_bundled_cutting_stock(
+					lengths, demands, keys, {}, 6000, 1, 10, [20, 18, 16, 14, 1], 5, 2,
+					solver_params={"workers": 1, "time_limit": 30}, stats=stats,
+				)
+
+			self.assertEqual(stats["status"], "OPTIMAL")
+			self.assertTrue(all(p["qty"] == p["factor"] * p["bundles"] for p in result))
+			produced = [sum(p["pattern"].get(key, 0) * p["qty"] for p in result) for key in keys]
+			self.assertTrue(all(p >= d for p, d in zip(produced, demands, strict=True)))
+			results[formulation] = (
+				stats["objective"], sum(p["waste"] * p["qty"] for p in result), sum(p["qty"] for p in result)
+			)
+
+		# Same optimum: waste first, then bars
+		self.assertEqual(results["Bundle Variables"], results["Aggregated Bars"])
@@ -0,0 +1,68 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.cutting_sequence_service import get_changeovers, sequence_patterns
+
+
+def _pattern(counts, qty=1, machine="Laser", stock_length=6000):
+	return {"pattern": counts, "qty": qty, "machine": machine, "stock_length": stock_length}
+
+
+class TestCuttingSequenceService(FrappeTestCase):
+	def test_changeovers(self):
+		a = _pattern({(1200.0, "A", "P1"): 2, (850.0, "B", "P1"): 3})
+		b = _pattern({(1200.0, "C", "P2"): 4}, stock_length=5850)
+		self.assertEqual(get_changeovers(None, a), 0)
+		# 850 comes off the stops, new stock length
+		self.assertEqual(get_changeovers(a, b), 2)
+
+	def test_similar_patterns_adjacent(self):
+		patterns = [
+			_pattern({(1200.0, "A", ""): 4}),
+			_pattern({(700.0, "B", ""): 8}),
+			_pattern({(1200.0, "A", ""): 3, (700.0, "B", ""): 2}),
+			_pattern({(700.0, "B", ""): 7, (300.0, "C", ""): 1}),
+		]
+		result = sequence_patterns(patterns)
+		self.assertEqual([p["sequence"] for p in result], [1, 2, 3, 4])
+		self.assertEqual([p["pattern"] for p in result], [patterns[i]["pattern"] for i in (0, 2, 1, 3)])
+
+	def test_completes_pieces_first(self):
+		patterns = [
+			_pattern({(1000.0, "A", "P1"): 5}),
+			_pattern({(1000.0, "B", "P2"): 5}),
+			_pattern({(1000.0, "A", "P1"): 4, (1000.0, "C", "P1"): 1}),
+			_pattern({(1000.0, "B", "P2"): 5}, machine="MCTĐ"),
+		]
+		result = sequence_patterns(patterns)
+		# Same setup for all: P2 is complete after one bar, P1 needs two
+		self.assertEqual([p["pattern"] for p in result[:3]], [patterns[i]["pattern"] for i in (1, 0, 2)])
+		self.assertEqual(
+			[(p["machine"], p["sequence"]) for p in result],
+			[("Laser", 1), ("Laser", 2), ("Laser", 3), ("MCTĐ", 1)],
+		)
+
+	def test_piece_completion_mode(self):
+		# One P1 welding set: 2 x 1000 + 1 x 500
+		piece_sets = {"P1": {1000.0: 2, 500.0: 1}}
+		patterns = [
+			_pattern({(1000.0, "A", "P1"): 6}, qty=2),
+			_pattern({(2000.0, "X", "P9"): 3}),
+			_pattern({(1000.0, "A", "P1"): 2, (500.0, "B", "P1"): 4}, qty=3),
+		]
+		result = sequence_patterns(patterns, piece_sets=piece_sets)
+		# Only the mixed pattern completes sets on its own (1 per bar); its spare 500mm
+		# segments then make the 1000mm pattern worth 3 sets per bar. P9 has no set
+		self.assertEqual([p["pattern"] for p in result], [patterns[i]["pattern"] for i in (2, 0, 1)])
+
+	def test_shared_bundle_adjacent(self):
+		patterns = [
+			dict(_pattern({(1000.0, "A", "P1"): 5}, qty=7, machine="MCTĐ"), shared_bundle=1),
+			_pattern({(700.0, "C", "P3"): 8}, qty=14, machine="MCTĐ"),
+			dict(_pattern({(1000.0, "B", "P2"): 5}, qty=7, machine="MCTĐ"), shared_bundle=1),
+		]
+		result = sequence_patterns(patterns)
+		self.assertEqual([p.get("shared_bundle") for p in result][:2], [1, 1])
+		self.assertEqual([p["sequence"] for p in result], [1, 2, 3])
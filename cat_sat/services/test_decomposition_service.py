@@ -0,0 +1,201 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services import cutting_optimization_service, decomposition_service, optimization_job_service
+from cat_sat.services.decomposition_service import (
+	cluster_segments,
+	merge_patterns,
+	remaining_stock_limits,
+	repair_high_waste_bars,
+	solve_laser_decomposed,
+	split_stock_limits,
+)
+
+SHORT = (1000.0, "A", "")
+LONG = (1500.0, "B", "")
+
+
+def _pattern(counts, qty, waste, stock_length=6000, **fields):
+	return {"pattern": counts, "qty": qty, "waste": waste, "stock_length": stock_length, **fields}
+
+
+# Every _InlineExecutor created, latest last
+_executors = []
+
+
+class _InlineExecutor:
+	"""ProcessPoolExecutor stand-in running each cluster in the test process"""
+
+	def __init__(self, max_workers, mp_context):
+		self.max_workers = max_workers
+		self.submitted = []
+		_executors.append(self)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		return False
+
+	def submit(self, fn, *args):
+		self.submitted.append(args[-1])
+		future = Future()
+		future.set_result(fn(*args))
+		return future
+
+
+class TestDecompositionService(FrappeTestCase):
+	def test_cluster_segments(self):
+		lengths = [300, 1800, 950, 1200, 600, 2400, 450]
+		clusters = cluster_segments(lengths, 3)
+		# Longest first, snake order: 2400, 1800, 1200 | 950, 600, 450 | 300
+		self.assertEqual(clusters, [[0, 5, 6], [1, 4], [2, 3]])
+		self.assertEqual(sorted(i for c in clusters for i in c), list(range(len(lengths))))
+
+		# Empty clusters are dropped
+		self.assertEqual(cluster_segments([1000, 500], 3), [[0], [1]])
+
+	def test_split_stock_limits(self):
+		new_bar = {"item": "STEEL-6000", "length_mm": 6000, "priority": 1}
+		remnant = {"item": None, "length_mm": 2500, "priority": 0, "max_qty": 5, "remnant": "REM-1"}
+		shares = split_stock_limits([new_bar, remnant], 3)
+
+		self.assertTrue(all(new_bar in share for share in shares))
+		self.assertEqual(
+			[[s["max_qty"] for s in share if s.get("remnant")] for share in shares], [[2], [2], [1]]
+		)
+
+		# One bar left: only the first part gets it
+		shares = split_stock_limits([new_bar, dict(remnant, max_qty=1)], 2)
+		self.assertEqual([len(share) for share in shares], [2, 1])
+
+		# Never the whole list for a part without a share
+		self.assertEqual(split_stock_limits([dict(remnant, max_qty=1)], 2), [[dict(remnant, max_qty=1)], []])
+		self.assertEqual(split_stock_limits(None, 2), [None, None])
+
+	def test_remaining_stock_limits(self):
+		new_bar = {"item": "STEEL-6000", "length_mm": 6000, "priority": 1}
+		remnants = [
+			{"length_mm": 2500, "max_qty": 5, "remnant": "REM-1"},
+			{"length_mm": 1800, "max_qty": 2, "remnant": "REM-2"},
+		]
+		patterns = [
+			_pattern({SHORT: 2}, 3, 490, 2500, steel_remnant="REM-1"),
+			_pattern({LONG: 1}, 2, 290, 1800, steel_remnant="REM-2"),
+			_pattern({SHORT: 6}, 1, 0),
+		]
+		remaining = remaining_stock_limits([new_bar, *remnants], patterns)
+		self.assertEqual(remaining, [new_bar, dict(remnants[0], max_qty=2)])
+
+		# Every remnant used up: nothing left, not the full list
+		self.assertEqual(remaining_stock_limits([remnants[1]], patterns), [])
+		self.assertIsNone(remaining_stock_limits(None, patterns))
+
+	@patch.object(optimization_job_service, "publish_progress")
+	@patch.object(decomposition_service, "repair_high_waste_bars", return_value=[])
+	@patch.object(decomposition_service, "_solve_cluster", return_value=([], {"status": "OPTIMAL"}, 0.0))
+	@patch.object(decomposition_service, "ProcessPoolExecutor", _InlineExecutor)
+	@patch.object(decomposition_service.os, "cpu_count", return_value=8)
+	def test_cluster_processes(self, cpu_count, solve_cluster, repair, publish):
+		lengths = [2400.0, 1800.0, 1200.0, 950.0, 600.0, 450.0, 300.0, 250.0]
+		keys = [(length, f"S{i}", "") for i, length in enumerate(lengths)]
+
+		def run(workers, stocks=None):
+			_executors.clear()
+			solve_laser_decomposed(
+				lengths, [1] * 8, keys, {}, 6000, 1, 10, 5, num_clusters=4,
+				solver_params={"workers": workers}, stocks=stocks,
+			)
+			return _executors[0]
+
+		# 2 workers per cluster: all 4 clusters fit on 8 cores
+		self.assertEqual(run(8).max_workers, 4)
+		# 4 workers per cluster: 2 processes at a time
+		self.assertEqual(run(16).max_workers, 2)
+
+		# Only the first cluster gets the last remnant bar, the others are left to the repair
+		remnant = {"item": None, "length_mm": 6000, "priority": 0, "max_qty": 1, "remnant": "REM-1"}
+		executor = run(8, [remnant])
+		self.assertEqual([kwargs["stocks"] for kwargs in executor.submitted], [[remnant]])
+
+	def test_merge_patterns(self):
+		patterns = [
+			_pattern({SHORT: 3, LONG: 2}, 2, 0),
+			_pattern({LONG: 2, SHORT: 3}, 1, 0),
+			_pattern({SHORT: 3, LONG: 2}, 4, 150, 6150),
+			_pattern({LONG: 3}, 1, 1490),
+			_pattern({SHORT: 2}, 1, 490, 2500, steel_remnant="REM-1"),
+		]
+		merged = merge_patterns(patterns)
+		self.assertEqual([(p["qty"], p["waste"]) for p in merged], [(3, 0), (4, 150), (1, 490), (1, 1490)])
+		# The input is left unchanged
+		self.assertEqual(patterns[0]["qty"], 2)
+
+
+@patch.object(optimization_job_service, "publish_progress")
+class TestRepairHighWasteBars(FrappeTestCase):
+	lengths = [1000.0, 1500.0]
+	keys = [SHORT, LONG]
+	names = {SHORT: "A", LONG: "B"}
+
+	def repair(self, patterns, demands):
+		return repair_high_waste_bars(patterns, self.lengths, demands, self.keys, self.names, 6000, 1, 10, 5)
+
+	def test_keeps_better_repair(self, publish):
+		patterns = [_pattern({SHORT: 6}, 1, 10), _pattern({LONG: 2}, 2, 3000)]
+		repair = [_pattern({LONG: 4}, 1, 10)]
+		with patch.object(cutting_optimization_service, "solve_laser_cutting_stock", return_value=repair) as solve:
+			result = self.repair(patterns, [6, 4])
+
+		# Only the uncovered demand of the high-waste bars is solved again
+		self.assertEqual(solve.call_args.args[:3], ([1500.0], [4], [LONG]))
+		self.assertEqual(result, merge_patterns([patterns[0], *repair]))
+
+	def test_keeps_cluster_result_if_repair_is_worse(self, publish):
+		patterns = [_pattern({SHORT: 6}, 1, 10), _pattern({LONG: 2}, 2, 3000)]
+		repair = [_pattern({LONG: 1}, 4, 4490)]
+		with patch.object(cutting_optimization_service, "solve_laser_cutting_stock", return_value=repair):
+			self.assertEqual(self.repair(patterns, [6, 4]), merge_patterns(patterns))
+
+		with patch.object(
+			cutting_optimization_service, "solve_laser_cutting_stock", side_effect=ValueError("no_solution:x")
+		):
+			self.assertEqual(self.repair(patterns, [6, 4]), merge_patterns(patterns))
+
+	def test_required_repair_raises(self, publish):
+		# The cluster of the long segment found no solution
+		patterns = [_pattern({SHORT: 6}, 1, 10)]
+		with patch.object(
+			cutting_optimization_service, "solve_laser_cutting_stock", side_effect=ValueError("no_solution:x")
+		) as solve:
+			with self.assertRaises(ValueError):
+				self.repair(patterns, [6, 4])
+		self.assertEqual(solve.call_args.args[:3], ([1500.0], [4], [LONG]))
+
+	def test_no_stock_left_for_repair(self, publish):
+		remnant = {"item": None, "length_mm": 6000, "priority": 0, "max_qty": 1, "remnant": "REM-1"}
+		patterns = [_pattern({SHORT: 6}, 1, 10, steel_remnant="REM-1"), _pattern({LONG: 2}, 2, 3000)]
+		with patch.object(cutting_optimization_service, "solve_laser_cutting_stock") as solve:
+			self.assertEqual(
+				repair_high_waste_bars(
+					patterns, self.lengths, [6, 4], self.keys, self.names, 6000, 1, 10, 5, stocks=[remnant]
+				),
+				merge_patterns(patterns),
+			)
+			# The uncovered cluster cannot be cut from anything
+			with self.assertRaises(ValueError):
+				repair_high_waste_bars(
+					patterns[:1], self.lengths, [6, 4], self.keys, self.names, 6000, 1, 10, 5, stocks=[remnant]
+				)
+		solve.assert_not_called()
+
+	def test_nothing_to_repair(self, publish):
+		patterns = [_pattern({SHORT: 6}, 1, 10), _pattern({LONG: 4}, 1, 10)]
+		with patch.object(cutting_optimization_service, "solve_laser_cutting_stock") as solve:
+			self.assertEqual(self.repair(patterns, [6, 4]), merge_patterns(patterns))
+		solve.assert_not_called()
@@ -0,0 +1,217 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import json
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services import cutting_optimization_service, optimization_job_service
+from cat_sat.services.optimization_job_service import (
+	DONE_EVENT,
+	OPTIMIZATION_QUEUE,
+	PLAN_DONE_EVENT,
+	PLAN_PROGRESS_EVENT,
+	PROGRESS_EVENT,
+	_finish_plan_order,
+	cp_model,
+	enqueue_optimization,
+	enqueue_plan_optimization,
+	get_progress_target,
+	publish_done,
+	run_optimization_job,
+	set_progress_target,
+)
+
+
+def _events(publish, event):
+	return [c for c in publish.call_args_list if c.args[0] == event]
+
+
+class FakeCache:
+	"""Plan batch hash and counter like RedisWrapper, which returns bytes field names from hgetall"""
+
+	def __init__(self):
+		self.hashes = {}
+		self.counters = {}
+
+	def make_key(self, key):
+		return key
+
+	def hset(self, name, key, value):
+		self.hashes.setdefault(name, {})[key] = value
+
+	def hget(self, name, key):
+		return self.hashes.get(name, {}).get(key)
+
+	def hgetall(self, name):
+		return {key.encode(): value for key, value in self.hashes.get(name, {}).items()}
+
+	def incrby(self, key, amount):
+		self.counters[key] = self.counters.get(key, 0) + amount
+		return self.counters[key]
+
+	def expire(self, key, ttl):
+		pass
+
+
+@patch.object(optimization_job_service.frappe, "publish_realtime")
+class TestOptimizationJobService(FrappeTestCase):
+	def tearDown(self):
+		set_progress_target(None)
+
+	def test_enqueue_optimization(self, publish):
+		order = MagicMock(docstatus=0)
+		with patch.object(optimization_job_service.frappe, "get_doc", return_value=order), patch.object(
+			optimization_job_service.frappe, "enqueue", return_value=MagicMock(id="job-1")
+		) as enqueue:
+			result = enqueue_optimization("CO-1")
+
+		self.assertEqual(result, {"queued": True, "job_id": "job-1", "key": "CO-1"})
+		order.check_permission.assert_called_once_with("write")
+		kwargs = enqueue.call_args.kwargs
+		self.assertEqual(kwargs["queue"], OPTIMIZATION_QUEUE)
+		self.assertEqual(kwargs["job_id"], "cutting_optimization::CO-1")
+		self.assertTrue(kwargs["deduplicate"])
+
+	def test_enqueue_rejects_running_and_submitted(self, publish):
+		with patch.object(
+			optimization_job_service.frappe, "get_doc", return_value=MagicMock(docstatus=0)
+		), patch.object(optimization_job_service.frappe, "enqueue", return_value=None):
+			# Deduplicated: the order is already on the queue
+			with self.assertRaises(frappe.ValidationError):
+				enqueue_optimization("CO-1")
+
+		with patch.object(
+			optimization_job_service.frappe, "get_doc", return_value=MagicMock(docstatus=1)
+		), patch.object(optimization_job_service.frappe, "enqueue") as enqueue:
+			with self.assertRaises(frappe.ValidationError):
+				enqueue_optimization("CO-1")
+		enqueue.assert_not_called()
+
+	def test_run_optimization_job(self, publish):
+		result = {"success": True, "patterns_count": 3}
+		with patch.object(cutting_optimization_service, "run_optimization", return_value=result):
+			self.assertEqual(run_optimization_job("CO-1", "user@example.com"), result)
+
+		done = _events(publish, DONE_EVENT)
+		self.assertEqual(len(done), 1)
+		self.assertEqual(done[0].args[1], {"key": "CO-1", "success": True, "result": result})
+		self.assertEqual(done[0].kwargs["user"], "user@example.com")
+		# A successful result waits for the job's commit
+		self.assertTrue(done[0].kwargs["after_commit"])
+		self.assertIsNone(get_progress_target())
+
+	def test_run_optimization_job_error(self, publish):
+		with patch.object(
+			cutting_optimization_service, "run_optimization", side_effect=ValueError("no_solution:x")
+		), patch.object(optimization_job_service.frappe.db, "rollback") as rollback:
+			with self.assertRaises(ValueError):
+				run_optimization_job("CO-1", "user@example.com")
+
+		rollback.assert_called_once()
+		done = _events(publish, DONE_EVENT)
+		self.assertEqual(done[0].args[1], {"key": "CO-1", "success": False, "error": "no_solution:x"})
+		self.assertFalse(done[0].kwargs["after_commit"])
+		self.assertIsNone(get_progress_target())
+
+	def test_publish_done_without_target(self, publish):
+		publish_done({"success": True})
+		publish.assert_not_called()
+
+	@unittest.skipIf(cp_model is None, "ortools is not installed")
+	def test_progress_callback_rate_limit(self, publish):
+		callback_class = optimization_job_service.SolverProgressCallback
+		set_progress_target("CO-1", "user@example.com")
+		clock = MagicMock()
+		with patch.object(callback_class, "ObjectiveValue", return_value=2000), patch.object(
+			callback_class, "BestObjectiveBound", return_value=1000
+		), patch.object(callback_class, "WallTime", return_value=1.23), patch.object(
+			optimization_job_service.time, "monotonic", clock
+		):
+			callback = callback_class("laser_waste", scale=10)
+			for now in (100.0, 100.4, 100.9, 101.2):
+				clock.return_value = now
+				callback.on_solution_callback()
+
+		progress = _events(publish, PROGRESS_EVENT)
+		# 100.4 and 100.9 are within PROGRESS_INTERVAL of the last event
+		self.assertEqual(len(progress), 2)
+		self.assertEqual(
+			progress[0].args[1],
+			{
+				"key": "CO-1",
+				"stage": "laser_waste",
+				"message": None,
+				"retry": 0,
+				"objective": 200,
+				"bound": 100,
+				"elapsed": 1.2,
+			},
+		)
+
+
+@patch.object(optimization_job_service.frappe, "publish_realtime")
+class TestPlanOptimization(FrappeTestCase):
+	def setUp(self):
+		self.cache = FakeCache()
+		patch.object(optimization_job_service.frappe, "cache", return_value=self.cache).start()
+		self.addCleanup(patch.stopall)
+
+	def start_batch(self, orders):
+		self.cache.hset(optimization_job_service._BATCH_KEY.format("b1"), "__meta__", {
+			"plan": "CP-0001",
+			"orders": orders,
+			"started": time.time() - 10,
+			"user": "test@example.com",
+		})
+
+	def test_last_order_publishes_summary(self, publish):
+		self.start_batch(["CO-1", "CO-2"])
+
+		_finish_plan_order("b1", "CO-1", {"success": True, "elapsed": 6.0, "remnant_kg": 1.5})
+		self.assertEqual(_events(publish, PLAN_PROGRESS_EVENT)[0].args[1]["finished"], 1)
+		self.assertFalse(_events(publish, PLAN_DONE_EVENT))
+
+		_finish_plan_order("b1", "CO-2", {"success": False, "elapsed": 4.0, "error": "x"})
+		self.assertEqual(
+			[(c.args[1]["finished"], c.args[1]["total"]) for c in _events(publish, PLAN_PROGRESS_EVENT)],
+			[(1, 2), (2, 2)],
+		)
+
+		done = _events(publish, PLAN_DONE_EVENT)
+		self.assertEqual(len(done), 1)
+		summary = done[0].args[1]
+		self.assertEqual(set(summary["results"]), {"CO-1", "CO-2"})
+		self.assertEqual(summary["sum_time"], 10.0)
+		self.assertEqual(summary["remnant_kg"], 1.5)
+		# Published as JSON: no bytes keys
+		json.dumps(summary)
+
+	def test_deduplicated_order_finishes_at_once(self, publish):
+		jobs = {"CO-1": MagicMock(id="job-1"), "CO-2": None}
+		with patch.object(
+			optimization_job_service.frappe, "get_doc", return_value=MagicMock()
+		), patch.object(
+			optimization_job_service.frappe, "get_all", return_value=["CO-1", "CO-2"]
+		), patch.object(
+			optimization_job_service.frappe, "generate_hash", return_value="b1"
+		), patch.object(
+			optimization_job_service.frappe, "enqueue", side_effect=lambda *a, **kw: jobs[kw["order_name"]]
+		):
+			result = enqueue_plan_optimization("CP-0001")
+
+		self.assertEqual((result["queued"], result["skipped"]), (["CO-1"], ["CO-2"]))
+		# The order already running elsewhere counts as finished, the batch waits for CO-1
+		progress = _events(publish, PLAN_PROGRESS_EVENT)
+		self.assertEqual([(c.args[1]["order"], c.args[1]["success"]) for c in progress], [("CO-2", False)])
+		self.assertFalse(_events(publish, PLAN_DONE_EVENT))
+
+		_finish_plan_order("b1", "CO-1", {"success": True, "elapsed": 5.0})
+		summary = _events(publish, PLAN_DONE_EVENT)[0].args[1]
+		self.assertEqual(summary["results"]["CO-2"]["elapsed"], 0)
+		self.assertTrue(summary["results"]["CO-1"]["success"])
+		self.assertEqual(summary["sum_time"], 5.0)
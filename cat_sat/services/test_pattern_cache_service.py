@@ -0,0 +1,255 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services import pattern_cache_service, pattern_generation_service
+from cat_sat.services.cutting_optimization_service import get_cache_path, get_or_calculate_patterns
+from cat_sat.services.pattern_cache_service import (
+	PATTERN_STORE_MAGIC,
+	enforce_cache_size_limit,
+	get_family_index,
+	load_pattern_store,
+	np,
+	patterns_from_arrays,
+	prune_pattern_cache,
+	read_pattern_header,
+	read_pattern_store,
+	save_pattern_store,
+	write_pattern_store,
+)
+from cat_sat.services.pattern_generation_service import generate_patterns_dp
+
+STOCK_LENGTH = 6000
+BLADE_WIDTH = 1
+TRIM = 10
+MAX_WASTE_PCT = 0.015
+
+
+def _as_set(patterns):
+	return {(round(obj, 3), tuple(sol)) for obj, sol in patterns}
+
+
+def _cache_path(piece_lengths):
+	return get_cache_path(STOCK_LENGTH, piece_lengths, BLADE_WIDTH, MAX_WASTE_PCT, TRIM)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPatternCacheService(FrappeTestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		patch.object(pattern_cache_service, "get_cache_folder", return_value=self.folder).start()
+		self.clear_memory()
+		# Keep the Redis tier out so every lookup reaches this test's folder
+		patch.object(pattern_cache_service, "_fetch", return_value=None).start()
+		patch.object(pattern_cache_service, "_publish").start()
+		patch.object(pattern_cache_service, "enforce_cache_size_limit").start()
+		patch.object(pattern_cache_service, "record_cache_event").start()
+		# Family index generations as Redis would count them
+		self.generation = 0
+		patch.object(pattern_cache_service, "_index_generation", side_effect=lambda family: self.generation).start()
+		patch.object(pattern_cache_service, "_bump_generation", side_effect=self.bump_generation).start()
+		self.addCleanup(patch.stopall)
+
+	def tearDown(self):
+		self.clear_memory()
+		shutil.rmtree(self.folder, ignore_errors=True)
+
+	def clear_memory(self):
+		"""Start like a fresh worker process"""
+		pattern_cache_service._memory_cache.clear()
+		pattern_cache_service._memory_cache_bytes = 0
+		pattern_cache_service._family_indexes.clear()
+
+	def bump_generation(self, family):
+		self.generation += 1
+		return self.generation
+
+	def get_patterns(self, piece_lengths):
+		"""Patterns through the cache, and whether Phase 1 had to run"""
+		with patch.object(
+			pattern_generation_service, "generate_patterns_dp", wraps=generate_patterns_dp
+		) as generate:
+			patterns = get_or_calculate_patterns(
+				STOCK_LENGTH, piece_lengths, BLADE_WIDTH, MAX_WASTE_PCT, TRIM, method="Dynamic Programming"
+			)
+		return patterns, generate.called
+
+	def assert_fresh(self, patterns, piece_lengths):
+		expected = generate_patterns_dp(STOCK_LENGTH, piece_lengths, BLADE_WIDTH, MAX_WASTE_PCT, TRIM)
+		self.assertTrue(expected)
+		self.assertEqual(len(patterns), len(expected))
+		self.assertEqual(_as_set(patterns), _as_set(expected))
+
+	def test_round_trip(self):
+		patterns = [(5990.0, [2, 1]), (5850.5, [0, 4])]
+		path = os.path.join(self.folder, "patterns_test.bin")
+		write_pattern_store(path, patterns, {"stock_length": STOCK_LENGTH})
+
+		used, counts, header = read_pattern_store(path)
+		# Plain arrays read into memory: they outlive the file
+		os.remove(path)
+		self.assertIs(type(counts), np.ndarray)
+		self.assertEqual(counts.dtype, np.dtype("<i2"))
+		self.assertEqual(header["params"], {"stock_length": STOCK_LENGTH})
+		self.assertEqual(patterns_from_arrays(used, counts), patterns)
+
+	def test_cache_hit(self):
+		lengths = [1490, 1200, 985, 735]
+		patterns, generated = self.get_patterns(lengths)
+		self.assertTrue(generated)
+		self.assert_fresh(patterns, lengths)
+		# Cold process: the hit comes from the file
+		self.clear_memory()
+
+		patterns, generated = self.get_patterns(lengths)
+		self.assertFalse(generated)
+		self.assert_fresh(patterns, lengths)
+
+	def test_stale_version_discarded(self):
+		path = _cache_path([1850])
+		write_pattern_store(path, [(5560.0, [3])])
+		self.assertIsNotNone(read_pattern_store(path))
+
+		header = json.dumps({"version": pattern_cache_service.PATTERN_STORE_VERSION - 1}).encode()
+		with open(path, "wb") as f:
+			f.write(PATTERN_STORE_MAGIC + struct.pack("<I", len(header)) + header)
+		self.assertIsNone(read_pattern_header(path))
+		self.assertFalse(os.path.exists(path))
+
+	def test_corrupt_file_discarded(self):
+		path = _cache_path([1850])
+		write_pattern_store(path, [(5560.0, [3])])
+		with open(path, "r+b") as f:
+			f.truncate(os.path.getsize(path) - 4)
+		self.assertIsNone(read_pattern_store(path))
+		self.assertFalse(os.path.exists(path))
+
+		write_pattern_store(path, [(5560.0, [3])])
+		with open(path, "r+b") as f:
+			f.write(b"NOTASTORE")
+		self.assertIsNone(read_pattern_header(path))
+		self.assertFalse(os.path.exists(path))
+
+	def test_permuted_key_hit(self):
+		self.get_patterns([1490, 985, 735])
+		self.clear_memory()
+		permuted = [735, 1490, 985]
+		self.assertEqual(_cache_path(permuted), _cache_path([1490, 985, 735]))
+
+		patterns, generated = self.get_patterns(permuted)
+		self.assertFalse(generated)
+		self.assert_fresh(patterns, permuted)
+
+	def test_superset_projection(self):
+		self.get_patterns([1490, 1200, 985, 735])
+
+		subset = [735, 1490]
+		patterns, generated = self.get_patterns(subset)
+		self.assertFalse(generated)
+		self.assert_fresh(patterns, subset)
+		# Saved as the subset's own entry
+		self.assertIsNotNone(read_pattern_header(_cache_path(subset)))
+
+	def test_family_index(self):
+		superset = _cache_path([1490, 1200, 985, 735])
+		family = os.path.basename(superset).split("_")[1]
+		self.get_patterns([1490, 1200, 985, 735])
+		# The entry stays in memory, the index has to be built
+		pattern_cache_service._family_indexes.clear()
+
+		def header_reads(subsets):
+			with patch.object(
+				pattern_cache_service, "read_pattern_header", wraps=read_pattern_header
+			) as read:
+				for subset in subsets:
+					self.assertFalse(self.get_patterns(subset)[1])
+			return sum(1 for call in read.call_args_list if call.args[0] == superset)
+
+		# Headers are read once; this process's own writes join the index in place
+		self.assertEqual(header_reads([[735, 1490], [1200, 985]]), 1)
+		self.assertEqual(
+			set(get_family_index(family)),
+			{os.path.basename(_cache_path(s)) for s in ([1490, 1200, 985, 735], [735, 1490], [1200, 985])},
+		)
+
+		# Another process wrote to the family: rebuilt on the next lookup
+		self.generation += 1
+		self.assertEqual(header_reads([[1490, 985]]), 1)
+
+		# Pruned entries leave the index
+		os.utime(superset, (time.time() - 86400 * 10,) * 2)
+		prune_pattern_cache(max_size_mb=0, max_age_days=1)
+		with patch.object(pattern_cache_service, "read_pattern_header") as read:
+			self.assertNotIn(os.path.basename(superset), get_family_index(family))
+		read.assert_not_called()
+
+	def test_prune_least_recently_used(self):
+		paths = []
+		for n, length in enumerate([1850, 1420, 980]):
+			path = _cache_path([length])
+			write_pattern_store(path, [(float(length), [1])] * 2000)
+			# Oldest access first
+			os.utime(path, (time.time() - 3600 * (3 - n),) * 2)
+			paths.append(path)
+		size_mb = os.path.getsize(paths[0]) / 1024 / 1024
+
+		result = prune_pattern_cache(max_size_mb=size_mb * 2.5, max_age_days=0)
+		self.assertEqual(result["removed"], 1)
+		self.assertEqual([os.path.exists(p) for p in paths], [False, True, True])
+
+	def test_size_cap_after_write(self):
+		paths = []
+		for n, length in enumerate([1850, 1420, 980, 735]):
+			path = _cache_path([length])
+			write_pattern_store(path, [(float(length), [1])] * 2000)
+			os.utime(path, (time.time() - 3600 * (4 - n),) * 2)
+			paths.append(path)
+		size_mb = os.path.getsize(paths[0]) / 1024 / 1024
+
+		def check(max_size_mb):
+			settings = frappe._dict(pattern_cache_max_size_mb=max_size_mb)
+			with patch.object(pattern_cache_service.frappe, "get_single", return_value=settings):
+				enforce_cache_size_limit()
+			return [os.path.exists(p) for p in paths]
+
+		# Under the cap, or no cap: nothing goes
+		self.assertEqual(check(size_mb * 4.5), [True] * 4)
+		self.assertEqual(check(0), [True] * 4)
+		# Least recently used entries go until the folder fits
+		self.assertEqual(check(size_mb * 2.5), [False, False, True, True])
+		self.assertLessEqual(sum(os.path.getsize(p) for p in paths[2:]) / 1024 / 1024, size_mb * 2.5)
+
+	def test_memory_and_redis_tiers(self):
+		path = _cache_path([1850])
+		patterns = [(5560.0, [3]), (3710.0, [2])]
+		save_pattern_store(path, patterns)
+		image = pattern_cache_service._publish.call_args.args[1]
+
+		used, counts, _, tier = load_pattern_store(path)
+		self.assertEqual(tier, "memory")
+		self.assertEqual(patterns_from_arrays(used, counts), patterns)
+
+		# Another worker: nothing in its memory, the image comes from Redis
+		self.clear_memory()
+		with patch.object(pattern_cache_service, "_fetch", return_value=image):
+			used, counts, _, tier = load_pattern_store(path)
+		self.assertEqual(tier, "redis")
+		self.assertEqual(patterns_from_arrays(used, counts), patterns)
+		self.assertEqual(load_pattern_store(path)[3], "memory")
+
+		# Redis expired: the file
+		self.clear_memory()
+		used, counts, _, tier = load_pattern_store(path)
+		self.assertEqual(tier, "disk")
+		self.assertEqual(patterns_from_arrays(used, counts), patterns)
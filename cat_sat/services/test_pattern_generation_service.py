@@ -0,0 +1,89 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+import unittest
+
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.cutting_optimization_service import cp_model, find_efficient_cutting_patterns
+from cat_sat.services.pattern_generation_service import generate_patterns_dp, np, prune_dominated_patterns
+
+
+def _as_set(patterns):
+	return {(round(obj, 3), tuple(sol)) for obj, sol in patterns}
+
+
+@unittest.skipIf(cp_model is None, "ortools is not installed")
+class TestPatternGenerationService(FrappeTestCase):
+	def assert_parity(self, stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct=0):
+		expected = find_efficient_cutting_patterns(
+			stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct
+		)
+		actual = generate_patterns_dp(
+			stock_length, piece_lengths, blade_width, max_waste_pct, trim, max_distinct=max_distinct
+		)
+
+		self.assertEqual(len(actual), len(expected))
+		self.assertEqual(_as_set(actual), _as_set(expected))
+
+		# Same output contract: sorted by material used, highest first
+		used = [obj for obj, _ in actual]
+		self.assertEqual(used, sorted(used, reverse=True))
+
+	def test_long_segments(self):
+		self.assert_parity(6000, [1850, 1420, 1162.2, 980, 735], 1, 0.015, 10)
+
+	def test_medium_segments(self):
+		self.assert_parity(5850, [920, 870, 640, 515.5], 2.5, 0.015, 15)
+
+	def test_short_segments(self):
+		self.assert_parity(6000, [480, 410, 395, 260, 120], 1, 0.015, 10)
+
+	def test_duplicate_lengths(self):
+		# Same length, different machining: kept as separate columns
+		self.assert_parity(6000, [1200, 1200, 850, 497], 1, 0.015, 10)
+
+	def test_max_distinct(self):
+		lengths = [1850, 1420, 1162.2, 980, 735, 480]
+		self.assert_parity(6000, lengths, 2.5, 0.015, 15, max_distinct=2)
+
+		# Same set as enumerating everything and filtering afterwards
+		limited = generate_patterns_dp(6000, lengths, 2.5, 0.015, 15, max_distinct=3)
+		unlimited = generate_patterns_dp(6000, lengths, 2.5, 0.015, 15)
+		filtered = [(obj, sol) for obj, sol in unlimited if sum(1 for c in sol if c) <= 3]
+		self.assertEqual(_as_set(limited), _as_set(filtered))
+
+	def test_no_fit(self):
+		self.assertEqual(generate_patterns_dp(1000, [1200], 1, 0.015, 10), [])
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPruneDominatedPatterns(FrappeTestCase):
+	def test_duplicates_and_dominated(self):
+		patterns = [
+			(5990.0, [2, 1, 0]),
+			(4500.0, [2, 0, 0]),
+			(5990.0, [2, 1, 0]),
+			(5980.0, [0, 3, 1]),
+			(4000.0, [0, 2, 1]),
+			(3000.0, [1, 0, 1]),
+		]
+		pruned, duplicates, dominated = prune_dominated_patterns(patterns, max_surplus=1)
+		# [2, 0, 0] and [0, 2, 1] are one segment short of a kept pattern
+		self.assertEqual(pruned, [(5990.0, [2, 1, 0]), (5980.0, [0, 3, 1]), (3000.0, [1, 0, 1])])
+		self.assertEqual((duplicates, dominated), (1, 2))
+
+		# By default only the duplicate goes
+		pruned, duplicates, dominated = prune_dominated_patterns(patterns)
+		self.assertEqual(pruned, [patterns[j] for j in (0, 1, 3, 4, 5)])
+		self.assertEqual((duplicates, dominated), (1, 0))
+
+	def test_exact_cover_kept_without_surplus(self):
+		# Demand [1]: only the first pattern cuts it without surplus
+		patterns = [(2001.0, [1]), (4002.0, [2]), (5990.0, [3])]
+		self.assertEqual(prune_dominated_patterns(patterns, max_surplus=0), (patterns, 0, 0))
+		self.assertEqual(prune_dominated_patterns(patterns, max_surplus=2), ([(5990.0, [3])], 0, 2))
+
+	def test_nothing_to_prune(self):
+		patterns = [(5990.0, [2, 1]), (5980.0, [0, 3])]
+		self.assertEqual(prune_dominated_patterns(patterns), (patterns, 0, 0))
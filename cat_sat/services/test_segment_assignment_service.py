@@ -0,0 +1,76 @@
+# Copyright (c) 2026, IEA and Contributors
+# See license.txt
+
+from collections import defaultdict
+
+from frappe.tests.utils import FrappeTestCase
+
+from cat_sat.services.segment_assignment_service import assign_segment_keys, group_segments_by_length
+
+
+def _produced(patterns):
+	produced = defaultdict(int)
+	for pat in patterns:
+		for key, count in pat["pattern"].items():
+			produced[key] += count * pat["qty"]
+	return produced
+
+
+class TestSegmentAssignmentService(FrappeTestCase):
+	def setUp(self):
+		# Two machining variants of 1200mm and one 850mm segment
+		self.keys = [(1200.0, "A", "P1"), (850.0, "C", "P1"), (1200.0, "B", "P2")]
+		self.lengths = [1200.0, 850.0, 1200.0]
+		self.demands = [7, 5, 4]
+		self.grouped = group_segments_by_length(
+			self.lengths, self.demands, self.keys, {k: k[1] for k in self.keys}
+		)
+
+	def test_group_by_length(self):
+		self.assertEqual(self.grouped["piece_lengths"], [1200.0, 850.0])
+		self.assertEqual(self.grouped["demands"], [11, 5])
+		self.assertEqual(self.grouped["groups"], [[0, 2], [1]])
+		self.assertEqual(self.grouped["piece_names"][(1200.0, "1200.0mm", "")], "A / B")
+
+	def test_assign_covers_demand(self):
+		long_key, short_key = self.grouped["segment_keys"]
+		patterns = [
+			{"pattern": {long_key: 4}, "qty": 3, "waste": 1190},
+			{"pattern": {short_key: 5}, "qty": 1, "waste": 1740},
+		]
+		result = assign_segment_keys(patterns, self.grouped, self.keys, self.demands)
+
+		produced = _produced(result)
+		self.assertEqual(produced[self.keys[1]], 5)
+		# 12 pieces of 1200mm for a demand of 7 + 4: the surplus goes to the first key
+		self.assertEqual(produced[self.keys[0]], 8)
+		self.assertEqual(produced[self.keys[2]], 4)
+		self.assertEqual(sum(p["qty"] for p in result), 4)
+
+	def test_whole_bundles(self):
+		demands = [14, 0, 14]
+		grouped = group_segments_by_length(self.lengths, demands, self.keys, {})
+		long_key = grouped["segment_keys"][0]
+		patterns = [{"pattern": {long_key: 2}, "qty": 14, "factor": 14, "bundles": 1, "waste": 3590}]
+		result = assign_segment_keys(patterns, grouped, self.keys, demands)
+
+		# Each slot of the bundle goes to one key
+		self.assertEqual(len(result), 1)
+		self.assertEqual(result[0]["pattern"], {self.keys[0]: 1, self.keys[2]: 1})
+		self.assertEqual((result[0]["qty"], result[0]["bundles"]), (14, 1))
+		self.assertNotIn("shared_bundle", result[0])
+
+	def test_shared_bundle(self):
+		demands = [21, 0, 7]
+		grouped = group_segments_by_length(self.lengths, demands, self.keys, {})
+		long_key = grouped["segment_keys"][0]
+		patterns = [{"pattern": {long_key: 1}, "qty": 28, "factor": 14, "bundles": 2, "waste": 4790}]
+		result = assign_segment_keys(patterns, grouped, self.keys, demands)
+
+		# The first bundle is all A; the second serves both keys and is cut as one bundle
+		self.assertEqual([(p["qty"], p.get("bundles")) for p in result], [(14, 1), (7, None), (7, None)])
+		self.assertNotIn("shared_bundle", result[0])
+		self.assertEqual([p["shared_bundle"] for p in result[1:]], [1, 1])
+		self.assertTrue(all(p["factor"] == 14 for p in result))
+		produced = _produced(result)
+		self.assertEqual((produced[self.keys[0]], produced[self.keys[2]]), (21, 7))